@@ -0,0 +1,155 @@
+"""
+Benchmarks del pipeline completo sobre exports sintéticos (ver synthetic.py).
+
+Mide cada etapa por separado (agrupado, sesiones, cada scorer, cruce con
+Neotel) y de punta a punta (process_data y export a Excel) a distintas
+escalas. Cada medición es el mejor tiempo de `--repeat` corridas, con el
+recolector de basura desactivado mientras se mide (como timeit).
+
+Ejemplos:
+    python benchmark.py                          # 1k, 10k y 100k chats
+    python benchmark.py --scales 1000 --repeat 5
+    python benchmark.py --scales 10000 --only process_data --only export_excel
+    python benchmark.py --scales 10000 --json resultados.json
+"""
+import argparse
+import gc
+import io
+import json
+import sys
+import time
+
+from logic import (
+    NeotelIndex, group_and_sort, split_into_sessions, scan_user_text, check_spam,
+    calculate_motivation_score, calculate_payment_score, calculate_behavior_score,
+    analyze_conversation, match_neotel_data, match_neotel_bulk, process_data, RULES,
+)
+from export import write_excel
+from synthetic import generate_export, generate_neotel
+
+# Escalas por defecto (cantidad de chats)
+BENCHMARK_SCALES = [1_000, 10_000, 100_000]
+
+
+def _copy_export(export):
+    # process_data y group_and_sort anotan los mensajes (epoch parseado): cada corrida usa una copia
+    return {**export, 'items': [dict(item) for item in export['items']]}
+
+
+def _scoring_inputs(chats):
+    """(mensajes de la sesión activa, mensajes del usuario) de cada chat."""
+    inputs = []
+    for messages in chats.values():
+        sessions, _ = split_into_sessions(messages)
+        session = sessions[-1] if sessions else messages
+        inputs.append((session, [m for m in session if m.get('from') == 'user']))
+    return inputs
+
+
+def benchmark_cases(export, neotel_df):
+    """
+    Lista de (nombre, preparación, función) a medir. `preparación()` arma la
+    entrada fuera del tiempo medido y `función(entrada)` es lo que se mide.
+    """
+    chats = group_and_sort(_copy_export(export)['items'])
+    scoring = _scoring_inputs(chats)
+    with_user = [(session, users) for session, users in scoring if users]
+    neotel = NeotelIndex(neotel_df)
+    phones = [messages[0]['chat']['contactId'] for messages in chats.values()]
+    dates = [messages[0]['creationTime'] for messages in chats.values()]
+    rows = process_data(_copy_export(export), neotel)
+
+    return [
+        ('group_and_sort', lambda: _copy_export(export)['items'], group_and_sort),
+        ('split_into_sessions', lambda: chats,
+         lambda chats: [split_into_sessions(messages) for messages in chats.values()]),
+        ('scan_user_text', lambda: with_user,
+         lambda inputs: [scan_user_text(users) for _, users in inputs]),
+        ('check_spam', lambda: with_user,
+         lambda inputs: [check_spam(session, users) for session, users in inputs]),
+        ('calculate_motivation_score', lambda: with_user,
+         lambda inputs: [calculate_motivation_score(session, users) for session, users in inputs]),
+        ('calculate_payment_score', lambda: with_user,
+         lambda inputs: [calculate_payment_score(session, users) for session, users in inputs]),
+        ('calculate_behavior_score', lambda: scoring,
+         lambda inputs: [calculate_behavior_score(session, users) for session, users in inputs]),
+        ('analyze_conversation', lambda: chats,
+         lambda chats: [analyze_conversation(chat_id, messages) for chat_id, messages in chats.items()]),
+        ('neotel_index', lambda: neotel_df, NeotelIndex),
+        ('match_neotel_data', lambda: neotel,
+         lambda neotel: [match_neotel_data(phone, date, neotel) for phone, date in zip(phones, dates)]),
+        ('match_neotel_bulk', lambda: neotel, lambda neotel: match_neotel_bulk(phones, dates, neotel)),
+        ('process_data', lambda: _copy_export(export), lambda data: process_data(data, neotel_df)),
+        ('export_excel', lambda: rows, lambda rows: write_excel(rows, io.BytesIO())),
+    ]
+
+
+def run_benchmarks(n_chats, repeat=1, only=None, seed=0, report=None):
+    """
+    Genera un export de `n_chats` chats (y su base Neotel) con `seed` y mide
+    cada caso de benchmark_cases. Retorna una lista de dicts
+    {'scale', 'name', 'seconds', 'chats_per_second'}; `report(resultado)`
+    se llama a medida que termina cada caso.
+    """
+    export = generate_export(n_chats, seed=seed)
+    neotel_df = generate_neotel(export, seed=seed)
+    results = []
+    for name, prepare, func in benchmark_cases(export, neotel_df):
+        if only and name not in only:
+            continue
+        best = None
+        for _ in range(repeat):
+            data = prepare()
+            # Como timeit: sin el recolector de basura durante la medición
+            gc.collect()
+            gc.disable()
+            try:
+                start = time.perf_counter()
+                func(data)
+                elapsed = time.perf_counter() - start
+            finally:
+                gc.enable()
+            best = elapsed if best is None else min(best, elapsed)
+        result = {
+            'scale': n_chats,
+            'name': name,
+            'seconds': round(best, 6),
+            'chats_per_second': round(n_chats / best) if best > 0 else None,
+        }
+        results.append(result)
+        if report is not None:
+            report(result)
+    return results
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks del pipeline de clasificación sobre datos sintéticos.")
+    parser.add_argument('--scales', type=int, nargs='+', default=BENCHMARK_SCALES, help="Cantidades de chats a medir.")
+    parser.add_argument('--repeat', type=int, default=1, help="Corridas por caso (se reporta la mejor).")
+    parser.add_argument('--only', action='append', metavar='CASO', help="Mide solo ese caso (se puede repetir).")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', metavar='ARCHIVO', help="Guarda los resultados en JSON para comparar corridas.")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    print(f"Reglas: versión {RULES.version} ({RULES.digest})", file=sys.stderr)
+
+    def report(result):
+        print(f"{result['scale']:>8} {result['name']:<28} {result['seconds']:>10.3f} s"
+              f" {result['chats_per_second'] or 0:>12,} chats/s")
+
+    print(f"{'chats':>8} {'caso':<28} {'tiempo':>12} {'throughput':>19}")
+    results = []
+    for n_chats in args.scales:
+        results.extend(run_benchmarks(n_chats, args.repeat, args.only, args.seed, report))
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'ruleset': RULES.digest, 'seed': args.seed, 'results': results}, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,196 @@
+"""
+Clasificación de leads por línea de comandos (sin Streamlit).
+
+Ejemplos:
+    python cli.py exports/ --neotel base.xlsx -o leads.csv
+    python cli.py "exports/**/*.json" --format ndjson -o - > leads.ndjson
+    python cli.py exports/ --per-file -o resultados/ --format xlsx --jobs 4
+    python cli.py exports/ --only 593997090163 --only WAKSYFF2GVNTULGLG0AF -f csv
+    python cli.py export_hoy.json --state estado.sqlite -o leads.csv
+    python cli.py exports/ --analysis-cache cache.sqlite -o leads.parquet
+    python cli.py exports/ --ruleset reglas_prueba.json -o leads.csv
+"""
+import argparse
+import glob
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import logic
+from logic import process_file, load_neotel_base, load_ruleset, set_ruleset, ChatStateStore, AnalysisCache, NEOTEL_CACHE_DIR
+from export import export_rows, EXPORT_FORMATS
+
+# Base Neotel, estado de chats y caché de cada proceso worker (se reciben una sola vez en el initializer)
+_worker_neotel = None
+_worker_state = None
+_worker_cache = None
+
+
+def expand_inputs(patterns):
+    """Archivos JSON a procesar: acepta archivos, directorios y globs, sin repetir."""
+    paths = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            matches = sorted(glob.glob(os.path.join(pattern, '*.json')))
+        elif glob.has_magic(pattern):
+            matches = sorted(glob.glob(pattern, recursive=True))
+        else:
+            matches = [pattern]
+        for path in matches:
+            if path not in paths:
+                paths.append(path)
+    return paths
+
+
+def _init_worker(neotel, state_path=None, cache_path=None, ruleset_config=None):
+    global _worker_neotel, _worker_state, _worker_cache
+    if ruleset_config is not None:
+        set_ruleset(ruleset_config)
+    _worker_neotel = neotel
+    _worker_state = ChatStateStore(state_path) if state_path else None
+    _worker_cache = AnalysisCache(cache_path) if cache_path else None
+
+
+def _classify(path, targets=None):
+    return process_file(path, _worker_neotel, targets=targets, state=_worker_state, cache=_worker_cache)
+
+
+def _classify_to_file(path, output_dir, fmt, targets=None):
+    rows = process_file(path, _worker_neotel, targets=targets, state=_worker_state, cache=_worker_cache)
+    output_path = per_file_output(path, output_dir, fmt)
+    # Sin chats que coincidan con --only igual se escribe el export (vacío)
+    try:
+        with open(output_path, 'wb') as f:
+            export_rows(rows, f, fmt)
+    except Exception:
+        # No dejar un archivo a medio escribir que parezca un resultado válido
+        os.remove(output_path)
+        raise
+    return len(rows)
+
+
+def per_file_output(path, output_dir, fmt):
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(output_dir, f"{stem}_clasificado{EXPORT_FORMATS[fmt].extension}")
+
+
+def infer_format(output):
+    """Formato según la extensión del archivo de salida (NDJSON para stdout)."""
+    for name, export_format in EXPORT_FORMATS.items():
+        if output.lower().endswith(export_format.extension):
+            return name
+    return 'ndjson'
+
+
+def run_files(paths, task, neotel, state_path, cache_path, jobs, *args):
+    """
+    Ejecuta `task(path, *args)` sobre cada archivo, en `jobs` procesos.
+    Genera (path, resultado, error) en el orden de `paths`.
+    """
+    if jobs <= 1 or len(paths) <= 1:
+        _init_worker(neotel, state_path, cache_path)
+        for path in paths:
+            try:
+                yield path, task(path, *args), None
+            except Exception as e:
+                yield path, None, e
+        return
+
+    initargs = (neotel, state_path, cache_path, logic.RULES.config)
+    with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker, initargs=initargs) as pool:
+        futures = [(path, pool.submit(task, path, *args)) for path in paths]
+        for path, future in futures:
+            try:
+                yield path, future.result(), None
+            except Exception as e:
+                yield path, None, e
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Clasifica leads (No Contactado / MQL / SQL) a partir de exports JSON de chats."
+    )
+    parser.add_argument('inputs', nargs='+', help="Archivos, directorios o globs de exports JSON.")
+    parser.add_argument('-o', '--output', default='-',
+                        help="Archivo de salida ('-' = stdout), o directorio con --per-file.")
+    parser.add_argument('-f', '--format', choices=sorted(EXPORT_FORMATS),
+                        help="Formato de salida (por defecto, según la extensión de --output).")
+    parser.add_argument('--per-file', action='store_true',
+                        help="Un archivo de salida por export, dentro del directorio --output.")
+    parser.add_argument('--only', action='append', metavar='ID_O_TELEFONO',
+                        help="Clasifica solo ese chat ID o teléfono (se puede repetir).")
+    parser.add_argument('--ruleset', metavar='JSON',
+                        help="Archivo de reglas de scoring (por defecto, ruleset.json junto a logic.py).")
+    parser.add_argument('--neotel', help="Base Neotel (.xls / .xlsx) para enriquecer con UTM.")
+    parser.add_argument('--neotel-on-disk', action='store_true',
+                        help="Importa la base Neotel a SQLite en lugar de cargarla en memoria.")
+    parser.add_argument('--cache-dir', default=NEOTEL_CACHE_DIR, help="Directorio de caché de la base Neotel.")
+    parser.add_argument('--state', metavar='SQLITE',
+                        help="Estado por chat de corridas anteriores: solo se reclasifican los chats nuevos o modificados.")
+    parser.add_argument('--analysis-cache', metavar='SQLITE',
+                        help="Caché de resultados por contenido: no se reanalizan conversaciones idénticas.")
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1,
+                        help="Archivos procesados en paralelo (por defecto, uno por CPU).")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    paths = expand_inputs(args.inputs)
+    if not paths:
+        print("No se encontraron exports para procesar.", file=sys.stderr)
+        return 2
+    fmt = args.format or infer_format(args.output)
+
+    if args.ruleset:
+        try:
+            rules = load_ruleset(args.ruleset)
+        except ValueError as e:
+            print(e, file=sys.stderr)
+            return 2
+        print(f"Reglas: {args.ruleset} (versión {rules.version}).", file=sys.stderr)
+
+    neotel = None
+    if args.neotel:
+        neotel = load_neotel_base(args.neotel, args.neotel_on_disk, args.cache_dir)
+        print(f"Base Neotel: {neotel.source_rows} registros.", file=sys.stderr)
+
+    failed = 0
+    total = 0
+    if args.per_file:
+        if args.output == '-':
+            print("--per-file necesita un directorio en --output.", file=sys.stderr)
+            return 2
+        os.makedirs(args.output, exist_ok=True)
+        for path, count, error in run_files(paths, _classify_to_file, neotel, args.state, args.analysis_cache, args.jobs, args.output, fmt, args.only):
+            if error is not None:
+                failed += 1
+                print(f"ERROR {path}: {error}", file=sys.stderr)
+            else:
+                total += count
+                print(f"{path}: {count} leads -> {per_file_output(path, args.output, fmt)}", file=sys.stderr)
+    else:
+        def rows():
+            nonlocal failed, total
+            for path, file_rows, error in run_files(paths, _classify, neotel, args.state, args.analysis_cache, args.jobs, args.only):
+                if error is not None:
+                    failed += 1
+                    print(f"ERROR {path}: {error}", file=sys.stderr)
+                    continue
+                total += len(file_rows)
+                print(f"{path}: {len(file_rows)} leads", file=sys.stderr)
+                yield from file_rows
+
+        if args.output == '-':
+            export_rows(rows(), sys.stdout.buffer, fmt)
+            sys.stdout.buffer.flush()
+        else:
+            with open(args.output, 'wb') as f:
+                export_rows(rows(), f, fmt)
+
+    print(f"Total: {total} leads de {len(paths) - failed} archivos ({failed} con error).", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
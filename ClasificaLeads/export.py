@@ -0,0 +1,360 @@
+import io
+import csv
+import json
+import tempfile
+import importlib.util
+from collections import namedtuple
+from datetime import date, datetime, time, timedelta
+from itertools import islice
+import pandas as pd
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font, PatternFill, Alignment, Border, Side, NamedStyle
+from openpyxl.styles.fonts import DEFAULT_FONT
+from openpyxl.utils import get_column_letter
+
+# ============================================================================
+# MÉTRICAS DEL RESUMEN
+# ============================================================================
+
+def summary_metrics(df):
+    """Métricas del resumen (pantalla y hoja Resumen del Excel)."""
+    if 'clasificacion' not in df.columns:
+        # Sin leads (DataFrame sin columnas): todo en cero
+        return {'total_leads': len(df), 'spam_leads': 0, 'sql_leads': 0, 'mql_leads': 0, 'avg_score': 0}
+    non_spam_df = df[df['clasificacion'] != 'No Contactado']
+    return {
+        'total_leads': len(df),
+        'spam_leads': len(df[df['clasificacion'] == 'No Contactado']),
+        'sql_leads': len(df[df['clasificacion'] == 'SQL']),
+        'mql_leads': len(df[df['clasificacion'] == 'MQL']),
+        # Calculate average score for non-No Contactado leads
+        'avg_score': non_spam_df['score_total'].mean() if len(non_spam_df) > 0 else 0,
+    }
+
+
+# ============================================================================
+# EXPORT A EXCEL
+# ============================================================================
+
+# Ancho máximo de columna en la hoja Leads
+MAX_COLUMN_WIDTH = 50
+
+_THIN_SIDE = Side(style='thin', color='CCCCCC')
+_THIN_BORDER = Border(left=_THIN_SIDE, right=_THIN_SIDE, top=_THIN_SIDE, bottom=_THIN_SIDE)
+
+
+def _solid_fill(color):
+    return PatternFill(start_color=color, end_color=color, fill_type="solid")
+
+
+# Colores de fila por clasificación
+CLASSIFICATION_FILLS = {
+    'SQL': _solid_fill("A8E6CF"),            # Green
+    'MQL': _solid_fill("FFE066"),            # Yellow
+    'No Contactado': _solid_fill("FF6B6B"),  # Red
+}
+
+SUMMARY_FILLS = {
+    'Total Leads': _solid_fill("E8E8E8"),
+    'No Contactado': CLASSIFICATION_FILLS['No Contactado'],
+    'MQL': CLASSIFICATION_FILLS['MQL'],
+    'SQL': CLASSIFICATION_FILLS['SQL'],
+    'Score Promedio': _solid_fill("B8D4E3"),
+}
+
+
+def _named_styles():
+    """
+    Estilos compartidos del export: cada celda referencia uno de estos en
+    lugar de recibir su propio Font / Fill / Alignment / Border.
+    """
+    styles = [
+        NamedStyle(
+            name='leads_header',
+            font=Font(bold=True, color="FFFFFF", size=11),
+            fill=_solid_fill("2E86AB"),
+            alignment=Alignment(horizontal="center", vertical="center", wrap_text=True),
+            border=_THIN_BORDER,
+        ),
+        NamedStyle(name='leads_cell', font=DEFAULT_FONT, alignment=Alignment(vertical="center"), border=_THIN_BORDER),
+    ]
+    for clasificacion, fill in CLASSIFICATION_FILLS.items():
+        styles.append(NamedStyle(
+            name=f'leads_{clasificacion}', font=DEFAULT_FONT, fill=fill,
+            alignment=Alignment(vertical="center"), border=_THIN_BORDER,
+        ))
+    styles.append(NamedStyle(
+        name='summary_cell', font=DEFAULT_FONT, alignment=Alignment(horizontal="center", vertical="center"), border=_THIN_BORDER,
+    ))
+    for metric, fill in SUMMARY_FILLS.items():
+        styles.append(NamedStyle(
+            name=f'summary_{metric}', font=DEFAULT_FONT, fill=fill,
+            alignment=Alignment(horizontal="center", vertical="center"), border=_THIN_BORDER,
+        ))
+    return styles
+
+
+def _excel_value(value):
+    """Valor tal como lo escribe DataFrame.to_excel (listas como texto, vacíos como celda vacía)."""
+    if value is None:
+        return None
+    if isinstance(value, (bool, int, str, datetime, date, time, timedelta)):
+        return value
+    if isinstance(value, float):
+        return None if value != value else value
+    if pd.api.types.is_scalar(value) and pd.isna(value):
+        return None
+    return str(value)
+
+
+def excel_column_widths(df):
+    """
+    Ancho de cada columna: el texto más largo entre el encabezado y las celdas
+    no vacías (0 y '' no cuentan) + 2, con tope MAX_COLUMN_WIDTH.
+    """
+    widths = []
+    for name in df.columns:
+        values = df[name]
+        if pd.api.types.is_numeric_dtype(values) and not pd.api.types.is_bool_dtype(values):
+            filled = values[values.notna() & (values != 0)]
+        else:
+            values = values.astype(object)
+            filled = values[values.notna()]
+            filled = filled[filled.astype(bool)]
+        lengths = filled.astype(str).str.len()
+        longest = max(len(str(name)), int(lengths.max()) if len(lengths) else 0)
+        widths.append(min(longest + 2, MAX_COLUMN_WIDTH))
+    return widths
+
+
+def _styled_row(ws, values, style):
+    row = []
+    for value in values:
+        cell = WriteOnlyCell(ws, value=value)
+        cell.style = style
+        row.append(cell)
+    return row
+
+
+def write_leads_excel(df, fp, metrics=None):
+    """
+    Escribe el Excel de leads (hojas Leads y Resumen) en `fp` (ruta o archivo
+    binario). Usa el modo write-only de openpyxl: las filas se escriben en
+    orden, una sola vez, con estilos con nombre compartidos por clasificación.
+    """
+    if metrics is None:
+        metrics = summary_metrics(df)
+
+    wb = Workbook(write_only=True)
+    for style in _named_styles():
+        wb.add_named_style(style)
+
+    # Hoja Leads: anchos y panel fijo se definen antes de escribir filas
+    ws_leads = wb.create_sheet('Leads')
+    for col_num, width in enumerate(excel_column_widths(df), 1):
+        ws_leads.column_dimensions[get_column_letter(col_num)].width = width
+    ws_leads.freeze_panes = 'A2'
+
+    ws_leads.append(_styled_row(ws_leads, [str(c) for c in df.columns], 'leads_header'))
+    if 'clasificacion' in df.columns:
+        row_styles = [f'leads_{c}' if c in CLASSIFICATION_FILLS else 'leads_cell'
+                      for c in df['clasificacion'].tolist()]
+    else:
+        row_styles = ['leads_cell'] * len(df)
+    columns = [df[c].tolist() for c in df.columns]
+    for values, style in zip(zip(*columns), row_styles):
+        ws_leads.append(_styled_row(ws_leads, [_excel_value(v) for v in values], style))
+
+    # Hoja Resumen
+    total_leads = metrics['total_leads']
+    spam_leads = metrics['spam_leads']
+    mql_leads = metrics['mql_leads']
+    sql_leads = metrics['sql_leads']
+    avg_score = metrics['avg_score']
+    summary_rows = [
+        ['Total Leads', total_leads, '100%'],
+        ['No Contactado', spam_leads, f"{(spam_leads/total_leads*100):.1f}%" if total_leads > 0 else "0%"],
+        ['MQL', mql_leads, f"{(mql_leads/total_leads*100):.1f}%" if total_leads > 0 else "0%"],
+        ['SQL', sql_leads, f"{(sql_leads/total_leads*100):.1f}%" if total_leads > 0 else "0%"],
+        ['Score Promedio', f"{avg_score:.1f}", '-'],
+    ]
+
+    ws_summary = wb.create_sheet('Resumen')
+    ws_summary.column_dimensions['A'].width = 20
+    ws_summary.column_dimensions['B'].width = 15
+    ws_summary.column_dimensions['C'].width = 15
+    ws_summary.append(_styled_row(ws_summary, ['Métrica', 'Valor', 'Porcentaje'], 'leads_header'))
+    for row in summary_rows:
+        style = f'summary_{row[0]}' if row[0] in SUMMARY_FILLS else 'summary_cell'
+        ws_summary.append(_styled_row(ws_summary, [_excel_value(v) for v in row], style))
+
+    wb.save(fp)
+
+
+def leads_excel_bytes(df, metrics=None):
+    """write_leads_excel en memoria (para descargas)."""
+    output = io.BytesIO()
+    write_leads_excel(df, output, metrics)
+    return output.getvalue()
+
+
+# ============================================================================
+# EXPORTS EN STREAMING (JSON / NDJSON / CSV / PARQUET)
+# ============================================================================
+
+# Columnas de los formatos tabulares (CSV / Parquet), en orden. Las filas que no
+# tienen alguna (p. ej. sin match Neotel) la dejan vacía; las claves que no están
+# en la lista se ignoran.
+EXPORT_COLUMNS = [
+    'chat_id', 'telefono', 'clasificacion', 'score_total',
+    'score_motivacion', 'score_pago', 'score_comportamiento',
+    'razon_principal', 'señales_clave', 'estado_conversacion',
+    'duracion_chat', 'mensajes_usuario',
+    'sesiones_detectadas', 'dias_mayor_pausa', 'duracion_ultima_sesion',
+    'utm_source', 'utm_medium', 'utm_origen', 'programa_interes',
+]
+
+# Columnas enteras (el resto se exporta como texto, salvo señales_clave)
+_INT_COLUMNS = {
+    'score_total', 'score_motivacion', 'score_pago', 'score_comportamiento',
+    'mensajes_usuario', 'sesiones_detectadas', 'dias_mayor_pausa',
+}
+
+# Filas por bloque al escribir Parquet (memoria acotada a un bloque)
+EXPORT_BATCH_SIZE = 5000
+
+# pyarrow es opcional: sin él no se ofrece el export a Parquet
+PARQUET_AVAILABLE = importlib.util.find_spec('pyarrow') is not None
+
+
+def _text_writer(fp):
+    return io.TextIOWrapper(fp, encoding='utf-8', newline='')
+
+
+def write_json(rows, fp):
+    """
+    Arreglo JSON con indentación, igual a json.dumps(list(rows), indent=2,
+    ensure_ascii=False), pero escrito fila por fila.
+    """
+    out = _text_writer(fp)
+    count = 0
+    for row in rows:
+        item = json.dumps(row, indent=2, ensure_ascii=False).replace('\n', '\n  ')
+        out.write(('[\n  ' if count == 0 else ',\n  ') + item)
+        count += 1
+    out.write('\n]' if count else '[]')
+    out.flush()
+    out.detach()
+    return count
+
+
+def write_ndjson(rows, fp):
+    """Una fila JSON por línea (NDJSON)."""
+    out = _text_writer(fp)
+    count = 0
+    for row in rows:
+        out.write(json.dumps(row, ensure_ascii=False) + '\n')
+        count += 1
+    out.flush()
+    out.detach()
+    return count
+
+
+def write_csv(rows, fp, columns=EXPORT_COLUMNS):
+    """CSV UTF-8 con encabezado; las señales se unen con '; '."""
+    out = _text_writer(fp)
+    writer = csv.DictWriter(out, fieldnames=columns, extrasaction='ignore')
+    writer.writeheader()
+    count = 0
+    for row in rows:
+        if isinstance(row.get('señales_clave'), list):
+            row = {**row, 'señales_clave': '; '.join(map(str, row['señales_clave']))}
+        writer.writerow(row)
+        count += 1
+    out.flush()
+    out.detach()
+    return count
+
+
+def _parquet_schema(columns):
+    import pyarrow as pa
+    fields = []
+    for name in columns:
+        if name == 'señales_clave':
+            fields.append(pa.field(name, pa.list_(pa.string())))
+        elif name in _INT_COLUMNS:
+            fields.append(pa.field(name, pa.int64()))
+        else:
+            fields.append(pa.field(name, pa.string()))
+    return pa.schema(fields)
+
+
+def write_parquet(rows, fp, columns=EXPORT_COLUMNS, batch_size=EXPORT_BATCH_SIZE):
+    """Parquet escrito por bloques de `batch_size` filas. Requiere pyarrow."""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError("El export a Parquet requiere pyarrow (pip install pyarrow).")
+
+    schema = _parquet_schema(columns)
+    rows = iter(rows)
+    count = 0
+    with pq.ParquetWriter(fp, schema) as writer:
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                break
+            writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+            count += len(batch)
+        if count == 0:
+            writer.write_table(schema.empty_table())
+    return count
+
+
+def leads_dataframe(rows):
+    """DataFrame de resultados; sin filas igual lleva las columnas de EXPORT_COLUMNS."""
+    rows = list(rows)
+    return pd.DataFrame(rows) if rows else pd.DataFrame(columns=EXPORT_COLUMNS)
+
+
+def write_excel(rows, fp):
+    """Excel con estilos (ver write_leads_excel). Necesita todas las filas para los anchos."""
+    df = leads_dataframe(rows)
+    write_leads_excel(df, fp)
+    return len(df)
+
+
+ExportFormat = namedtuple('ExportFormat', ['writer', 'extension', 'mime'])
+
+# Formatos de export disponibles: nombre -> (función(rows, fp), extensión, MIME)
+EXPORT_FORMATS = {
+    'json': ExportFormat(write_json, '.json', 'application/json'),
+    'ndjson': ExportFormat(write_ndjson, '.ndjson', 'application/x-ndjson'),
+    'csv': ExportFormat(write_csv, '.csv', 'text/csv'),
+    'parquet': ExportFormat(write_parquet, '.parquet', 'application/vnd.apache.parquet'),
+    'xlsx': ExportFormat(write_excel, '.xlsx', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+}
+
+
+def export_rows(rows, fp, fmt):
+    """
+    Escribe las filas (cualquier iterable, p. ej. el generador de
+    process_stream) en el archivo binario `fp` con el formato `fmt`.
+    Retorna la cantidad de filas escritas.
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Formato de export desconocido: {fmt} (opciones: {', '.join(EXPORT_FORMATS)}).")
+    return EXPORT_FORMATS[fmt].writer(rows, fp)
+
+
+def export_to_tempfile(rows, fmt, max_memory=16 * 1024 * 1024):
+    """
+    export_rows sobre un archivo temporal (en memoria hasta `max_memory` bytes,
+    en disco después), rebobinado y listo para leer o descargar.
+    """
+    fp = tempfile.SpooledTemporaryFile(max_size=max_memory)
+    export_rows(rows, fp, fmt)
+    fp.seek(0)
+    return fp
@@ -1,15 +1,56 @@
 import json
-from datetime import datetime, timedelta
-from collections import defaultdict
+import os
+import io
+import hashlib
+import inspect
+import marshal
+import pickle
+import sqlite3
+import tempfile
+import codecs
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from bisect import bisect_right
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from itertools import accumulate, islice
+import numpy as np
 import pandas as pd
 import re
 
+# Tamaño de bloque usado al leer exports en modo streaming
+STREAM_CHUNK_SIZE = 1 << 16
+
+# Chats por tarea en el modo paralelo (amortiza el costo de serializar a los workers)
+PARALLEL_CHUNK_SIZE = 64
+
+# Chats por lote en el enriquecimiento vectorizado con Neotel
+NEOTEL_BATCH_SIZE = 5000
+
+# Por debajo de esta cantidad de chats NeotelIndex.match_bulk busca de a uno
+# (el join vectorizado tiene un costo fijo de ~20 ms)
+NEOTEL_BULK_MIN_CHATS = 2000
+
+# Chats por lote al consultar / actualizar los resultados persistidos (ChatStateStore, AnalysisCache)
+STATE_BATCH_SIZE = 1000
+
+# Máximo de resultados que guarda por defecto la caché por contenido (AnalysisCache)
+ANALYSIS_CACHE_SIZE = 200_000
+
+# Clave donde la ingesta guarda el creationTime ya parseado (epoch en microsegundos)
+EPOCH_KEY = '_epoch'
+_EPOCH_ORIGIN = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_US_PER_DAY = 86_400_000_000
+
 def normalize_phone(phone):
     """
     Normalizes phone number by removing non-digit characters.
     Handles float values (e.g., 593993575726.0) by converting to int first.
     """
-    if not phone:
+    # pd.NA (columnas string/Int64 nullable) no admite `not`
+    if phone is pd.NA or not phone:
         return ""
     
     # Handle pandas NaN/NaT
@@ -26,156 +67,1163 @@ def normalize_phone(phone):
     # Remove all non-digit characters
     return re.sub(r'\D', '', str(phone))
 
+
+def normalize_phone_column(values):
+    """
+    Versión vectorizada de normalize_phone para una columna completa.
+    Retorna una Series con el mismo índice e igual resultado que
+    `.apply(normalize_phone)`, incluido el caso float 593993575726.0 -> "593993575726".
+    """
+    series = values if isinstance(values, pd.Series) else pd.Series(values)
+    dtype = series.dtype
+    out = np.full(len(series), "", dtype=object)
+
+    if pd.api.types.is_bool_dtype(dtype):
+        # True -> "True" -> sin dígitos; False es falsy
+        pass
+
+    elif pd.api.types.is_float_dtype(dtype):
+        arr = series.to_numpy(dtype='float64', na_value=np.nan)
+        usable = np.isfinite(arr) & (arr != 0)
+        fits = usable & (np.abs(arr) < 2**63)
+        # int() trunca hacia cero; el signo se descarta al quitar los no-dígitos
+        out[fits] = list(map(str, np.abs(arr[fits]).astype(np.int64).tolist()))
+        for pos in (usable & ~fits).nonzero()[0]:
+            out[pos] = normalize_phone(float(arr[pos]))
+
+    elif pd.api.types.is_integer_dtype(dtype):
+        # Los NA de enteros nullable se tratan como 0 (ambos -> ""); los
+        # unsigned se leen como uint64 para no desbordar sobre 2**63
+        unsigned = pd.api.types.is_unsigned_integer_dtype(dtype)
+        arr = series.to_numpy(dtype='uint64' if unsigned else 'int64', na_value=0)
+        nonzero = arr != 0
+        out[nonzero] = np.char.lstrip(arr[nonzero].astype(str), '-')
+
+    elif pd.api.types.is_string_dtype(dtype) and not pd.api.types.is_object_dtype(dtype):
+        out = series.str.replace(r'\D', '', regex=True).fillna("").to_numpy(dtype=object)
+
+    else:
+        # Columnas object mezcladas: los strings se limpian en bloque, el resto uno a uno
+        arr = series.to_numpy(dtype=object)
+        is_str = np.fromiter((isinstance(v, str) for v in arr), dtype=bool, count=len(arr))
+        if is_str.any():
+            out[is_str] = pd.Series(arr[is_str], dtype=object).str.replace(r'\D', '', regex=True).to_numpy()
+        for pos in (~is_str).nonzero()[0]:
+            out[pos] = normalize_phone(arr[pos])
+
+    return pd.Series(out, index=series.index)
+
+# ============================================================================
+# BASE NEOTEL
+# ============================================================================
+
+# Columnas candidatas para el teléfono en la base Neotel (en orden de preferencia)
+NEOTEL_PHONE_COLUMNS = ['TELWHATSAPP', 'teltelefono', 'TELTELEFONO', 'num_telefono']
+
+# Columnas UTM que se copian de la fila Neotel elegida: (campo, columna, columna alternativa)
+UTM_FIELDS = [
+    ("utm_source", 'UTM Source', 'Canal'),
+    ("utm_medium", 'UTM Medium', None),
+    ("utm_origen", 'UTM Origen', 'Medio'),
+    ("programa_interes", 'Program aInteres', None),
+]
+
+# Largos de sufijo (últimos dígitos) con que se cruza un teléfono que no aparece
+# tal cual en la base, p. ej. '0991234567' o '991234567' vs '593991234567'.
+# Se prueban en orden; () desactiva el cruce por sufijo.
+NEOTEL_PHONE_SUFFIXES = (9,)
+
+# Columnas candidatas para la fecha de inserción del lead
+NEOTEL_DATE_COLUMNS = ['Fecha Insert Lead', 'Fecha Inserción Leads']
+
+# Diferencia máxima de fechas para desempatar por cercanía
+MAX_DATE_DIFF = pd.Timedelta(days=365*10)
+
+
+def find_phone_column(neotel_df):
+    """Retorna la columna de teléfono de la base Neotel, o None si no hay ninguna."""
+    for col in NEOTEL_PHONE_COLUMNS:
+        if col in neotel_df.columns:
+            return col
+
+    for col in neotel_df.columns:
+        if 'telefono' in col.lower():
+            return col
+
+    return None
+
+
+def find_date_column(neotel_df):
+    """Retorna la columna con la fecha de inserción del lead, o None si no hay ninguna."""
+    for col in NEOTEL_DATE_COLUMNS:
+        if col in neotel_df.columns:
+            return col
+    return None
+
+
+def _parse_neotel_date(value):
+    """Fecha de una fila Neotel como Timestamp sin zona horaria; None si no se puede usar."""
+    try:
+        neotel_dt = value
+        if not isinstance(neotel_dt, datetime):
+            neotel_dt = pd.to_datetime(neotel_dt)
+
+        if neotel_dt.tzinfo:
+            neotel_dt = neotel_dt.tz_convert(None)
+        return neotel_dt
+    except Exception:
+        return None
+
+
+def _parse_chat_date(chat_date_str):
+    """Fecha del primer mensaje del chat sin zona horaria; None si no se puede parsear."""
+    try:
+        chat_dt = pd.to_datetime(chat_date_str)
+        if chat_dt.tzinfo:
+            chat_dt = chat_dt.tz_convert(None)
+        return chat_dt
+    except Exception:
+        return None
+
+
+def _to_naive_utc(values, fallback):
+    """
+    Parsea una columna de fechas de forma vectorizada a datetime64[ns] sin zona
+    horaria (UTC). Los valores no nulos que la ruta vectorizada no entiende se
+    parsean uno a uno con `fallback` (None -> NaT).
+    """
+    values = pd.Series(values, dtype=object)
+    parsed = pd.to_datetime(values, errors='coerce', format='mixed', utc=True)
+    parsed = parsed.dt.tz_convert(None).astype('datetime64[ns]')
+    missed = parsed.isna() & values.notna()
+    for pos in missed.to_numpy().nonzero()[0]:
+        value = fallback(values.iloc[pos])
+        parsed.iloc[pos] = pd.NaT if value is None else value
+    return parsed
+
+
+def _clean_utm_value(val):
+    if pd.isna(val) or val is pd.NaT:
+        return ""
+    return str(val)
+
+
+def _suffix_key(phones, n):
+    """Clave de búsqueda por los últimos `n` dígitos (Series de teléfonos normalizados)."""
+    return f'~{n}:' + phones.str[-n:]
+
+
+class NeotelIndex:
+    """
+    Base Neotel preparada una sola vez para cruzarla con los chats.
+
+    Normaliza los teléfonos, parsea las fechas de inserción e indexa las filas
+    por teléfono, guardando solo las columnas UTM que se usan. No modifica el
+    DataFrame recibido. Es de solo lectura y se puede serializar con pickle
+    (save / load) para reutilizarla en el app, entre sesiones y en jobs batch.
+
+    Regla de match: se buscan las filas con el mismo teléfono normalizado y,
+    si no hay, las que comparten los últimos dígitos (`suffixes`, ver
+    NEOTEL_PHONE_SUFFIXES). Si hay varias filas gana la de fecha más cercana
+    al primer mensaje (a menos de MAX_DATE_DIFF) y, en empate, la primera de
+    la base; si no se puede desempatar por fecha, la primera fila.
+    """
+
+    # Se incrementa cuando cambia el formato interno (invalida índices guardados)
+    FORMAT_VERSION = 2
+
+    def __init__(self, neotel_df, suffixes=NEOTEL_PHONE_SUFFIXES):
+        self.format_version = self.FORMAT_VERSION
+        self.source_rows = 0 if neotel_df is None else len(neotel_df)
+        self.phone_column = None
+        self.date_column = None
+        self.suffixes = tuple(suffixes)
+        # Una fila por registro con teléfono: phone, pos (orden en la base), date
+        self._rows = pd.DataFrame({
+            'phone': pd.Series(dtype=object),
+            'pos': pd.Series(dtype='int64'),
+            'date': pd.Series(dtype='datetime64[ns]'),
+        })
+        # Claves de búsqueda: el teléfono y sus sufijos ('~9:991234567'), con la
+        # fila a la que apuntan (índice en _rows), su fecha y cuántas filas tiene la clave
+        self._keys = pd.DataFrame({
+            'key': pd.Series(dtype=object),
+            'row': pd.Series(dtype='int64'),
+            'date': pd.Series(dtype='datetime64[ns]'),
+            'count': pd.Series(dtype='int64'),
+        })
+        self._groups = {}
+        self._first_row = pd.Series(dtype='int64')
+        self._count = pd.Series(dtype='int64')
+        self._utm_values = {}
+
+        if neotel_df is None or neotel_df.empty:
+            return
+
+        self.phone_column = find_phone_column(neotel_df)
+        if not self.phone_column:
+            return
+        self.date_column = find_date_column(neotel_df)
+
+        if 'normalized_phone' in neotel_df.columns:
+            phones = neotel_df['normalized_phone']
+        else:
+            phones = normalize_phone_column(neotel_df[self.phone_column])
+        phones = phones.to_numpy(dtype=object)
+        keep = np.fromiter((bool(p) for p in phones), dtype=bool, count=len(phones))
+
+        rows = pd.DataFrame({'phone': phones[keep], 'pos': np.arange(len(phones))[keep]})
+        if self.date_column:
+            dates = neotel_df[self.date_column].to_numpy(dtype=object)[keep]
+            rows['date'] = _to_naive_utc(dates, _parse_neotel_date).to_numpy()
+        else:
+            rows['date'] = pd.Series(pd.NaT, index=rows.index, dtype='datetime64[ns]')
+        self._rows = rows
+
+        keys = [pd.DataFrame({'key': rows['phone'], 'row': rows.index, 'date': rows['date']})]
+        phone_len = rows['phone'].str.len()
+        for n in self.suffixes:
+            long_enough = rows[phone_len >= n]
+            keys.append(pd.DataFrame({
+                'key': _suffix_key(long_enough['phone'], n),
+                'row': long_enough.index,
+                'date': long_enough['date'],
+            }))
+        keys = pd.concat(keys, ignore_index=True)
+        keys['count'] = keys.groupby('key', sort=False)['row'].transform('size')
+        self._keys = keys
+
+        # {clave: filas de _rows en orden de la base} para consultas puntuales
+        by_key = keys.groupby('key', sort=False)
+        self._groups = {key: keys['row'].to_numpy()[idx] for key, idx in by_key.indices.items()}
+        self._first_row = by_key['row'].min()
+        self._count = by_key['count'].first()
+
+        for field, col, alt_col in UTM_FIELDS:
+            source = col if col in neotel_df.columns else alt_col
+            if source and source in neotel_df.columns:
+                self._utm_values[field] = neotel_df[source].to_numpy(dtype=object)[keep]
+
+    def __len__(self):
+        return len(self._rows)
+
+    @property
+    def empty(self):
+        return self._rows.empty
+
+    def _utm(self, row):
+        """Dict UTM de la fila `row` (índice dentro de la tabla interna)."""
+        return {
+            field: _clean_utm_value(self._utm_values[field][row]) if field in self._utm_values else ""
+            for field, _, _ in UTM_FIELDS
+        }
+
+    def match(self, chat_phone, chat_date_str):
+        """
+        Finds the best match for a given phone and date.
+        Returns a dictionary with UTM data ({} si no hay match).
+        """
+        if not chat_phone:
+            return {}
+        phone = normalize_phone(chat_phone)
+        rows = self._groups.get(phone)
+        for n in self.suffixes:
+            if rows is not None:
+                break
+            if len(phone) >= n:
+                rows = self._groups.get(f'~{n}:{phone[-n:]}')
+        if rows is None:
+            return {}
+
+        best = rows[0]
+        if len(rows) > 1 and self.date_column:
+            chat_dt = _parse_chat_date(chat_date_str)
+            if chat_dt is not None and not pd.isna(chat_dt):
+                try:
+                    dates = self._rows['date'].to_numpy()[rows]
+                    diffs = np.abs(dates - np.datetime64(chat_dt, 'ns'))
+                    valid = ~np.isnat(diffs) & (diffs < MAX_DATE_DIFF.to_timedelta64())
+                    if valid.any():
+                        # argmin retorna el primer mínimo: en empate gana la primera fila
+                        candidates = rows[valid]
+                        best = candidates[np.argmin(diffs[valid])]
+                except (OverflowError, ValueError):
+                    pass
+
+        return self._utm(best)
+
+    def match_bulk(self, chat_phones, chat_dates, min_chats=NEOTEL_BULK_MIN_CHATS):
+        """
+        Versión vectorizada de match para muchos chats a la vez.
+
+        Arma una tabla (chat, clave de búsqueda, fecha del primer mensaje) y la
+        cruza con la base con un as-of join por clave hacia atrás y hacia
+        adelante, aplicando la misma regla de desempate que match.
+        Retorna una lista de dicts UTM (vacíos si no hay match) alineada con la entrada.
+
+        Con menos de `min_chats` chats (NEOTEL_BULK_MIN_CHATS) el armado de las
+        tablas cuesta más que buscarlos de a uno, y se usa match (mismo
+        resultado); min_chats=0 fuerza el join.
+        """
+        n_chats = len(chat_phones)
+        if self.empty or not n_chats:
+            return [{} for _ in range(n_chats)]
+        if n_chats < min_chats:
+            return [self.match(phone, date) for phone, date in zip(chat_phones, chat_dates)]
+
+        keys = self._keys
+        phones = normalize_phone_column(pd.Series(list(chat_phones), dtype=object))
+        # Clave de cada chat: el teléfono tal cual o, si no está, el primer sufijo que esté
+        chat_keys = phones.where(phones.isin(self._first_row.index))
+        for n in self.suffixes:
+            by_suffix = _suffix_key(phones, n).where(phones.str.len() >= n)
+            chat_keys = chat_keys.fillna(by_suffix.where(by_suffix.isin(self._first_row.index)))
+
+        chats = pd.DataFrame({'chat': range(n_chats), 'key': chat_keys.to_numpy(dtype=object)})
+        chats['row'] = chats['key'].map(self._first_row).astype('float64')
+        chats['count'] = chats['key'].map(self._count)
+
+        # Desempate por fecha solo para teléfonos con varias filas
+        multi = chats[chats['count'] > 1].copy() if self.date_column else chats.iloc[:0]
+        if not multi.empty:
+            multi['chat_dt'] = _to_naive_utc(
+                [chat_dates[i] for i in multi['chat']], _parse_chat_date
+            ).to_numpy()
+            multi = multi[multi['chat_dt'].notna()].sort_values('chat_dt')
+
+            # Fechas repetidas de la misma clave: queda la primera fila de la base
+            right = keys[(keys['count'] > 1) & keys['date'].notna()]
+            right = right[right['key'].isin(multi['key'].unique())]
+            right = (right.sort_values(['date', 'row'])
+                          .drop_duplicates(['key', 'date'])[['key', 'date', 'row']])
+
+            if not multi.empty and not right.empty:
+                left = multi[['chat', 'key', 'chat_dt']]
+                back = pd.merge_asof(left, right, left_on='chat_dt', right_on='date',
+                                     by='key', direction='backward')
+                fwd = pd.merge_asof(left, right, left_on='chat_dt', right_on='date',
+                                    by='key', direction='forward')
+
+                back_diff = back['chat_dt'] - back['date']
+                fwd_diff = fwd['date'] - fwd['chat_dt']
+                back_ok = back_diff < MAX_DATE_DIFF
+                fwd_ok = fwd_diff < MAX_DATE_DIFF
+                use_fwd = fwd_ok & (~back_ok | (fwd_diff < back_diff)
+                                    | ((fwd_diff == back_diff) & (fwd['row'] < back['row'])))
+
+                best = back['row'].where(back_ok)
+                best = best.mask(use_fwd, fwd['row'])
+                best.index = back['chat']
+                best = best.dropna()
+                chats.loc[best.index, 'row'] = best
+
+        results = [{} for _ in range(n_chats)]
+        matched = chats[chats['row'].notna()]
+        for chat, row in zip(matched['chat'], matched['row'].astype(int)):
+            results[chat] = self._utm(row)
+        return results
+
+    def save(self, path):
+        """Guarda el índice en disco (pickle)."""
+        with open(path, 'wb') as f:
+            pickle.dump(self, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Carga un índice guardado con save. Solo usar con archivos propios:
+        pickle puede ejecutar código al deserializar.
+        """
+        with open(path, 'rb') as f:
+            index = pickle.load(f)
+        if not isinstance(index, cls) or getattr(index, 'format_version', None) != cls.FORMAT_VERSION:
+            raise ValueError(f"{path} no es un NeotelIndex compatible (versión {cls.FORMAT_VERSION}).")
+        return index
+
+
+def as_neotel_index(neotel):
+    """
+    Acepta un NeotelIndex, un NeotelStore o un DataFrame Neotel (que se
+    indexa); None si no hay base.
+    """
+    if neotel is None or isinstance(neotel, (NeotelIndex, NeotelStore)):
+        return neotel
+    return NeotelIndex(neotel)
+
+
 def match_neotel_data(chat_phone, chat_date_str, neotel_df):
     """
     Finds the best match in Neotel data for a given phone and date.
     Returns a dictionary with UTM data.
+
+    `neotel_df` puede ser el DataFrame Neotel o un NeotelIndex ya construido;
+    para muchas consultas conviene construir el índice una vez y reutilizarlo.
     """
-    if neotel_df is None or neotel_df.empty or not chat_phone:
+    neotel = as_neotel_index(neotel_df)
+    if neotel is None or neotel.empty or not chat_phone:
         return {}
+    return neotel.match(chat_phone, chat_date_str)
 
-    norm_chat_phone = normalize_phone(chat_phone)
-    if not norm_chat_phone:
-        return {}
-        
-    # Filter by phone
-    phone_col = None
-    possible_cols = ['TELWHATSAPP', 'teltelefono', 'TELTELEFONO', 'num_telefono']
-    
-    for col in possible_cols:
-        if col in neotel_df.columns:
-            phone_col = col
-            break
-            
-    if not phone_col:
-        for col in neotel_df.columns:
-            if 'telefono' in col.lower():
-                phone_col = col
-                break
-                
+
+def match_neotel_bulk(chat_phones, chat_dates, neotel_df):
+    """Cruce vectorizado de muchos chats con Neotel (ver NeotelIndex.match_bulk)."""
+    neotel = as_neotel_index(neotel_df)
+    if neotel is None:
+        return [{} for _ in chat_phones]
+    return neotel.match_bulk(chat_phones, chat_dates)
+
+
+# ============================================================================
+# CARGA DEL EXCEL NEOTEL
+# ============================================================================
+
+# Se incrementa cuando cambia lo que guarda load_neotel_excel (invalida la caché)
+NEOTEL_CACHE_VERSION = 2
+
+# Caché por defecto de las bases Neotel ya leídas (parquet o SQLite; clave: hash del archivo)
+NEOTEL_CACHE_DIR = os.path.join(tempfile.gettempdir(), 'clasificaleads_neotel')
+
+
+def _is_neotel_column(col):
+    """True si la columna puede usarse para el cruce (teléfono, fecha o UTM)."""
+    col = str(col)
+    return (
+        col in NEOTEL_PHONE_COLUMNS
+        or 'telefono' in col.lower()
+        or col in NEOTEL_DATE_COLUMNS
+        or any(col in (utm_col, alt_col) for _, utm_col, alt_col in UTM_FIELDS)
+    )
+
+
+def _neotel_read_dtypes():
+    """
+    Tipos fijos para read_excel: las fechas se leen tal cual (object), sin
+    inferencia. El teléfono y los UTM conservan la inferencia de read_excel
+    porque el resultado depende de ella: un '09...' guardado como texto pierde
+    el 0, y un UTM numérico con celdas vacías queda como float ('1.0').
+    """
+    return dict.fromkeys(NEOTEL_DATE_COLUMNS, object)
+
+
+def _prune_neotel_columns(neotel_df):
+    """
+    Deja solo las columnas que usa el cruce, con tipos fijos: teléfono
+    normalizado (str), fecha de inserción (datetime64 sin zona) y UTM (str).
+    """
+    phone_col = find_phone_column(neotel_df)
     if not phone_col:
-        return {}
+        raise ValueError("La base Neotel no tiene una columna de teléfono.")
 
-    if 'normalized_phone' not in neotel_df.columns:
-         neotel_df['normalized_phone'] = neotel_df[phone_col].apply(normalize_phone)
+    pruned = {phone_col: normalize_phone_column(neotel_df[phone_col]).to_numpy(dtype=object)}
+    date_col = find_date_column(neotel_df)
+    if date_col:
+        pruned[date_col] = _to_naive_utc(neotel_df[date_col].to_numpy(dtype=object), _parse_neotel_date).to_numpy()
+    for _, col, alt_col in UTM_FIELDS:
+        source = col if col in neotel_df.columns else alt_col
+        if source and source in neotel_df.columns and source not in pruned:
+            pruned[source] = neotel_df[source].map(_clean_utm_value).to_numpy(dtype=object)
 
-    matches = neotel_df[neotel_df['normalized_phone'] == norm_chat_phone]
-    
-    if matches.empty:
-        return {}
-        
-    if len(matches) == 1:
-        best_match = matches.iloc[0]
-    else:
-        best_match = None
+    return pd.DataFrame(pruned)
+
+
+def _read_upload(source):
+    """Bytes de una ruta o de un archivo subido (UploadedFile, BytesIO, archivo abierto)."""
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, 'rb') as f:
+            return f.read()
+    if hasattr(source, 'getvalue'):
+        return source.getvalue()
+    source.seek(0)
+    return source.read()
+
+
+def _cache_paths(cache_dir, digest):
+    base = os.path.join(cache_dir, f"neotel_{digest}_v{NEOTEL_CACHE_VERSION}")
+    return base + '.parquet', base + '.pkl'
+
+
+def _read_cache(cache_dir, digest):
+    parquet_path, pickle_path = _cache_paths(cache_dir, digest)
+    try:
+        if os.path.exists(parquet_path):
+            return pd.read_parquet(parquet_path)
+        if os.path.exists(pickle_path):
+            return pd.read_pickle(pickle_path)
+    except Exception:
+        # Caché corrupta o sin motor parquet: se vuelve a leer el Excel
+        pass
+    return None
+
+
+def _write_cache(neotel_df, cache_dir, digest):
+    """Guarda en parquet si hay motor (pyarrow/fastparquet); si no, en pickle."""
+    parquet_path, pickle_path = _cache_paths(cache_dir, digest)
+    os.makedirs(cache_dir, exist_ok=True)
+    try:
+        tmp_path = parquet_path + '.tmp'
+        neotel_df.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, parquet_path)
+    except ImportError:
+        tmp_path = pickle_path + '.tmp'
+        neotel_df.to_pickle(tmp_path)
+        os.replace(tmp_path, pickle_path)
+
+
+def load_neotel_excel(source, cache_dir=None):
+    """
+    Lee la base Neotel (.xls / .xlsx) quedándose solo con las columnas del
+    cruce (ver _prune_neotel_columns) y con tipos fijos.
+
+    Con `cache_dir` el resultado se guarda en formato columnar (parquet, o
+    pickle si no hay motor parquet) con el hash del contenido como clave, de
+    modo que volver a cargar el mismo archivo no vuelve a parsear el Excel.
+    """
+    data = _read_upload(source)
+    digest = hashlib.sha256(data).hexdigest()
+
+    if cache_dir:
+        cached = _read_cache(cache_dir, digest)
+        if cached is not None:
+            return cached
+
+    neotel_df = pd.read_excel(io.BytesIO(data), usecols=_is_neotel_column, dtype=_neotel_read_dtypes())
+    neotel_df = _prune_neotel_columns(neotel_df)
+
+    if cache_dir:
         try:
-            chat_dt = pd.to_datetime(chat_date_str)
-            if chat_dt.tzinfo:
-                chat_dt = chat_dt.tz_convert(None)
-        except:
-            best_match = matches.iloc[0]
-            
-        date_col = 'Fecha Insert Lead'
-        if date_col not in matches.columns:
-             if 'Fecha Inserción Leads' in matches.columns:
-                 date_col = 'Fecha Inserción Leads'
-             else:
-                 best_match = matches.iloc[0]
-        
-        if best_match is None:     
-            min_diff = timedelta(days=365*10)
-            
-            for idx, row in matches.iterrows():
+            _write_cache(neotel_df, cache_dir, digest)
+        except OSError:
+            # Sin permisos de escritura: se sigue sin caché
+            pass
+    return neotel_df
+
+
+# ============================================================================
+# BASE NEOTEL EN DISCO (SQLITE)
+# ============================================================================
+
+# Textos que read_excel trata como vacíos (valores por defecto de pandas)
+_NA_STRINGS = frozenset([
+    '', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND',
+    '1.#QNAN', '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null',
+])
+
+# Máximo de parámetros por consulta IN (límite clásico de SQLite: 999)
+_SQLITE_MAX_PARAMS = 900
+
+
+def _excel_cell(value):
+    """Valor de una celda como lo entrega read_excel (floats enteros -> int, vacíos -> None)."""
+    if isinstance(value, str):
+        return None if value in _NA_STRINGS else value
+    if isinstance(value, float):
+        if value != value:
+            return None
+        if value.is_integer():
+            return int(value)
+    return value
+
+
+def _excel_number_kind(value):
+    """
+    Cómo trata read_excel una celda (ya pasada por _excel_cell) al inferir el
+    tipo de su columna: 'int', 'float', o None si no es numérica. Los
+    booleanos cuentan como enteros y los textos numéricos como números.
+    """
+    if isinstance(value, (bool, int)):
+        return 'int'
+    if isinstance(value, float):
+        return 'float'
+    if isinstance(value, str):
+        try:
+            int(value)
+            return 'int'
+        except ValueError:
+            pass
+        try:
+            float(value)
+            return 'float'
+        except ValueError:
+            pass
+    return None
+
+
+def _excel_number_text(text, as_float):
+    """Texto de un UTM de columna numérica, como str() del int64 / float64 de read_excel."""
+    value = {'True': 1, 'False': 0}.get(text)
+    if value is None:
+        try:
+            value = int(text)
+        except ValueError:
+            value = float(text)
+    return str(float(value)) if as_float else str(value)
+
+
+def _iter_excel_rows(data):
+    """
+    Recorre las filas de la primera hoja de un .xls / .xlsx (bytes) sin armar
+    un DataFrame. Los .xlsx se leen en modo read-only de openpyxl; los .xls los
+    abre xlrd (que igual necesita el archivo completo en memoria).
+    """
+    if data[:4] == b'PK\x03\x04':
+        import openpyxl
+        book = openpyxl.load_workbook(io.BytesIO(data), read_only=True, data_only=True)
+        try:
+            for row in book.worksheets[0].iter_rows(values_only=True):
+                yield [_excel_cell(v) for v in row]
+        finally:
+            book.close()
+        return
+
+    import xlrd
+    book = xlrd.open_workbook(file_contents=data, on_demand=True)
+    sheet = book.sheet_by_index(0)
+    for r in range(sheet.nrows):
+        row = []
+        for cell_type, value in zip(sheet.row_types(r), sheet.row_values(r)):
+            if cell_type == xlrd.XL_CELL_DATE:
                 try:
-                    neotel_dt = row[date_col]
-                    if not isinstance(neotel_dt, datetime):
-                        neotel_dt = pd.to_datetime(neotel_dt)
-                    
-                    if neotel_dt.tzinfo:
-                        neotel_dt = neotel_dt.tz_convert(None)
-                        
-                    diff = abs(chat_dt - neotel_dt)
-                    if diff < min_diff:
-                        min_diff = diff
-                        best_match = row
-                except Exception as e:
+                    value = xlrd.xldate.xldate_as_datetime(value, book.datemode)
+                except (OverflowError, xlrd.xldate.XLDateError):
+                    pass
+            elif cell_type == xlrd.XL_CELL_ERROR:
+                value = None
+            elif cell_type == xlrd.XL_CELL_BOOLEAN:
+                value = bool(value)
+            row.append(_excel_cell(value))
+        yield row
+    book.release_resources()
+
+
+def import_neotel_sqlite(source, db_path, batch_size=NEOTEL_BATCH_SIZE, suffixes=NEOTEL_PHONE_SUFFIXES):
+    """
+    Importa la base Neotel (.xls / .xlsx) a una tabla SQLite en `db_path`,
+    fila a fila y en lotes, sin cargar la hoja como DataFrame. Guarda solo
+    las filas con teléfono, con el teléfono normalizado, la fecha de
+    inserción (ns UTC) y los campos UTM, e indexa por teléfono y por cada
+    largo de sufijo de `suffixes` (columnas s9, s8, ...).
+    Retorna un NeotelStore abierto sobre la base creada.
+    """
+    rows = _iter_excel_rows(_read_upload(source))
+    header = next(rows, None) or []
+    columns = pd.Index([str(c) if c is not None else '' for c in header])
+    # Con encabezados repetidos read_excel renombra los siguientes: vale el primero
+    positions = {}
+    for i, name in enumerate(columns):
+        positions.setdefault(name, i)
+
+    phone_col = find_phone_column(pd.DataFrame(columns=columns))
+    if not phone_col:
+        raise ValueError("La base Neotel no tiene una columna de teléfono.")
+    date_col = find_date_column(pd.DataFrame(columns=columns))
+    phone_idx = positions[phone_col]
+    date_idx = positions.get(date_col)
+    utm_idx = []
+    for _, col, alt_col in UTM_FIELDS:
+        source_col = col if col in positions else alt_col
+        utm_idx.append(positions.get(source_col))
+
+    if os.path.exists(db_path):
+        os.remove(db_path)
+    conn = sqlite3.connect(db_path)
+    utm_names = [field for field, _, _ in UTM_FIELDS]
+    conn.execute(
+        "CREATE TABLE neotel (pos INTEGER PRIMARY KEY, phone TEXT NOT NULL, date INTEGER, "
+        + ", ".join(f"{name} TEXT" for name in utm_names) + ")"
+    )
+    conn.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)")
+    insert = (f"INSERT INTO neotel VALUES ({', '.join('?' * (3 + len(utm_names)))})")
+
+    def cell(row, i):
+        return row[i] if i is not None and i < len(row) else None
+
+    def flush(batch):
+        if date_idx is not None:
+            dates = _to_naive_utc([b[2] for b in batch], _parse_neotel_date)
+            dates = [None if pd.isna(d) else d.value for d in dates]
+        else:
+            dates = [None] * len(batch)
+        conn.executemany(insert, [
+            (pos, phone, date, *(_clean_utm_value(v) for v in utm))
+            for (pos, phone, _, utm), date in zip(batch, dates)
+        ])
+
+    # read_excel convierte la columna de teléfono a número si todas sus celdas
+    # lo son (y un '09...' pierde el 0): se replica al final de la importación
+    numeric_phones = True
+    # Lo mismo con cada UTM: si todas sus celdas (con o sin teléfono) son
+    # numéricas la columna queda int64, o float64 si hay vacíos o decimales
+    numeric_utm = [i is not None for i in utm_idx]
+    float_utm = [False] * len(utm_idx)
+    source_rows = 0
+    batch = []
+    for pos, row in enumerate(rows):
+        source_rows += 1
+        raw_phone = cell(row, phone_idx)
+        if isinstance(raw_phone, str) and not raw_phone.strip().isdigit():
+            numeric_phones = False
+        utm = [cell(row, i) for i in utm_idx]
+        for k, value in enumerate(utm):
+            if not numeric_utm[k]:
+                continue
+            if value is None:
+                float_utm[k] = True
+                continue
+            kind = _excel_number_kind(value)
+            if kind is None:
+                numeric_utm[k] = False
+            elif kind == 'float':
+                float_utm[k] = True
+        phone = normalize_phone(raw_phone)
+        if not phone:
+            continue
+        batch.append((pos, phone, cell(row, date_idx), utm))
+        if len(batch) >= batch_size:
+            flush(batch)
+            batch = []
+    if batch:
+        flush(batch)
+
+    if numeric_phones:
+        conn.execute("UPDATE neotel SET phone = ltrim(phone, '0') WHERE phone LIKE '0%'")
+        conn.execute("DELETE FROM neotel WHERE phone = ''")
+    conn.create_function('excel_number', 2, _excel_number_text, deterministic=True)
+    for name, is_numeric, as_float in zip(utm_names, numeric_utm, float_utm):
+        if is_numeric:
+            conn.execute(f"UPDATE neotel SET {name} = excel_number({name}, ?) WHERE {name} != ''", (as_float,))
+    conn.execute("CREATE INDEX neotel_phone ON neotel (phone, pos)")
+    suffixes = tuple(int(n) for n in suffixes)
+    for n in suffixes:
+        conn.execute(f"ALTER TABLE neotel ADD COLUMN s{n} TEXT")
+        conn.execute(f"UPDATE neotel SET s{n} = substr(phone, -{n}) WHERE length(phone) >= {n}")
+        conn.execute(f"CREATE INDEX neotel_s{n} ON neotel (s{n}, pos)")
+    conn.executemany("INSERT INTO meta VALUES (?, ?)", [
+        ('format_version', str(NeotelStore.FORMAT_VERSION)),
+        ('source_rows', str(source_rows)),
+        ('phone_column', phone_col),
+        ('date_column', date_col or ''),
+        ('suffixes', ','.join(map(str, suffixes))),
+    ])
+    conn.commit()
+    conn.close()
+    return NeotelStore(db_path)
+
+
+class NeotelStore:
+    """
+    Base Neotel en una base SQLite indexada por teléfono (ver
+    import_neotel_sqlite). Ofrece la misma interfaz de cruce que NeotelIndex
+    (match / match_bulk, misma regla de desempate), pero cada consulta es una
+    búsqueda indexada en disco: la base no se carga en memoria. Los largos de
+    sufijo se fijan al importar.
+    """
+
+    FORMAT_VERSION = 3
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True, check_same_thread=False)
+        meta = dict(self._conn.execute("SELECT key, value FROM meta"))
+        if meta.get('format_version') != str(self.FORMAT_VERSION):
+            self._conn.close()
+            raise ValueError(f"{db_path} no es una base Neotel compatible (versión {self.FORMAT_VERSION}).")
+        self.source_rows = int(meta['source_rows'])
+        self.phone_column = meta['phone_column']
+        self.date_column = meta['date_column'] or None
+        self.suffixes = tuple(int(n) for n in meta['suffixes'].split(',') if n)
+        self._len = self._conn.execute("SELECT COUNT(*) FROM neotel").fetchone()[0]
+
+    # Se serializa solo la ruta (p. ej. para guardarla en la sesión de Streamlit)
+    def __getstate__(self):
+        return {'db_path': self.db_path}
+
+    def __setstate__(self, state):
+        self.__init__(state['db_path'])
+
+    def __len__(self):
+        return self._len
+
+    @property
+    def empty(self):
+        return self._len == 0
+
+    def close(self):
+        self._conn.close()
+
+    def _rows_by(self, column, keys):
+        """{valor de `column`: [(fecha_ns, utm...), ...]} en orden de la base."""
+        found = {}
+        keys = list(keys)
+        for start in range(0, len(keys), _SQLITE_MAX_PARAMS):
+            chunk = keys[start:start + _SQLITE_MAX_PARAMS]
+            query = (
+                f"SELECT {column}, date, {', '.join(field for field, _, _ in UTM_FIELDS)} FROM neotel "
+                f"WHERE {column} IN ({', '.join('?' * len(chunk))}) ORDER BY {column}, pos"
+            )
+            for key, *values in self._conn.execute(query, chunk):
+                found.setdefault(key, []).append(values)
+        return found
+
+    def _rows_for(self, phones):
+        """
+        {teléfono: filas} buscando por teléfono exacto y, para los que no
+        aparecen, por sus últimos dígitos (misma regla que NeotelIndex).
+        """
+        found = self._rows_by('phone', phones)
+        missing = [p for p in phones if p not in found]
+        for n in self.suffixes:
+            by_suffix = self._rows_by(f's{n}', {p[-n:] for p in missing if len(p) >= n})
+            for phone in missing:
+                if len(phone) >= n and phone[-n:] in by_suffix:
+                    found[phone] = by_suffix[phone[-n:]]
+            missing = [p for p in missing if p not in found]
+        return found
+
+    def _pick(self, rows, chat_dt):
+        """Fila elegida entre las de un mismo teléfono (misma regla que NeotelIndex.match)."""
+        best = rows[0]
+        if len(rows) > 1 and self.date_column and chat_dt is not None and not pd.isna(chat_dt):
+            chat_ns = pd.Timestamp(chat_dt).value
+            max_ns = MAX_DATE_DIFF.value
+            best_diff = None
+            for row in rows:
+                if row[0] is None:
                     continue
-                    
-            if best_match is None:
-                best_match = matches.iloc[0]
-            
-    def clean_val(val):
-        if pd.isna(val) or val is pd.NaT:
-            return ""
-        return str(val)
-    
-    def safe_get(series_row, col_name, default=''):
+                diff = abs(row[0] - chat_ns)
+                # Estrictamente menor: en empate gana la primera fila
+                if diff < max_ns and (best_diff is None or diff < best_diff):
+                    best, best_diff = row, diff
+        return {field: value for (field, _, _), value in zip(UTM_FIELDS, best[1:])}
+
+    def match(self, chat_phone, chat_date_str):
+        """Igual que NeotelIndex.match, con una consulta indexada."""
+        if not chat_phone:
+            return {}
+        phone = normalize_phone(chat_phone)
+        rows = self._rows_for([phone]).get(phone)
+        if not rows:
+            return {}
+        chat_dt = _parse_chat_date(chat_date_str) if len(rows) > 1 else None
+        return self._pick(rows, chat_dt)
+
+    def match_bulk(self, chat_phones, chat_dates):
+        """Igual que NeotelIndex.match_bulk, consultando solo los teléfonos del lote."""
+        n_chats = len(chat_phones)
+        if self.empty or not n_chats:
+            return [{} for _ in range(n_chats)]
+
+        phones = normalize_phone_column(pd.Series(list(chat_phones), dtype=object)).tolist()
+        found = self._rows_for(list({p for p in phones if p}))
+        multi = [i for i, p in enumerate(phones) if len(found.get(p, ())) > 1]
+        chat_dts = dict(zip(multi, _to_naive_utc([chat_dates[i] for i in multi], _parse_chat_date)))
+
+        results = []
+        for i, phone in enumerate(phones):
+            rows = found.get(phone)
+            results.append(self._pick(rows, chat_dts.get(i)) if rows else {})
+        return results
+
+
+def load_neotel_store(source, cache_dir, suffixes=NEOTEL_PHONE_SUFFIXES):
+    """
+    Importa la base Neotel a SQLite dentro de `cache_dir` (ver
+    import_neotel_sqlite), reutilizando la base ya importada si el archivo
+    tiene el mismo contenido (clave: hash SHA-256).
+    """
+    digest = hashlib.sha256(_read_upload(source)).hexdigest()
+    suffix_tag = '-'.join(map(str, suffixes)) or 'none'
+    db_path = os.path.join(cache_dir, f"neotel_{digest}_v{NeotelStore.FORMAT_VERSION}_s{suffix_tag}.sqlite")
+    if os.path.exists(db_path):
         try:
-            if col_name in series_row.index:
-                return series_row[col_name]
-            return default
-        except:
-            return default
+            return NeotelStore(db_path)
+        except (sqlite3.Error, ValueError, KeyError):
+            pass
 
-    utm_source = safe_get(best_match, 'UTM Source', safe_get(best_match, 'Canal', ''))
-    utm_medium = safe_get(best_match, 'UTM Medium', '')
-    utm_origen = safe_get(best_match, 'UTM Origen', safe_get(best_match, 'Medio', ''))
-    programa_interes = safe_get(best_match, 'Program aInteres', '')
-    
-    return {
-        "utm_source": clean_val(utm_source),
-        "utm_medium": clean_val(utm_medium),
-        "utm_origen": clean_val(utm_origen),
-        "programa_interes": clean_val(programa_interes)
-    }
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = db_path + '.tmp'
+    import_neotel_sqlite(source, tmp_path, suffixes=suffixes).close()
+    os.replace(tmp_path, db_path)
+    return NeotelStore(db_path)
 
 
-def group_and_sort(items):
+def load_neotel_base(source, on_disk=False, cache_dir=NEOTEL_CACHE_DIR):
+    """
+    Base Neotel lista para cruzar: NeotelIndex en memoria o, con `on_disk`,
+    NeotelStore en SQLite (para bases muy grandes). Ambas usan la caché.
+    """
+    if on_disk:
+        return load_neotel_store(source, cache_dir)
+    return NeotelIndex(load_neotel_excel(source, cache_dir))
+
+
+# ============================================================================
+# TIMESTAMPS PRE-PARSEADOS
+# ============================================================================
+
+def parse_epoch(time_str):
+    """
+    Convierte un creationTime ISO-8601 a epoch en microsegundos (int).
+    Los timestamps sin zona horaria se interpretan como UTC.
+    Retorna None si el valor falta o es inválido.
+    """
+    try:
+        dt = datetime.fromisoformat(time_str.replace('Z', '+00:00'))
+    except (AttributeError, TypeError, ValueError):
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    delta = dt - _EPOCH_ORIGIN
+    return (delta.days * 86400 + delta.seconds) * 1_000_000 + delta.microseconds
+
+
+def message_epoch(msg):
+    """
+    Retorna el epoch pre-parseado del mensaje. Si la ingesta no lo calculó
+    (p. ej. mensajes armados a mano), lo parsea una vez y lo guarda en el mensaje.
+    """
+    try:
+        return msg[EPOCH_KEY]
+    except KeyError:
+        epoch = msg[EPOCH_KEY] = parse_epoch(msg.get('creationTime', ''))
+        return epoch
+
+
+# ============================================================================
+# INGESTA EN MODO STREAMING
+# ============================================================================
+
+class ChatOrderError(ValueError):
+    """El export no lista cada chat de forma contigua (no se puede procesar en streaming)."""
+
+
+def iter_items(fp, chunk_size=STREAM_CHUNK_SIZE):
+    """
+    Recorre incrementalmente el arreglo 'items' de un bulk export.
+
+    Lee el archivo por bloques y decodifica un mensaje a la vez, por lo que el
+    export completo nunca se mantiene en memoria. Acepta archivos abiertos en
+    modo texto o binario (p. ej. el UploadedFile de Streamlit).
+    Lanza ValueError si el JSON no tiene la clave 'items'.
+    """
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder('utf-8-sig')()
+    buf = ""
+    pos = 0
+    eof = False
+
+    def fill():
+        # Lee al menos lo que ya hay pendiente para que los reintentos crezcan geométricamente
+        nonlocal buf, pos, eof
+        raw = fp.read(max(chunk_size, len(buf) - pos))
+        # El fin del archivo lo marca la lectura, no el texto decodificado (un
+        # bloque puede traer solo parte de un carácter UTF-8 o el BOM)
+        eof = not raw
+        chunk = raw
+        if isinstance(chunk, bytes):
+            chunk = utf8.decode(chunk, final=eof)
+        elif not buf and chunk.startswith('\ufeff'):
+            chunk = chunk[1:]
+        buf = buf[pos:] + chunk
+        pos = 0
+
+    def peek():
+        # Salta espacios y retorna el siguiente caracter ('' al final del archivo)
+        nonlocal pos
+        while True:
+            while pos < len(buf) and buf[pos] in ' \t\n\r':
+                pos += 1
+            if pos < len(buf):
+                return buf[pos]
+            if eof:
+                return ''
+            fill()
+
+    def decode_value():
+        # Un valor que termina justo al final del buffer podría estar truncado (p. ej. un número)
+        nonlocal pos
+        while True:
+            try:
+                value, end = decoder.raw_decode(buf, pos)
+                if end < len(buf) or eof:
+                    pos = end
+                    return value
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+            fill()
+
+    def expect(char):
+        nonlocal pos
+        if peek() != char:
+            raise json.JSONDecodeError(f"Expecting '{char}'", buf, pos)
+        pos += 1
+
+    expect('{')
+    if peek() == '}':
+        raise ValueError("El JSON no tiene el formato correcto (falta la clave 'items').")
+
+    while True:
+        key = decode_value()
+        expect(':')
+        if key == 'items':
+            expect('[')
+            if peek() == ']':
+                return
+            while True:
+                peek()
+                yield decode_value()
+                if peek() == ']':
+                    return
+                expect(',')
+
+        # Otras claves (totalItems, contacts, ...) se decodifican y se descartan
+        peek()
+        decode_value()
+        if peek() == '}':
+            break
+        expect(',')
+        peek()
+
+    raise ValueError("El JSON no tiene el formato correcto (falta la clave 'items').")
+
+
+def target_filter(targets):
+    """
+    Filtro de chats para el modo de consulta puntual.
+
+    `targets` es una colección de chat IDs y/o teléfonos (o un único valor).
+    Retorna una función wants(chat_id, item) que indica si el chat está entre
+    los buscados, comparando el chatId tal cual y el contactId normalizado
+    con normalize_phone. La decisión se toma una vez por chat, con su primer
+    mensaje. Sin `targets` (None) retorna None: no se filtra nada.
+    """
+    if targets is None:
+        return None
+    if isinstance(targets, (str, int, float)):
+        targets = [targets]
+    chat_ids = {str(t) for t in targets}
+    phones = {normalize_phone(t) for t in targets} - {""}
+    decided = {}
+
+    def wants(chat_id, item):
+        keep = decided.get(chat_id)
+        if keep is None:
+            phone = normalize_phone(item.get('chat', {}).get('contactId', ""))
+            keep = decided[chat_id] = chat_id in chat_ids or phone in phones
+        return keep
+
+    return wants
+
+
+def iter_chats(items, targets=None):
+    """
+    Agrupa un flujo de mensajes por chatId, emitiendo (chat_id, mensajes)
+    ordenados por creationTime apenas termina el bloque de cada chat.
+
+    Los bulk exports listan los mensajes de cada chat de forma contigua, así que
+    la memoria queda acotada por el chat más grande. Si un chatId reaparece
+    después de cerrado se lanza ChatOrderError (usar process_data en ese caso).
+    Con `targets` solo se agrupan los chats buscados (ver target_filter).
+    """
+    wants = target_filter(targets)
+    seen = set()
+    current_id = None
+    current = []
+
+    for item in items:
+        chat_id = item.get('chat', {}).get('chatId')
+        if not chat_id:
+            continue
+        if wants is not None and not wants(chat_id, item):
+            continue
+        if chat_id != current_id:
+            if current:
+                current.sort(key=_time_key)
+                yield current_id, current
+            if chat_id in seen:
+                raise ChatOrderError(f"El chat '{chat_id}' aparece en bloques no contiguos del export.")
+            seen.add(chat_id)
+            current_id = chat_id
+            current = []
+        item[EPOCH_KEY] = parse_epoch(item.get('creationTime', ''))
+        current.append(item)
+
+    if current:
+        current.sort(key=_time_key)
+        yield current_id, current
+
+
+def _time_key(msg):
+    """Clave de orden cronológico de un mensaje."""
+    return msg.get('creationTime', '')
+
+
+def group_and_sort(items, targets=None):
     """
     Groups items by chatId and sorts them by creationTime.
+    Each item gets its parsed creationTime stored under EPOCH_KEY.
+    Con `targets` solo se agrupan los chats buscados (ver target_filter).
+
+    Única etapa que ordena: todos los mensajes se ordenan una sola vez por
+    (chat, creationTime), con los chats en orden de primera aparición, y cada
+    chat recibe su tramo contiguo del resultado. Las etapas siguientes
+    (sesiones, scoring) asumen mensajes ya ordenados y no vuelven a ordenar.
     """
-    grouped = defaultdict(list)
+    wants = target_filter(targets)
+    chat_rank = {}
+    keyed = []
     for item in items:
         chat_id = item.get('chat', {}).get('chatId')
-        if chat_id:
-            grouped[chat_id].append(item)
+        if chat_id and (wants is None or wants(chat_id, item)):
+            item[EPOCH_KEY] = parse_epoch(item.get('creationTime', ''))
+            rank = chat_rank.setdefault(chat_id, len(chat_rank))
+            keyed.append((rank, _time_key(item), item))
+
+    keyed.sort(key=lambda entry: (entry[0], entry[1]))
 
-    for chat_id in grouped:
-        grouped[chat_id].sort(key=lambda x: x.get('creationTime', ''))
+    grouped = {}
+    chat_ids = list(chat_rank)
+    start = 0
+    for end in range(1, len(keyed) + 1):
+        if end == len(keyed) or keyed[end][0] != keyed[start][0]:
+            grouped[chat_ids[keyed[start][0]]] = [entry[2] for entry in keyed[start:end]]
+            start = end
 
     return grouped
 
 
-def split_into_sessions(messages, gap_days=30):
+def split_into_sessions(messages, gap_days=None):
     """
     Divide los mensajes en sesiones de conversación basándose en pausas de tiempo.
-    Una pausa >= gap_days días entre mensajes consecutivos marca el inicio de una nueva sesión.
+    Una pausa >= gap_days días entre mensajes consecutivos marca el inicio de una nueva sesión
+    (por defecto, session_gap_days de las reglas en uso).
 
     Retorna lista de sesiones (cada sesión es una lista de mensajes), en orden cronológico.
     También retorna info sobre las pausas detectadas.
+
+    Espera `messages` ya ordenados cronológicamente (ver group_and_sort).
     """
     if not messages:
         return [], []
+    if gap_days is None:
+        gap_days = RULES.session_gap_days
 
-    sorted_msgs = sorted(messages, key=lambda x: x.get('creationTime', ''))
     sessions = []
     pauses = []  # (días de pausa, índice de sesión donde empieza)
-    current_session = [sorted_msgs[0]]
+    current_session = [messages[0]]
 
-    for msg in sorted_msgs[1:]:
-        prev_time_str = current_session[-1].get('creationTime', '').replace('Z', '+00:00')
-        curr_time_str = msg.get('creationTime', '').replace('Z', '+00:00')
-        try:
-            prev_dt = datetime.fromisoformat(prev_time_str)
-            curr_dt = datetime.fromisoformat(curr_time_str)
-            gap = (curr_dt - prev_dt).days
-            if gap >= gap_days:
-                sessions.append(current_session)
-                pauses.append(gap)
-                current_session = [msg]
-            else:
-                current_session.append(msg)
-        except Exception:
+    for msg in messages[1:]:
+        prev_epoch = message_epoch(current_session[-1])
+        curr_epoch = message_epoch(msg)
+        if prev_epoch is None or curr_epoch is None:
+            current_session.append(msg)
+            continue
+        gap = (curr_epoch - prev_epoch) // _US_PER_DAY
+        if gap >= gap_days:
+            sessions.append(current_session)
+            pauses.append(gap)
+            current_session = [msg]
+        else:
             current_session.append(msg)
 
     sessions.append(current_session)
@@ -186,7 +1234,290 @@ def split_into_sessions(messages, gap_days=30):
 # NUEVO SISTEMA DE SCORING
 # ============================================================================
 
-def check_spam(messages, user_messages):
+# ============================================================================
+# ESCÁNER DE KEYWORDS
+# ============================================================================
+
+class KeywordScanner:
+    """
+    Busca varias categorías de keywords en una sola pasada sobre un texto.
+
+    Cada categoría es un lookahead opcional con la alternación de sus keywords:
+    en cada posición todas las categorías se evalúan por separado y cada una
+    reporta la keyword de menor índice que calza ahí. Un lookahead obligatorio
+    con todas las keywords descarta rápido las posiciones sin ningún hit.
+
+    Con word_boundary=True las keywords se buscan como palabras completas
+    (r'\\b' + kw + r'\\b'); si no, como substrings (kw in text).
+    """
+
+    def __init__(self, categories, word_boundary=True):
+        self.categories = {name: list(keywords) for name, keywords in categories.items()}
+        boundary = r'\b' if word_boundary else ''
+
+        self._groups = []  # (categoría, índice del grupo inicial, keywords)
+        lookaheads = []
+        group = 1
+        for name, keywords in self.categories.items():
+            if not keywords:
+                continue
+            alternatives = '|'.join(f'({re.escape(kw)}){boundary}' for kw in keywords)
+            lookaheads.append(f'(?={boundary}(?:{alternatives}))?')
+            self._groups.append((name, group, keywords))
+            group += len(keywords)
+
+        any_keyword = '|'.join(
+            re.escape(kw) + boundary for keywords in self.categories.values() for kw in keywords
+        )
+        self._regex = re.compile(f'(?={boundary}(?:{any_keyword}))' + ''.join(lookaheads)) if any_keyword else None
+
+    def iter_hits(self, text, pos=0):
+        """
+        Genera (posición, categoría, índice de keyword) en orden de aparición.
+        Con `pos` solo se buscan hits que empiecen desde esa posición (los
+        límites de palabra siguen mirando el carácter anterior).
+        """
+        if self._regex is None:
+            return
+        for match in self._regex.finditer(text, pos):
+            groups = match.groups()
+            for name, first, keywords in self._groups:
+                for idx in range(len(keywords)):
+                    if groups[first - 1 + idx] is not None:
+                        yield match.start(), name, idx
+                        break
+
+    def scan(self, text):
+        """
+        Tabla {categoría: keyword} con la primera keyword *en el orden de la lista*
+        presente en el texto (None si la categoría no aparece).
+        """
+        best = {}
+        for _, name, idx in self.iter_hits(text):
+            if idx < best.get(name, len(self.categories[name])):
+                best[name] = idx
+        return {name: (keywords[best[name]] if name in best else None)
+                for name, keywords in self.categories.items()}
+
+
+# ============================================================================
+# REGLAS DE SCORING (ruleset.json, compiladas una sola vez por versión)
+# ============================================================================
+
+# Archivo de reglas por defecto: keywords, frases, patrones y puntos de cada señal
+RULESET_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ruleset.json')
+
+# Spam se busca como substring dentro de cada mensaje
+SPAM_CATEGORIES = ['no_data', 'hostile']
+
+# Categorías que se buscan como palabras completas sobre el texto del usuario
+MOTIVATION_CATEGORIES = ['strong_motivation', 'moderate_motivation', 'labor_impact', 'vague_motivation']
+USER_TEXT_CATEGORIES = [
+    'early_objection', 'soft_objection', 'payment_intent', 'payment_forms',
+    'price_inquiry', 'price_objection', 'no_pay', *MOTIVATION_CATEGORIES,
+]
+
+# Puntos que debe definir cada sección de "points"
+RULESET_POINTS = {
+    'motivation': [
+        'early_objection', 'soft_objection', 'strong_motivation', 'moderate_motivation',
+        'labor_impact', 'vague_motivation', 'max',
+    ],
+    'payment': [
+        'payment_intent', 'payment_forms', 'price_inquiry', 'no_pay', 'price_objection',
+        'file_after_payment_link', 'personal_data', 'max',
+    ],
+    'behavior': [
+        'no_reply', 'fast_response', 'fast_response_hours', 'moderate_response', 'moderate_response_hours',
+        'slow_response', 'user_started', 'follow_up', 'follow_up_messages', 'agent_last', 'media', 'max',
+    ],
+    'total': ['min', 'max', 'sql'],
+}
+
+
+def _string_list(value, where):
+    if not isinstance(value, list) or not all(isinstance(item, str) and item for item in value):
+        raise ValueError(f"{where} debe ser una lista de textos no vacíos.")
+    return list(value)
+
+
+class Ruleset:
+    """
+    Reglas de scoring compiladas a partir de la configuración de ruleset.json.
+
+    Al construirse valida la configuración (ValueError si falta algo o tiene
+    otro tipo) y compila una sola vez los escáneres de keywords y los
+    patrones; las funciones de scoring solo leen estos objetos. `digest`
+    identifica el contenido de las reglas, `version` es el número que se le
+    pone a mano en el archivo y `stamp` la (fecha de modificación, tamaño)
+    del archivo al leerlo (ver reload_ruleset).
+    """
+
+    def __init__(self, config, path=None, stamp=None):
+        if not isinstance(config, dict):
+            raise ValueError("El ruleset debe ser un objeto JSON.")
+        self.config = config
+        self.path = path
+        self.stamp = stamp
+        self.version = config.get('version')
+        if not isinstance(self.version, (int, str)) or isinstance(self.version, bool):
+            raise ValueError("El ruleset debe tener una 'version' (número o texto).")
+
+        keywords = config.get('keywords')
+        if not isinstance(keywords, dict):
+            raise ValueError("El ruleset debe tener un objeto 'keywords'.")
+        for name in [*SPAM_CATEGORIES, *USER_TEXT_CATEGORIES]:
+            if name not in keywords:
+                raise ValueError(f"Falta la categoría de keywords '{name}'.")
+            _string_list(keywords[name], f"keywords.{name}")
+        self.spam_scanner = KeywordScanner({name: keywords[name] for name in SPAM_CATEGORIES}, word_boundary=False)
+        self.user_text_scanner = KeywordScanner({name: keywords[name] for name in USER_TEXT_CATEGORIES})
+        self.motivation_scanner = KeywordScanner({name: keywords[name] for name in MOTIVATION_CATEGORIES})
+
+        self.negation_phrases = _string_list(config.get('negation_phrases'), "negation_phrases")
+        self.bot_payment_keywords = _string_list(config.get('bot_payment_keywords'), "bot_payment_keywords")
+        self.closing_keywords = _string_list(config.get('closing_keywords'), "closing_keywords")
+        try:
+            self.incoherent_patterns = [
+                re.compile(pattern) for pattern in _string_list(config.get('incoherent_patterns'), "incoherent_patterns")
+            ]
+        except re.error as e:
+            raise ValueError(f"Patrón inválido en incoherent_patterns: {e}")
+
+        self.session_gap_days = config.get('session_gap_days')
+        if not isinstance(self.session_gap_days, int) or isinstance(self.session_gap_days, bool) or self.session_gap_days < 1:
+            raise ValueError("'session_gap_days' debe ser un entero positivo.")
+
+        points = config.get('points')
+        if not isinstance(points, dict):
+            raise ValueError("El ruleset debe tener un objeto 'points'.")
+        self.points = {}
+        for section, names in RULESET_POINTS.items():
+            values = points.get(section)
+            if not isinstance(values, dict):
+                raise ValueError(f"Falta la sección points.{section}.")
+            for name in names:
+                value = values.get(name)
+                if not isinstance(value, (int, float)) or isinstance(value, bool):
+                    raise ValueError(f"points.{section}.{name} debe ser un número.")
+            self.points[section] = dict(values)
+
+        # Largo máximo de una keyword del texto del usuario o de una frase de negación
+        # (contexto que IncrementalScorer re-escanea al sumar un mensaje)
+        self.max_keyword_length = max(
+            len(kw) for keywords in [*self.user_text_scanner.categories.values(), self.negation_phrases]
+            for kw in keywords
+        )
+        self.digest = hashlib.blake2b(
+            json.dumps(config, sort_keys=True, ensure_ascii=False).encode('utf-8'), digest_size=8
+        ).hexdigest()
+        self._version_key = None
+
+    @classmethod
+    def from_file(cls, path):
+        """Lee y compila un ruleset desde un archivo JSON (ValueError si es inválido)."""
+        try:
+            stat = os.stat(path)
+            with open(path, 'r', encoding='utf-8') as f:
+                config = json.load(f)
+        except OSError as e:
+            raise ValueError(f"No se pudo leer el ruleset {path}: {e}")
+        except ValueError as e:
+            raise ValueError(f"{path} no es un JSON válido: {e}")
+        return cls(config, path, (stat.st_mtime_ns, stat.st_size))
+
+
+# Reglas en uso: las funciones de scoring las leen cuando no reciben `rules`
+RULES = Ruleset.from_file(RULESET_PATH)
+
+
+def load_ruleset(path=None):
+    """Reemplaza las reglas en uso por las de `path` (por defecto RULESET_PATH) y las retorna."""
+    global RULES
+    RULES = Ruleset.from_file(path or RULESET_PATH)
+    return RULES
+
+
+def set_ruleset(config):
+    """Reemplaza las reglas en uso por una configuración ya leída (p. ej. en los workers)."""
+    global RULES
+    RULES = Ruleset(config, RULES.path, RULES.stamp)
+    return RULES
+
+
+def reload_ruleset():
+    """
+    Recarga en caliente el archivo de las reglas en uso si cambió desde que se
+    leyó (fecha de modificación o tamaño). Retorna True si se cargaron reglas
+    nuevas. Si el archivo nuevo es inválido lanza ValueError y se siguen
+    usando las reglas anteriores.
+    """
+    global RULES
+    try:
+        stat = os.stat(RULES.path)
+    except OSError as e:
+        raise ValueError(f"No se pudo leer el ruleset {RULES.path}: {e}")
+    if (stat.st_mtime_ns, stat.st_size) == RULES.stamp:
+        return False
+    rules = Ruleset.from_file(RULES.path)
+    changed = rules.digest != RULES.digest
+    RULES = rules
+    return changed
+
+
+def scan_user_text(user_messages, rules=None):
+    """
+    Escanea una sola vez el texto normalizado del usuario y retorna la tabla de
+    hits {categoría: keyword o None} que leen check_spam,
+    calculate_motivation_score y calculate_payment_score.
+
+    - no_data / hostile: hits (substring) del primer mensaje que tenga alguno.
+    - motivación e impacto laboral: sobre el texto sin frases de negación.
+    - objeciones y pago: sobre el texto completo.
+
+    `rules` es el Ruleset a usar (por defecto, las reglas en uso).
+    """
+    rules = rules or RULES
+    spam_scanner = rules.spam_scanner
+    texts = [get_message_text(msg).lower() for msg in user_messages]
+
+    # Spam: se une con '\n' (ninguna keyword lo contiene) para no calzar entre mensajes
+    hits = {name: None for name in spam_scanner.categories}
+    spam_text = "\n".join(texts)
+    starts = list(accumulate((len(t) + 1 for t in texts[:-1]), initial=0))
+    first_msg = None
+    best = {}
+    for pos, name, idx in spam_scanner.iter_hits(spam_text):
+        msg_idx = bisect_right(starts, pos) - 1
+        if first_msg is None:
+            first_msg = msg_idx
+        elif msg_idx != first_msg:
+            break
+        if idx < best.get(name, len(spam_scanner.categories[name])):
+            best[name] = idx
+    for name, idx in best.items():
+        hits[name] = spam_scanner.categories[name][idx]
+
+    all_user_text = " ".join(texts)
+    hits.update(rules.user_text_scanner.scan(all_user_text))
+    hits.update(_scan_without_negations(all_user_text, rules))
+    return hits
+
+
+def _scan_without_negations(all_user_text, rules):
+    """
+    Fix #1: la motivación se busca en un texto limpio sin negaciones. Retorna
+    los hits de motivación sobre ese texto, o {} si no había negaciones.
+    """
+    clean_text = all_user_text
+    for neg in rules.negation_phrases:
+        clean_text = clean_text.replace(neg, "")
+    if clean_text != all_user_text:
+        return rules.motivation_scanner.scan(clean_text)
+    return {}
+
+
+def check_spam(messages, user_messages, hits=None, rules=None):
     """
     Verifica si el lead debe clasificarse como NO CONTACTADO.
     Retorna (is_spam, razon) si es NO CONTACTADO, (False, None) si no lo es.
@@ -195,64 +1526,44 @@ def check_spam(messages, user_messages):
     - Lead declara no haber dejado sus datos
     - Datos de contacto inválidos
     - Respuesta hostil, incoherente o sin sentido
+
+    `hits` es la tabla de scan_user_text (se calcula si no se entrega).
     """
-    signals = []
-    
-    # Keywords que indican que no dejó sus datos
-    no_data_keywords = [
-        "no dejé mis datos", "no deje mis datos",
-        "no solicité", "no solicite",
-        "no pedí", "no pedi",
-        "no me inscribí", "no me inscribi",
-        "número equivocado", "numero equivocado",
-        "no soy", "se equivocaron",
-        "no es mi número", "no es mi numero",
-        "no di mis datos", "no proporcioné", "no proporcione"
-    ]
-    
-    # Keywords que indican respuesta hostil o incoherente
-    hostile_keywords = [
-        "déjame en paz", "dejame en paz",
-        "no me molesten", "dejen de molestar",
-        "spam", "acoso", "denunciar",
-        "voy a denunciar", "bloqueado",
-        "idiota", "estúpido", "estupido",
-        "maldito", "basura", "porquería"
-    ]
-    
-    # Patrones de respuestas incoherentes (muy cortas o sin sentido)
-    incoherent_patterns = [
-        r'^[a-z]{1,2}$',  # Una o dos letras sueltas
-        r'^[0-9]{1,2}$',  # Uno o dos números sueltos
-        r'^\.+$',         # Solo puntos
-        r'^[?!]+$',       # Solo signos de puntuación
-    ]
-    
-    for msg in user_messages:
-        text = get_message_text(msg).lower()
-        
-        # Verificar si declara no haber dejado datos
-        for kw in no_data_keywords:
-            if kw in text:
-                return True, f"Lead declara no haber dejado sus datos: '{kw}'"
-        
-        # Verificar respuestas hostiles
-        for kw in hostile_keywords:
-            if kw in text:
-                return True, f"Respuesta hostil detectada: '{kw}'"
-        
-        # Verificar respuestas incoherentes (solo si es el único mensaje)
-        if len(user_messages) == 1 and len(text) < 5:
-            for pattern in incoherent_patterns:
-                if re.match(pattern, text.strip()):
+    rules = rules or RULES
+    if hits is None:
+        hits = scan_user_text(user_messages, rules)
+    single_user_text = get_message_text(user_messages[0]).lower() if len(user_messages) == 1 else None
+    return _spam_verdict(hits, single_user_text, rules)
+
+
+def _spam_verdict(hits, single_user_text, rules):
+    """
+    Reglas de check_spam sobre los hechos ya extraídos: la tabla de hits y el
+    texto (en minúsculas) del mensaje del usuario si es el único, o None.
+    """
+    # Verificar si declara no haber dejado datos
+    if hits['no_data']:
+        return True, f"Lead declara no haber dejado sus datos: '{hits['no_data']}'"
+
+    # Verificar respuestas hostiles
+    if hits['hostile']:
+        return True, f"Respuesta hostil detectada: '{hits['hostile']}'"
+
+    # Verificar respuestas incoherentes (solo si es el único mensaje)
+    if single_user_text is not None:
+        text = single_user_text
+        if len(text) < 5:
+            for pattern in rules.incoherent_patterns:
+                if pattern.match(text.strip()):
                     return True, "Respuesta incoherente o sin sentido"
     
     return False, None
 
 
-def calculate_motivation_score(messages, user_messages):
+def calculate_motivation_score(messages, user_messages, hits=None, rules=None):
     """
     Calcula el puntaje de motivación del lead (hasta 40 puntos).
+    Los puntos son los de points.motivation del ruleset (valores por defecto):
     
     +25: Motivación profesional fuerte
     +15: Motivación profesional moderada / Impacto laboral
@@ -260,275 +1571,122 @@ def calculate_motivation_score(messages, user_messages):
     0:   Sin motivación declarada
     -10: Objeciones fuertes
     -5:  Objeciones suaves
+
+    `hits` es la tabla de scan_user_text (se calcula si no se entrega).
     """
+    rules = rules or RULES
+    points = rules.points['motivation']
     score = 0
     signals = []
     has_professional_motivation = False
     
-    # Keywords de motivación profesional fuerte (+25)
-    strong_motivation_keywords = [
-        "trabajo", "ascenso", "profesional", "laboral",
-        "crecer", "crecimiento", "reconvertir", "reconversión",
-        "actualización", "actualizarme", "actualizado",
-        "mejorar perfil", "mejorar profesional", "mejorar",
-        "superación", "carrera profesional",
-        "brochure", "me interesa mucho", "muy interesado",
-        "necesito capacitarme", "quiero especializarme",
-        "necesito", "especialista", "especialización"
-    ]
-    
-    # NEW: Keywords de motivación profesional moderada (+15)
-    moderate_motivation_keywords = [
-        "me interesa", "herramientas", "destrezas", "competencias",
-        "pacientes", "atención", "formación", "entrenamiento"
-    ]
-    
-    # Keywords de impacto laboral concreto (+15)
-    labor_impact_keywords = [
-        "puesto", "salario", "sueldo", "aumento",
-        "empresa", "promoción", "ascender",
-        "jefe", "gerente", "director",
-        "cv", "curriculum", "currículum",
-        "conseguir empleo", "buscar trabajo", "nuevo trabajo"
-    ]
-    
-    # Keywords de motivación vaga (+5)
-    vague_motivation_keywords = [
-        "me interesa aprender", "quiero aprender",
-        "me gustaría saber", "me gustaria saber",
-        "por curiosidad", "solo información", "solo informacion",
-        "ampliar conocimientos", "adquirir conocimientos", "conocimientos"
-    ]
-    
-    # Keywords de objeciones fuertes (-10)
-    early_objection_keywords = [
-        "no me interesa", "solo miro", "solo mirando",
-        "no estoy interesado", "no estoy seguro",
-        "no estoy buscando"
-    ]
-    
-    # Keywords de objeciones suaves (-5)
-    soft_objection_keywords = [
-        "la consideraré", "la considerare",
-        "lo consideraré", "lo considerare",
-        "lo voy a pensar", "lo pensaré", "lo pensare",
-        "tengo que pensar", "tengo que pensarlo",
-        "tal vez después", "tal vez despues",
-        "quizás más adelante", "quizas mas adelante",
-        "no sé", "no se", "después veo", "despues veo",
-        "otro momento", "presupuesto"
-    ]
-    
-    # Fix #1: Frases de negación para filtrar antes de buscar motivación
-    negation_phrases = [
-        "no me interesa", "no necesito", "no me importa",
-        "no quiero", "no busco", "no estoy interesado"
-    ]
-    
-    all_user_text = " ".join([get_message_text(msg).lower() for msg in user_messages])
-    
-    # Fix #1: Crear texto limpio sin negaciones para buscar motivación
-    clean_text = all_user_text
-    for neg in negation_phrases:
-        clean_text = clean_text.replace(neg, "")
-    
-    # Helper para buscar keywords como palabras completas para evitar falsos positivos (ej: presupuesto -> puesto)
-    def contains_word(text, word):
-        pattern = r'\b' + re.escape(word) + r'\b'
-        return re.search(pattern, text) is not None
+    # Las keywords se buscan como palabras completas para evitar falsos positivos (ej: presupuesto -> puesto)
+    if hits is None:
+        hits = scan_user_text(user_messages, rules)
 
     # Verificar objeciones PRIMERO (Fix #1: antes de motivación)
     has_strong_objection = False
-    for kw in early_objection_keywords:
-        if contains_word(all_user_text, kw):
-            score -= 10
-            has_strong_objection = True
-            signals.append(f"Objeción fuerte: '{kw}'")
-            break
+    kw = hits['early_objection']
+    if kw:
+        score += points['early_objection']
+        has_strong_objection = True
+        signals.append(f"Objeción fuerte: '{kw}'")
     
     # Verificar objeciones suaves (-5)
     if not has_strong_objection:
-        for kw in soft_objection_keywords:
-            if contains_word(all_user_text, kw):
-                score -= 5
-                signals.append(f"Objeción suave: '{kw}'")
-                break
+        kw = hits['soft_objection']
+        if kw:
+            score += points['soft_objection']
+            signals.append(f"Objeción suave: '{kw}'")
     
     # Verificar motivación profesional fuerte (+25) usando texto limpio
-    for kw in strong_motivation_keywords:
-        if contains_word(clean_text, kw):
-            if not has_professional_motivation:
-                score += 25
-                has_professional_motivation = True
-                signals.append(f"Motivación profesional fuerte: '{kw}'")
-            break
-    
-    # Fix #5: Verificar motivación moderada (+15) - solo si no tiene fuerte
-    if not has_professional_motivation:
-        for kw in moderate_motivation_keywords:
-            if contains_word(clean_text, kw):
-                score += 15
-                has_professional_motivation = True
-                signals.append(f"Motivación profesional moderada: '{kw}'")
-                break
-    
-    # Verificar impacto laboral concreto (+15)
-    if not has_professional_motivation:
-        for kw in labor_impact_keywords:
-            if contains_word(clean_text, kw):
-                score += 15
-                signals.append(f"Impacto laboral concreto: '{kw}'")
-                break
-    else:
-        # Si ya tiene motivación, agregar +15 si también menciona impacto laboral
-        for kw in labor_impact_keywords:
-            if contains_word(clean_text, kw):
-                score += 15
-                signals.append(f"Impacto laboral adicional: '{kw}'")
-                break # Solo sumar una vez
-    
-    # Verificar motivación vaga (+5) - Solo si no tiene otras motivaciones positivas
-    if score <= 0:
-        for kw in vague_motivation_keywords:
-            if contains_word(clean_text, kw):
-                score += 5
-                signals.append(f"Motivación vaga: '{kw}'")
-                break
-    
-    # Cap score at 40
-    score = min(score, 40)
-    
-    return score, signals, has_professional_motivation
-
-
-def calculate_payment_score(messages, user_messages):
-    """
-    Calcula el puntaje de intención y capacidad de pago (hasta 30 puntos).
-    
-    +30: Puede pagar / evalúa invertir
-    +20: Consulta formas de pago o cuotas
-    +5:  Pregunta solo precio sin compromiso
-    -15: Objeción de precio
-    -30: Declara que no va a pagar
-    """
-    score = 0
-    signals = []
-    has_payment_intent = False
-    
-    # Fix #2: Keywords de intención de pago (+30) - Solo frases con acción, sin "pago" suelto
-    payment_intent_keywords = [
-        "pagar", "transferencia", "comprobante",
-        "depósito", "deposito", "depositar",
-        "tarjeta", "cupón", "cupon",
-        "ya pagué", "ya pague", "listo el pago",
-        "voy a pagar", "quiero pagar", "cómo pago", "como pago",
-        "envié el pago", "envie el pago",
-        "link de pago", "enlace de pago", "ya está", "ya esta"
-    ]
-    
-    # Keywords de consulta de formas de pago / inscripción (+20)
-    payment_forms_keywords = [
-        "cuotas", "financiamiento", "financiar",
-        "formas de pago", "métodos de pago", "metodos de pago",
-        "pago en cuotas", "a plazos", "plazo",
-        "pueden financiar", "hay descuento", "descuentos",
-        "beca", "becas", "ayuda financiera",
-        "requisitos", "desde cuando comienza", "desde cuándo comienza",
-        "cuándo inicia", "cuando inicia", "cuándo empieza", "cuando empieza",
-        "cómo me inscribo", "como me inscribo", "inscribirme", "matricularme"
-    ]
-    
-    # Keywords de consulta de precio (+5)
-    price_inquiry_keywords = [
-        "precio", "costo", "valor", "cuánto cuesta", "cuanto cuesta",
-        "cuánto vale", "cuanto vale", "inversión", "inversion",
-        "qué precio", "que precio", "qué cuesta", "que cuesta"
-    ]
+    kw = hits['strong_motivation']
+    if kw:
+        score += points['strong_motivation']
+        has_professional_motivation = True
+        signals.append(f"Motivación profesional fuerte: '{kw}'")
     
-    # Fix #3: Keywords de objeción de precio (-15) - Solo las específicas de precio
-    price_objection_keywords = [
-        "caro", "muy caro", "costoso", "no puedo pagar",
-        "no tengo dinero", "no tengo plata",
-        "por ahora no",
-        "no es para mí", "no es para mi"
-    ]
-    
-    # Keywords de declaración de no pagar (-30)
-    no_pay_keywords = [
-        "no voy a pagar", "no pagaré", "no pagare",
-        "gratis", "no tengo para pagar",
-        "no puedo invertir", "imposible pagar",
-        "fuera de mi presupuesto", "no me alcanza"
-    ]
-    
-    all_user_text = " ".join([get_message_text(msg).lower() for msg in user_messages])
-    
-    # Helper para buscar keywords como palabras completas
-    def contains_word(text, word):
-        pattern = r'\b' + re.escape(word) + r'\b'
-        return re.search(pattern, text) is not None
-
-    # Verificar intención de pago (+30)
-    for kw in payment_intent_keywords:
-        if contains_word(all_user_text, kw):
-            score += 30
-            has_payment_intent = True
-            signals.append(f"Intención de pago: '{kw}'")
-            break
-    
-    # Verificar consulta de formas de pago (+20) - Solo si no tiene intención de pago directa
-    if not has_payment_intent:
-        for kw in payment_forms_keywords:
-            if contains_word(all_user_text, kw):
-                score += 20
-                has_payment_intent = True
-                signals.append(f"Consulta formas de pago: '{kw}'")
-                break
+    # Fix #5: Verificar motivación moderada (+15) - solo si no tiene fuerte
+    if not has_professional_motivation:
+        kw = hits['moderate_motivation']
+        if kw:
+            score += points['moderate_motivation']
+            has_professional_motivation = True
+            signals.append(f"Motivación profesional moderada: '{kw}'")
     
-    # Verificar consulta de precio (+5) - Solo si no tiene otras señales positivas
-    if score == 0:
-        for kw in price_inquiry_keywords:
-            if contains_word(all_user_text, kw):
-                score += 5
-                signals.append(f"Consulta de precio: '{kw}'")
-                break
+    # Verificar impacto laboral concreto (+15)
+    kw = hits['labor_impact']
+    if kw:
+        score += points['labor_impact']
+        if not has_professional_motivation:
+            signals.append(f"Impacto laboral concreto: '{kw}'")
+        else:
+            # Si ya tiene motivación, el impacto laboral suma como adicional (solo una vez)
+            signals.append(f"Impacto laboral adicional: '{kw}'")
     
-    # Verificar declaración de no pagar (-30) - Tiene prioridad sobre objeción
-    no_pay_found = False
-    for kw in no_pay_keywords:
-        if contains_word(all_user_text, kw):
-            score -= 30
-            no_pay_found = True
-            signals.append(f"Declara no pagar: '{kw}'")
-            break
+    # Verificar motivación vaga (+5) - Solo si no tiene otras motivaciones positivas
+    if score <= 0:
+        kw = hits['vague_motivation']
+        if kw:
+            score += points['vague_motivation']
+            signals.append(f"Motivación vaga: '{kw}'")
     
-    # Verificar objeción de precio (-15) - Solo si no declaró que no pagará
-    if not no_pay_found:
-        for kw in price_objection_keywords:
-            if contains_word(all_user_text, kw):
-                score -= 15
-                signals.append(f"Objeción de precio: '{kw}'")
-                break
+    # Cap score at 40
+    score = min(score, points['max'])
     
+    return score, signals, has_professional_motivation
+
+
+def calculate_payment_score(messages, user_messages, hits=None, rules=None):
+    """
+    Calcula el puntaje de intención y capacidad de pago (hasta 30 puntos).
+    Los puntos son los de points.payment del ruleset (valores por defecto):
     
+    +30: Puede pagar / evalúa invertir
+    +20: Consulta formas de pago o cuotas
+    +5:  Pregunta solo precio sin compromiso
+    -15: Objeción de precio
+    -30: Declara que no va a pagar
+
+    `hits` es la tabla de scan_user_text (se calcula si no se entrega).
+    """
+    rules = rules or RULES
+    if hits is None:
+        hits = scan_user_text(user_messages, rules)
+    return _payment_score(hits, payment_facts(messages, user_messages, rules), rules)
+
+
+def bot_sent_payment_info(text, rules=None):
+    """Si el texto (en minúsculas) de un mensaje del bot/agente trae un link o instrucciones de pago."""
+    return any(kw in text for kw in (rules or RULES).bot_payment_keywords)
+
+
+def personal_data_kind(text):
+    """'email' o 'cedula' si el texto de un mensaje del usuario trae ese dato personal, si no None."""
+    # Detectar email
+    if re.search(r'[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}', text):
+        return 'email'
+    # Detectar cédula (10+ dígitos seguidos)
+    if re.search(r'\b\d{10,13}\b', text):
+        return 'cedula'
+    return None
 
-    # Verificar si el usuario envió una imagen o archivo POSTERIOR a un link/instrucciones de pago del bot
+
+def payment_facts(messages, user_messages, rules=None):
+    """
+    Hechos de los mensajes que usa el puntaje de pago:
+    - file_after_payment_link: el usuario envió una imagen o archivo POSTERIOR
+      a un link/instrucciones de pago del bot.
+    - personal_data: dato personal ('email' / 'cedula') del primer mensaje del
+      usuario que trae alguno, o None.
+    """
     has_image_or_file = False
     payment_link_sent_by_bot = False
-    
-    # Keywords que indican que el bot envió instrucciones de pago
-    bot_payment_keywords = [
-        "link", "enlace", "pago", "pagar", "cuenta", "transferencia", 
-        "cbu", "alias", "banco", "depósito", "deposito",
-        "aquí tienes", "aqui tienes", "pasos para", "instrucciones"
-    ]
 
     # Iterar cronológicamente para ver el flujo
-    # Asumimos que 'messages' está ordenado cronológicamente
+    # 'messages' llega ordenado cronológicamente desde group_and_sort
     if messages:
-        sorted_msgs = sorted(messages, key=lambda x: x.get('creationTime', ''))
-        
-        for msg in sorted_msgs:
+        for msg in messages:
             role = msg.get('from')
             content = msg.get('content', {})
             text = ""
@@ -537,7 +1695,7 @@ def calculate_payment_score(messages, user_messages):
             
             if role in ['bot', 'agent']:
                 # Chequear si el bot envió info de pago
-                if any(kw in text for kw in bot_payment_keywords):
+                if bot_sent_payment_info(text, rules):
                     payment_link_sent_by_bot = True
             
             elif role == 'user':
@@ -548,41 +1706,90 @@ def calculate_payment_score(messages, user_messages):
                     if payment_link_sent_by_bot:
                         has_image_or_file = True
                         break # Ya encontramos la prueba, no necesitamos seguir buscando
+
+    # Fix #6: solo cuenta el primer mensaje con email o cédula
+    personal_data = None
+    for msg in user_messages:
+        personal_data = personal_data_kind(get_message_text(msg))
+        if personal_data:
+            break
+
+    return {'file_after_payment_link': has_image_or_file, 'personal_data': personal_data}
+
+
+def _payment_score(hits, facts, rules):
+    """Reglas de calculate_payment_score sobre la tabla de hits y payment_facts."""
+    points = rules.points['payment']
+    score = 0
+    signals = []
+    has_payment_intent = False
+
+    # Verificar intención de pago (+30)
+    kw = hits['payment_intent']
+    if kw:
+        score += points['payment_intent']
+        has_payment_intent = True
+        signals.append(f"Intención de pago: '{kw}'")
+    
+    # Verificar consulta de formas de pago (+20) - Solo si no tiene intención de pago directa
+    if not has_payment_intent:
+        kw = hits['payment_forms']
+        if kw:
+            score += points['payment_forms']
+            has_payment_intent = True
+            signals.append(f"Consulta formas de pago: '{kw}'")
+    
+    # Verificar consulta de precio (+5) - Solo si no tiene otras señales positivas
+    if score == 0:
+        kw = hits['price_inquiry']
+        if kw:
+            score += points['price_inquiry']
+            signals.append(f"Consulta de precio: '{kw}'")
     
-    if has_image_or_file:
+    # Verificar declaración de no pagar (-30) - Tiene prioridad sobre objeción
+    no_pay_found = False
+    kw = hits['no_pay']
+    if kw:
+        score += points['no_pay']
+        no_pay_found = True
+        signals.append(f"Declara no pagar: '{kw}'")
+    
+    # Verificar objeción de precio (-15) - Solo si no declaró que no pagará
+    if not no_pay_found:
+        kw = hits['price_objection']
+        if kw:
+            score += points['price_objection']
+            signals.append(f"Objeción de precio: '{kw}'")
+
+    if facts['file_after_payment_link']:
         # Si envía imagen DESPUÉS del link, asumimos que es comprobante
-        if score < 30:
-            score += 25
+        if score < points['max']:
+            score += points['file_after_payment_link']
             has_payment_intent = True
             signals.append("Envío de archivo/imagen tras link de pago")
 
     # Fix #6: Detectar envío de datos personales (email, cédula)
-    for msg in user_messages:
-        text = get_message_text(msg)
-        # Detectar email
-        if re.search(r'[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}', text):
-            if score < 30:
-                score += 20
-                has_payment_intent = True
-                signals.append("Envío de datos personales (email)")
-            break
-        # Detectar cédula (10+ dígitos seguidos)
-        if re.search(r'\b\d{10,13}\b', text):
-            if score < 30:
-                score += 20
-                has_payment_intent = True
-                signals.append("Envío de datos personales (cédula/ID)")
-            break
+    if facts['personal_data'] == 'email':
+        if score < points['max']:
+            score += points['personal_data']
+            has_payment_intent = True
+            signals.append("Envío de datos personales (email)")
+    elif facts['personal_data'] == 'cedula':
+        if score < points['max']:
+            score += points['personal_data']
+            has_payment_intent = True
+            signals.append("Envío de datos personales (cédula/ID)")
 
     # Cap score at 30 (can be negative)
-    score = min(score, 30)
+    score = min(score, points['max'])
     
     return score, signals, has_payment_intent
 
 
-def calculate_behavior_score(messages, user_messages):
+def calculate_behavior_score(messages, user_messages, rules=None):
     """
     Calcula el puntaje de comportamiento y timing (hasta 30 puntos).
+    Los puntos y umbrales son los de points.behavior del ruleset (valores por defecto):
     
     +20: Respuesta < 8 horas
     +10: Respuesta entre 8 y 24 horas
@@ -590,85 +1797,100 @@ def calculate_behavior_score(messages, user_messages):
     +10: Inicia conversación / seguimiento activo
     -10: No responde (ghosting)
     """
-    score = 0
-    signals = []
-    
-    # Si no hay mensajes del usuario, es ghosting
-    if not user_messages:
-        score -= 10
-        signals.append("No responde (ghosting)")
-        return score, signals
-    
-    # Calcular tiempo de respuesta
+    return _behavior_score(behavior_facts(messages, user_messages), rules or RULES)
+
+
+def behavior_facts(messages, user_messages):
+    """
+    Hechos de los mensajes que usa el puntaje de comportamiento: cantidad de
+    mensajes del usuario, primer mensaje del bot y primera respuesta del
+    usuario (epochs), quién abrió y quién cerró la conversación y si el
+    usuario envió audio/video.
+    """
     # Buscar el primer mensaje del bot y el primer mensaje del usuario después
     first_bot_time = None
     first_user_response_time = None
     
     for msg in messages:
         role = msg.get('from')
-        creation_time = msg.get('creationTime', '')
         
         if role in ['bot', 'agent'] and first_bot_time is None:
-            try:
-                first_bot_time = datetime.fromisoformat(creation_time.replace('Z', '+00:00'))
-            except:
-                pass
+            first_bot_time = message_epoch(msg)
         elif role == 'user' and first_bot_time is not None and first_user_response_time is None:
-            try:
-                first_user_response_time = datetime.fromisoformat(creation_time.replace('Z', '+00:00'))
-            except:
-                pass
+            first_user_response_time = message_epoch(msg)
             break
+
+    return {
+        'user_messages': len(user_messages),
+        'first_bot_time': first_bot_time,
+        'first_user_response_time': first_user_response_time,
+        'user_started': bool(messages) and messages[0].get('from') == 'user',
+        'agent_last': bool(messages) and messages[-1].get('from') in ['bot', 'agent'],
+        'user_media': any(msg.get('content', {}).get('type') in ['audio', 'video', 'ptt'] for msg in user_messages),
+    }
+
+
+def _behavior_score(facts, rules):
+    """Reglas de calculate_behavior_score sobre behavior_facts."""
+    points = rules.points['behavior']
+    score = 0
+    signals = []
     
-    # Calcular diferencia de tiempo
-    if first_bot_time and first_user_response_time:
-        response_time = first_user_response_time - first_bot_time
-        hours = response_time.total_seconds() / 3600
+    # Si no hay mensajes del usuario, es ghosting
+    if not facts['user_messages']:
+        score += points['no_reply']
+        signals.append("No responde (ghosting)")
+        return score, signals
+    
+    # Calcular tiempo de respuesta
+    first_bot_time = facts['first_bot_time']
+    first_user_response_time = facts['first_user_response_time']
+    
+    # Calcular diferencia de tiempo (epochs en microsegundos)
+    if first_bot_time is not None and first_user_response_time is not None:
+        response_seconds = (first_user_response_time - first_bot_time) / 1_000_000
+        hours = response_seconds / 3600
+        fast_hours = points['fast_response_hours']
+        moderate_hours = points['moderate_response_hours']
         
-        if hours < 8:
-            score += 20
-            signals.append(f"Respuesta rápida: < 8 horas ({hours:.1f}h)")
-        elif hours < 24:
-            score += 10
-            signals.append(f"Respuesta moderada: 8-24 horas ({hours:.1f}h)")
+        if hours < fast_hours:
+            score += points['fast_response']
+            signals.append(f"Respuesta rápida: < {fast_hours:g} horas ({hours:.1f}h)")
+        elif hours < moderate_hours:
+            score += points['moderate_response']
+            signals.append(f"Respuesta moderada: {fast_hours:g}-{moderate_hours:g} horas ({hours:.1f}h)")
         else:
-            score += 5
-            signals.append(f"Respuesta lenta: > 24 horas ({hours:.1f}h)")
+            score += points['slow_response']
+            signals.append(f"Respuesta lenta: > {moderate_hours:g} horas ({hours:.1f}h)")
     else:
         # Si el usuario inició la conversación
-        if messages and messages[0].get('from') == 'user':
-            score += 10
+        if facts['user_started']:
+            score += points['user_started']
             signals.append("Usuario inició la conversación")
     
     # Verificar si el usuario hace seguimiento activo (envía múltiples mensajes)
-    if len(user_messages) >= 3:
-        score += 10
+    if facts['user_messages'] >= points['follow_up_messages']:
+        score += points['follow_up']
         signals.append("Seguimiento activo (múltiples mensajes)")
     
     # Verificar si el usuario inició la conversación
-    if messages and messages[0].get('from') == 'user':
+    if facts['user_started']:
         if "Usuario inició la conversación" not in signals:
-            score += 10
+            score += points['user_started']
             signals.append("Usuario inició la conversación")
     
     # Fix #4: Detectar ghosting parcial (último mensaje es del bot/agente)
-    if messages and user_messages:
-        sorted_msgs = sorted(messages, key=lambda x: x.get('creationTime', ''))
-        last_msg = sorted_msgs[-1]
-        if last_msg.get('from') in ['bot', 'agent']:
-            score -= 5
-            signals.append("Ghosting parcial (último mensaje del agente sin respuesta)")
+    if facts['agent_last']:
+        score += points['agent_last']
+        signals.append("Ghosting parcial (último mensaje del agente sin respuesta)")
     
     # Fix #7: Detectar envío de audio/video como señal de engagement
-    for msg in user_messages:
-        content_type = msg.get('content', {}).get('type')
-        if content_type in ['audio', 'video', 'ptt']:
-            score += 5
-            signals.append("Engagement: envío de audio/video")
-            break
+    if facts['user_media']:
+        score += points['media']
+        signals.append("Engagement: envío de audio/video")
     
     # Cap score at 30
-    score = min(score, 30)
+    score = min(score, points['max'])
     
     return score, signals
 
@@ -692,7 +1914,7 @@ def _format_duration(delta):
     return f"{hours:02}:{minutes:02}:{seconds:02}"
 
 
-def analyze_conversation(chat_id, messages):
+def analyze_conversation(chat_id, messages, rules=None):
     """
     Analiza una conversación para clasificar el lead usando el nuevo sistema de scoring.
 
@@ -703,45 +1925,88 @@ def analyze_conversation(chat_id, messages):
 
     Regla prioritaria: Motivación profesional + Intención de pago = SQL
 
-    Sesiones: si hay una pausa >= 30 días, se considera que el lead volvió a
-    contactarse. El scoring se basa únicamente en la última sesión.
+    Sesiones: si hay una pausa >= 30 días (session_gap_days), se considera que
+    el lead volvió a contactarse. El scoring se basa únicamente en la última sesión.
+
+    `messages` debe venir ordenado cronológicamente (group_and_sort / iter_chats).
+    `rules` es el Ruleset a usar (por defecto, las reglas en uso).
+    """
+    rules = rules or RULES
+    return classify_conversation(chat_id, conversation_facts(messages, rules), rules)
+
+
+def conversation_facts(messages, rules=None):
     """
+    Extrae de los mensajes (ordenados) todo lo que usan las reglas de
+    classify_conversation: teléfono, sesiones, epochs para las duraciones,
+    textos del usuario de la sesión activa, la tabla de hits y los hechos de
+    pago y comportamiento. IncrementalScorer mantiene los mismos hechos
+    mensaje a mensaje.
+    """
+    rules = rules or RULES
     # Extraer teléfono
     telefono = ""
     if messages:
         telefono = messages[0].get('chat', {}).get('contactId', "")
 
     # --- DETECCIÓN DE SESIONES ---
-    sessions, pauses = split_into_sessions(messages, gap_days=30)
-    num_sessions = len(sessions)
+    sessions, pauses = split_into_sessions(messages, gap_days=rules.session_gap_days)
 
     # Mensajes a usar para scoring: solo la última sesión si hay reactivación
     scoring_messages = sessions[-1] if sessions else messages
+
+    # Identificar mensajes del usuario (de la sesión activa)
+    user_messages = [m for m in scoring_messages if m.get('from') == 'user']
+
+    facts = {
+        'telefono': telefono,
+        'sessions': len(sessions),
+        'max_pause_days': max(pauses) if pauses else 0,
+        'start_epoch': message_epoch(messages[0]) if messages else None,
+        'end_epoch': message_epoch(messages[-1]) if messages else None,
+        'session_start_epoch': message_epoch(scoring_messages[0]) if scoring_messages else None,
+        'session_end_epoch': message_epoch(scoring_messages[-1]) if scoring_messages else None,
+        'user_messages': len(user_messages),
+    }
+    if user_messages:
+        facts.update({
+            'single_user_text': get_message_text(user_messages[0]).lower() if len(user_messages) == 1 else None,
+            'last_user_text': get_message_text(user_messages[-1]).lower(),
+            # Escanear una sola vez el texto del usuario para todas las categorías
+            'hits': scan_user_text(user_messages, rules),
+            'payment': payment_facts(scoring_messages, user_messages, rules),
+            'behavior': behavior_facts(scoring_messages, user_messages),
+        })
+    return facts
+
+
+def classify_conversation(chat_id, facts, rules=None):
+    """Aplica las reglas de scoring a los hechos de conversation_facts y arma la fila del lead."""
+    rules = rules or RULES
+    telefono = facts['telefono']
+    num_sessions = facts['sessions']
     reactivated = num_sessions > 1
-    max_pause_days = max(pauses) if pauses else 0
+    max_pause_days = facts['max_pause_days']
 
     # --- CALCULAR DURACIÓN TOTAL Y DE ÚLTIMA SESIÓN ---
     duracion_chat = "0:00:00"
     duracion_ultima_sesion = None
     try:
-        sorted_all = sorted(messages, key=lambda x: x.get('creationTime', ''))
-        start_dt = datetime.fromisoformat(sorted_all[0].get('creationTime', '').replace('Z', '+00:00'))
-        end_dt = datetime.fromisoformat(sorted_all[-1].get('creationTime', '').replace('Z', '+00:00'))
-        duracion_chat = _format_duration(end_dt - start_dt)
-
-        if reactivated:
-            sess_sorted = sorted(scoring_messages, key=lambda x: x.get('creationTime', ''))
-            sess_start = datetime.fromisoformat(sess_sorted[0].get('creationTime', '').replace('Z', '+00:00'))
-            sess_end = datetime.fromisoformat(sess_sorted[-1].get('creationTime', '').replace('Z', '+00:00'))
-            duracion_ultima_sesion = _format_duration(sess_end - sess_start)
+        start_epoch = facts['start_epoch']
+        end_epoch = facts['end_epoch']
+        if start_epoch is not None and end_epoch is not None:
+            duracion_chat = _format_duration(timedelta(microseconds=end_epoch - start_epoch))
+
+            if reactivated:
+                sess_start = facts['session_start_epoch']
+                sess_end = facts['session_end_epoch']
+                if sess_start is not None and sess_end is not None:
+                    duracion_ultima_sesion = _format_duration(timedelta(microseconds=sess_end - sess_start))
     except Exception:
         pass
 
-    # Identificar mensajes del usuario (de la sesión activa)
-    user_messages = [m for m in scoring_messages if m.get('from') == 'user']
-
     # Si no hay mensajes del usuario en la sesión activa, NO CONTACTADO
-    if not user_messages:
+    if not facts['user_messages']:
         return {
             "chat_id": chat_id,
             "telefono": telefono,
@@ -758,8 +2023,10 @@ def analyze_conversation(chat_id, messages):
             "sesiones_detectadas": num_sessions,
         }
 
+    hits = facts['hits']
+
     # 1. VERIFICAR NO CONTACTADO (solo sobre la sesión activa)
-    is_spam, spam_reason = check_spam(scoring_messages, user_messages)
+    is_spam, spam_reason = _spam_verdict(hits, facts['single_user_text'], rules)
     if is_spam:
         return {
             "chat_id": chat_id,
@@ -773,7 +2040,7 @@ def analyze_conversation(chat_id, messages):
             "señales_clave": ["No Contactado detectado"],
             "estado_conversacion": "Descartado",
             "duracion_chat": duracion_chat,
-            "mensajes_usuario": len(user_messages),
+            "mensajes_usuario": facts['user_messages'],
             "sesiones_detectadas": num_sessions,
         }
 
@@ -786,18 +2053,19 @@ def analyze_conversation(chat_id, messages):
             f"({num_sessions} sesiones detectadas)"
         )
 
-    motivation_score, motivation_signals, has_professional_motivation = calculate_motivation_score(scoring_messages, user_messages)
+    motivation_score, motivation_signals, has_professional_motivation = calculate_motivation_score(None, None, hits, rules)
     all_signals.extend(motivation_signals)
 
-    payment_score, payment_signals, has_payment_intent = calculate_payment_score(scoring_messages, user_messages)
+    payment_score, payment_signals, has_payment_intent = _payment_score(hits, facts['payment'], rules)
     all_signals.extend(payment_signals)
 
-    behavior_score, behavior_signals = calculate_behavior_score(scoring_messages, user_messages)
+    behavior_score, behavior_signals = _behavior_score(facts['behavior'], rules)
     all_signals.extend(behavior_signals)
 
     # 3. CALCULAR SCORE TOTAL
     total_score = motivation_score + payment_score + behavior_score
-    total_score = max(1, min(total_score, 100))
+    total_points = rules.points['total']
+    total_score = max(total_points['min'], min(total_score, total_points['max']))
 
     # 4. APLICAR REGLA PRIORITARIA
     priority_rule_applied = False
@@ -809,7 +2077,7 @@ def analyze_conversation(chat_id, messages):
     if priority_rule_applied:
         classification = "SQL"
         reason = "Regla prioritaria: Motivación profesional clara + Intención de pago"
-    elif total_score >= 50:
+    elif total_score >= total_points['sql']:
         classification = "SQL"
         reason = f"Score alto ({total_score}/100) - Derivar a Ventas"
     else:
@@ -818,8 +2086,8 @@ def analyze_conversation(chat_id, messages):
 
     # 6. DETERMINAR ESTADO DE CONVERSACIÓN
     estado = "Activa"
-    last_user_text = get_message_text(user_messages[-1]).lower() if user_messages else ""
-    if "gracias" in last_user_text or "adios" in last_user_text or "adiós" in last_user_text:
+    last_user_text = facts['last_user_text']
+    if any(kw in last_user_text for kw in rules.closing_keywords):
         estado = "Cerrada por usuario"
 
     result = {
@@ -831,10 +2099,10 @@ def analyze_conversation(chat_id, messages):
         "score_pago": payment_score,
         "score_comportamiento": behavior_score,
         "razon_principal": reason,
-        "señales_clave": list(set(all_signals)),
+        "señales_clave": sorted(set(all_signals)),
         "estado_conversacion": estado,
         "duracion_chat": duracion_chat,
-        "mensajes_usuario": len(user_messages),
+        "mensajes_usuario": facts['user_messages'],
         "sesiones_detectadas": num_sessions,
     }
 
@@ -845,46 +2113,702 @@ def analyze_conversation(chat_id, messages):
     return result
 
 
-def process_data(json_data, neotel_df=None):
+class IncrementalScorer:
+    """
+    Clasificación en línea de un chat: mantiene los mismos hechos que
+    conversation_facts (hits de keywords, primer mensaje del bot y primera
+    respuesta, instrucciones de pago enviadas, inicio de la sesión activa,
+    mensajes del usuario...) y los actualiza con cada mensaje nuevo en
+    O(largo del mensaje), sin volver a recorrer la conversación.
+    `result()` da exactamente lo mismo que analyze_conversation sobre todos
+    los mensajes recibidos.
+
+    Los mensajes deberían llegar en orden de creationTime: si llega uno
+    anterior al último se inserta en su lugar (como group_and_sort) y los
+    hechos se recalculan desde cero. Si el texto del usuario de la sesión
+    activa tiene frases de negación, la motivación se vuelve a escanear
+    sobre el texto limpio completo al pedir el resultado (ver scan_user_text).
+
+    Usa las reglas en uso al crearse (o `rules`): recargar el ruleset no
+    cambia los scorers ya creados.
+    """
+
+    def __init__(self, chat_id, messages=(), rules=None):
+        self.chat_id = chat_id
+        self.rules = rules or RULES
+        self.messages = []
+        self._time_keys = []
+        self._reset()
+        self.extend(messages)
+
+    def _reset(self):
+        self.telefono = ""
+        self.sessions = 0
+        self.max_pause_days = 0
+        self.start_epoch = None
+        self.end_epoch = None
+        self._new_session(None)
+
+    def _new_session(self, epoch):
+        self.session_start_epoch = epoch
+        self.session_size = 0
+        # Textos del usuario en minúsculas y estado del escaneo de keywords
+        self.user_texts = []
+        self._text_tail = ""
+        self._best_hits = {}
+        self._spam_hits = None
+        self._negated = False
+        # Pago
+        self.payment_link_sent = False
+        self.file_after_payment_link = False
+        self.personal_data = None
+        # Comportamiento
+        self.first_bot_time = None
+        self.first_user_response_time = None
+        self._response_found = False
+        self.user_started = False
+        self.agent_last = False
+        self.user_media = False
+
+    def add(self, msg):
+        """Suma un mensaje (con el formato de los items del bulk export)."""
+        msg[EPOCH_KEY] = parse_epoch(msg.get('creationTime', ''))
+        key = _time_key(msg)
+        if self.messages and key < self._time_keys[-1]:
+            pos = bisect_right(self._time_keys, key)
+            self.messages.insert(pos, msg)
+            self._time_keys.insert(pos, key)
+            self._rebuild()
+        else:
+            self.messages.append(msg)
+            self._time_keys.append(key)
+            self._update(msg)
+        return self
+
+    def extend(self, messages):
+        """Suma varios mensajes; si alguno llega fuera de orden se recalcula una sola vez."""
+        messages = list(messages)
+        for msg in messages:
+            msg[EPOCH_KEY] = parse_epoch(msg.get('creationTime', ''))
+        keys = [_time_key(msg) for msg in messages]
+        last = self._time_keys[-1] if self._time_keys else None
+        if all(last is None or key >= last for key in keys) and keys == sorted(keys):
+            for msg, key in zip(messages, keys):
+                self.messages.append(msg)
+                self._time_keys.append(key)
+                self._update(msg)
+        else:
+            self.messages = sorted(self.messages + messages, key=_time_key)
+            self._time_keys = [_time_key(msg) for msg in self.messages]
+            self._rebuild()
+        return self
+
+    def _rebuild(self):
+        self._reset()
+        for msg in self.messages:
+            self._update(msg)
+
+    def _update(self, msg):
+        epoch = message_epoch(msg)
+        if not self.sessions:
+            self.telefono = msg.get('chat', {}).get('contactId', "")
+            self.sessions = 1
+            self.start_epoch = epoch
+            self._new_session(epoch)
+        elif self.end_epoch is not None and epoch is not None:
+            # Misma regla que split_into_sessions, contra el mensaje anterior
+            gap = (epoch - self.end_epoch) // _US_PER_DAY
+            if gap >= self.rules.session_gap_days:
+                self.sessions += 1
+                self.max_pause_days = max(self.max_pause_days, gap)
+                self._new_session(epoch)
+        self.end_epoch = epoch
+
+        role = msg.get('from')
+        content = msg.get('content', {})
+        if self.session_size == 0:
+            self.user_started = role == 'user'
+        self.session_size += 1
+        self.agent_last = role in ['bot', 'agent']
+
+        # Pago: archivo del usuario después de instrucciones de pago del bot
+        if not self.file_after_payment_link:
+            if role in ['bot', 'agent']:
+                text = content.get('text', '').lower() if content.get('type') == 'text' else ""
+                if bot_sent_payment_info(text, self.rules):
+                    self.payment_link_sent = True
+            elif role == 'user':
+                if content.get('type') in ['image', 'document', 'file'] and self.payment_link_sent:
+                    self.file_after_payment_link = True
+
+        # Comportamiento: primer mensaje del bot y primera respuesta del usuario
+        if not self._response_found:
+            if role in ['bot', 'agent'] and self.first_bot_time is None:
+                self.first_bot_time = epoch
+            elif role == 'user' and self.first_bot_time is not None:
+                self.first_user_response_time = epoch
+                self._response_found = True
+
+        if role == 'user':
+            if content.get('type') in ['audio', 'video', 'ptt']:
+                self.user_media = True
+            text = get_message_text(msg)
+            if self.personal_data is None:
+                self.personal_data = personal_data_kind(text)
+            self._add_user_text(text.lower())
+
+    def _add_user_text(self, text):
+        rules = self.rules
+        # Spam: hits del primer mensaje que tenga alguno
+        if self._spam_hits is None:
+            spam_hits = rules.spam_scanner.scan(text)
+            if any(spam_hits.values()):
+                self._spam_hits = spam_hits
+
+        # El texto completo es " ".join(user_texts): solo se re-escanea desde
+        # max_keyword_length caracteres antes del texto nuevo (más uno para
+        # los límites de palabra), lo único que puede cambiar al agregarlo.
+        if self.user_texts:
+            window = f"{self._text_tail} {text}"
+            pos = max(len(self._text_tail) - rules.max_keyword_length, 0)
+        else:
+            window, pos = text, 0
+        scanner = rules.user_text_scanner
+        for _, name, idx in scanner.iter_hits(window, pos):
+            if idx < self._best_hits.get(name, len(scanner.categories[name])):
+                self._best_hits[name] = idx
+        if not self._negated:
+            self._negated = any(neg in window for neg in rules.negation_phrases)
+
+        self.user_texts.append(text)
+        self._text_tail = window[-(rules.max_keyword_length + 1):]
+
+    def hits(self):
+        """Tabla de hits de la sesión activa (igual a scan_user_text)."""
+        hits = {name: None for name in self.rules.spam_scanner.categories}
+        if self._spam_hits:
+            hits.update(self._spam_hits)
+        hits.update({
+            name: (keywords[self._best_hits[name]] if name in self._best_hits else None)
+            for name, keywords in self.rules.user_text_scanner.categories.items()
+        })
+        if self._negated:
+            hits.update(_scan_without_negations(" ".join(self.user_texts), self.rules))
+        return hits
+
+    def facts(self):
+        """Los mismos hechos que conversation_facts(self.messages)."""
+        facts = {
+            'telefono': self.telefono,
+            'sessions': self.sessions,
+            'max_pause_days': self.max_pause_days,
+            'start_epoch': self.start_epoch,
+            'end_epoch': self.end_epoch,
+            'session_start_epoch': self.session_start_epoch,
+            'session_end_epoch': self.end_epoch,
+            'user_messages': len(self.user_texts),
+        }
+        if self.user_texts:
+            facts.update({
+                'single_user_text': self.user_texts[0] if len(self.user_texts) == 1 else None,
+                'last_user_text': self.user_texts[-1],
+                'hits': self.hits(),
+                'payment': {
+                    'file_after_payment_link': self.file_after_payment_link,
+                    'personal_data': self.personal_data,
+                },
+                'behavior': {
+                    'user_messages': len(self.user_texts),
+                    'first_bot_time': self.first_bot_time,
+                    'first_user_response_time': self.first_user_response_time,
+                    'user_started': self.user_started,
+                    'agent_last': self.agent_last,
+                    'user_media': self.user_media,
+                },
+            })
+        return facts
+
+    def result(self):
+        """Fila del lead con los mensajes recibidos hasta ahora."""
+        return classify_conversation(self.chat_id, self.facts(), self.rules)
+
+
+# ============================================================================
+# RESULTADOS PERSISTIDOS (ESTADO POR CHAT Y CACHÉ POR CONTENIDO)
+# ============================================================================
+
+# Funciones cuyo código define el resultado del análisis (ver ruleset_version)
+RULESET_FUNCTIONS = [
+    'KeywordScanner', 'Ruleset', 'split_into_sessions', 'scan_user_text', '_scan_without_negations',
+    'check_spam', '_spam_verdict', 'calculate_motivation_score',
+    'calculate_payment_score', 'bot_sent_payment_info', 'personal_data_kind', 'payment_facts', '_payment_score',
+    'calculate_behavior_score', 'behavior_facts', '_behavior_score',
+    'get_message_text', '_format_duration', 'analyze_conversation', 'conversation_facts', 'classify_conversation',
+]
+
+_code_version = None
+
+
+def ruleset_version(rules=None):
+    """
+    Hash de las reglas de scoring: el contenido del ruleset (`rules`, por
+    defecto las reglas en uso) y el código de las funciones de
+    RULESET_FUNCTIONS. Cambia con cualquier edición de las reglas, lo que
+    invalida los resultados guardados por ChatStateStore y AnalysisCache.
+    """
+    global _code_version
+    rules = rules or RULES
+    if rules._version_key is None:
+        if _code_version is None:
+            digest = hashlib.blake2b(digest_size=8)
+            for name in RULESET_FUNCTIONS:
+                try:
+                    code = inspect.getsource(globals()[name]).encode('utf-8')
+                except (OSError, TypeError):
+                    code = marshal.dumps(globals()[name].__code__)
+                digest.update(code)
+            _code_version = digest.hexdigest()
+        rules._version_key = hashlib.blake2b(
+            f"{_code_version}:{rules.digest}".encode('ascii'), digest_size=8
+        ).hexdigest()
+    return rules._version_key
+
+
+def chat_fingerprint(messages, rules=None):
+    """
+    Retorna (último epoch, hash del contenido) de un chat ya ordenado. El hash
+    cubre todos los campos de todos los mensajes, así que cambia si el chat
+    recibe mensajes nuevos o si alguno se edita, y la versión de las reglas,
+    así que también cambia al recargar un ruleset distinto.
+    """
+    last_epoch = message_epoch(messages[-1]) if messages else None
+    digest = hashlib.blake2b(ruleset_version(rules).encode('ascii'), digest_size=16)
+    for msg in messages:
+        clean = {k: v for k, v in msg.items() if k != EPOCH_KEY}
+        digest.update(json.dumps(clean, sort_keys=True, ensure_ascii=False, default=str).encode('utf-8'))
+        digest.update(b'\n')
+    return last_epoch, digest.hexdigest()
+
+
+def conversation_key(messages, rules=None):
+    """
+    Clave de contenido de un chat ya ordenado: hash de lo único que lee
+    analyze_conversation de cada mensaje (rol, timestamp, tipo y texto) más
+    la versión de las reglas. Dos chats con la misma conversación comparten
+    clave aunque tengan distinto chatId.
+    """
+    digest = hashlib.blake2b(ruleset_version(rules).encode('ascii'), digest_size=16)
+    for msg in messages:
+        content = msg.get('content', {})
+        normalized = [msg.get('from'), message_epoch(msg), content.get('type'), get_message_text(msg)]
+        digest.update(json.dumps(normalized, ensure_ascii=False).encode('utf-8'))
+        digest.update(b'\n')
+    return digest.hexdigest()
+
+
+class _AnalysisStore:
+    """
+    Base de ChatStateStore y AnalysisCache: resultados de analyze_conversation
+    guardados en una tabla SQLite `TABLE`. Las subclases definen el esquema
+    (SCHEMA), cómo buscar un lote de chats (_lookup) y cómo guardar los
+    análisis nuevos y marcar los reutilizados (_save). Si cambia
+    ruleset_version() al abrir, la tabla se vacía; si las reglas se recargan
+    con el store abierto, las claves de las filas dejan de coincidir y esos
+    chats se vuelven a analizar. `reused` y `rescored` cuentan los chats
+    reutilizados y analizados desde que se abrió el store.
+    """
+
+    FORMAT_VERSION = 1
+    TABLE = None
+    SCHEMA = None
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._conn = sqlite3.connect(db_path, timeout=60, check_same_thread=False)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        for statement in self.SCHEMA:
+            self._conn.execute(statement)
+        self._conn.execute("INSERT OR IGNORE INTO meta VALUES ('format_version', ?)", (str(self.FORMAT_VERSION),))
+        meta = dict(self._conn.execute("SELECT key, value FROM meta"))
+        if meta['format_version'] != str(self.FORMAT_VERSION):
+            self._conn.close()
+            raise ValueError(f"{db_path} no es compatible con {type(self).__name__} (versión {self.FORMAT_VERSION}).")
+        if meta.get('ruleset') != ruleset_version():
+            self._conn.execute(f"DELETE FROM {self.TABLE}")
+            self._conn.execute("INSERT OR REPLACE INTO meta VALUES ('ruleset', ?)", (ruleset_version(),))
+        self._conn.commit()
+        self.reused = 0
+        self.rescored = 0
+
+    # Se serializa solo la ruta (p. ej. para pasarlo a otro proceso)
+    def __getstate__(self):
+        return {'db_path': self.db_path}
+
+    def __setstate__(self, state):
+        self.__init__(state['db_path'])
+
+    def __len__(self):
+        return self._conn.execute(f"SELECT COUNT(*) FROM {self.TABLE}").fetchone()[0]
+
+    def close(self):
+        self._conn.close()
+
+    def _select(self, column, fields, keys):
+        """{valor de `column`: (campos...)} de las filas con esas claves."""
+        found = {}
+        keys = list(keys)
+        for start in range(0, len(keys), _SQLITE_MAX_PARAMS):
+            chunk = keys[start:start + _SQLITE_MAX_PARAMS]
+            query = (
+                f"SELECT {column}, {fields} FROM {self.TABLE} "
+                f"WHERE {column} IN ({', '.join('?' * len(chunk))})"
+            )
+            for key, *values in self._conn.execute(query, chunk):
+                found[key] = values
+        return found
+
+    def iter_analyses(self, chats, analyze=None, batch_size=STATE_BATCH_SIZE, rules=None):
+        """
+        Genera ((chat_id, mensajes), análisis) en el orden de `chats`, como
+        _iter_analyses, reutilizando los análisis guardados. Procesa la entrada
+        por lotes de `batch_size` chats: una consulta al store por lote, los
+        chats sin resultado se analizan con `analyze` (por defecto,
+        _iter_analyses secuencial) y sus análisis se guardan en un commit.
+        La consulta no escribe: la transacción de escritura (y el lock de
+        SQLite) se abre recién al guardar, así varios procesos que comparten
+        el archivo no se bloquean mientras analizan.
+        `rules` son las reglas con que `analyze` analiza los chats.
+        """
+        rules = rules or RULES
+        analyze = analyze or partial(_iter_analyses, rules=rules)
+        chats = iter(chats)
+        while True:
+            batch = list(islice(chats, batch_size))
+            if not batch:
+                return
+            keys, analyses = self._lookup(batch, rules)
+            reused = [key for key, analysis in zip(keys, analyses) if analysis is not None]
+            missing = [i for i, analysis in enumerate(analyses) if analysis is None]
+            fresh = []
+            for i, (_, analysis) in zip(missing, analyze([batch[i] for i in missing])):
+                analyses[i] = analysis
+                fresh.append((keys[i], analysis))
+            if fresh or reused:
+                self._save(fresh, reused)
+            self._conn.commit()
+            self.reused += len(batch) - len(missing)
+            self.rescored += len(missing)
+            yield from zip(batch, analyses)
+
+
+class ChatStateStore(_AnalysisStore):
+    """
+    Estado persistido por chatId: último timestamp, hash del contenido y el
+    último resultado del análisis (sin el cruce Neotel, que se rehace en cada
+    corrida por si cambió la base).
+
+    Con un store, score_chats solo vuelve a analizar los chats nuevos o cuyo
+    contenido cambió respecto de la corrida anterior; para el resto reutiliza
+    el resultado guardado.
+    """
+
+    TABLE = 'chat_state'
+    SCHEMA = [
+        "CREATE TABLE IF NOT EXISTS chat_state (chat_id TEXT PRIMARY KEY, last_epoch INTEGER, "
+        "content_hash TEXT NOT NULL, result TEXT NOT NULL)",
+    ]
+
+    def get(self, chat_id):
+        """Estado guardado del chat ({'last_epoch', 'content_hash', 'result'}) o None."""
+        row = self._select('chat_id', 'last_epoch, content_hash, result', [chat_id]).get(chat_id)
+        if row is None:
+            return None
+        return {'last_epoch': row[0], 'content_hash': row[1], 'result': json.loads(row[2])}
+
+    def _lookup(self, batch, rules):
+        fingerprints = [chat_fingerprint(messages, rules) for _, messages in batch]
+        stored = self._select('chat_id', 'content_hash, result', [chat_id for chat_id, _ in batch])
+        keys, analyses = [], []
+        for (chat_id, _), (last_epoch, digest) in zip(batch, fingerprints):
+            hit = stored.get(chat_id)
+            keys.append((chat_id, last_epoch, digest))
+            analyses.append(json.loads(hit[1]) if hit is not None and hit[0] == digest else None)
+        return keys, analyses
+
+    def _save(self, fresh, reused):
+        if not fresh:
+            return
+        self._conn.executemany("INSERT OR REPLACE INTO chat_state VALUES (?, ?, ?, ?)", [
+            (*key, json.dumps(analysis, ensure_ascii=False)) for key, analysis in fresh
+        ])
+
+
+class AnalysisCache(_AnalysisStore):
+    """
+    Caché de resultados de analyze_conversation por contenido (ver
+    conversation_key): una conversación idéntica a otra ya analizada, aunque
+    venga en otro export o con otro chatId, no se vuelve a analizar. Se
+    guardan a lo sumo `max_entries` resultados; al superarlo se descartan
+    los usados hace más tiempo (LRU).
+    """
+
+    TABLE = 'analysis_cache'
+    SCHEMA = [
+        "CREATE TABLE IF NOT EXISTS analysis_cache (key TEXT PRIMARY KEY, result TEXT NOT NULL, "
+        "last_used INTEGER NOT NULL)",
+        "CREATE INDEX IF NOT EXISTS analysis_cache_last_used ON analysis_cache (last_used)",
+    ]
+
+    def __init__(self, db_path, max_entries=ANALYSIS_CACHE_SIZE):
+        self.max_entries = max_entries
+        super().__init__(db_path)
+
+    def __getstate__(self):
+        return {'db_path': self.db_path, 'max_entries': self.max_entries}
+
+    def __setstate__(self, state):
+        self.__init__(state['db_path'], state['max_entries'])
+
+    def _lookup(self, batch, rules):
+        keys = [conversation_key(messages, rules) for _, messages in batch]
+        stored = self._select('key', 'result', set(keys))
+        analyses = []
+        for (chat_id, messages), key in zip(batch, keys):
+            hit = stored.get(key)
+            if hit is None:
+                analyses.append(None)
+                continue
+            # El resultado guardado puede venir de otro chat con la misma conversación
+            telefono = messages[0].get('chat', {}).get('contactId', "") if messages else ""
+            analyses.append({**json.loads(hit[0]), 'chat_id': chat_id, 'telefono': telefono})
+        return keys, analyses
+
+    def _save(self, fresh, reused):
+        # Los aciertos se marcan como usados en la misma transacción que los análisis nuevos
+        now = time.time_ns()
+        self._conn.executemany("UPDATE analysis_cache SET last_used = ? WHERE key = ?",
+                               [(now, key) for key in set(reused)])
+        self._conn.executemany("INSERT OR REPLACE INTO analysis_cache VALUES (?, ?, ?)", [
+            (key, json.dumps(analysis, ensure_ascii=False), now) for key, analysis in fresh
+        ])
+        excess = len(self) - self.max_entries
+        if excess > 0:
+            self._conn.execute(
+                "DELETE FROM analysis_cache WHERE key IN "
+                "(SELECT key FROM analysis_cache ORDER BY last_used LIMIT ?)", (excess,)
+            )
+
+
+# ============================================================================
+# PROCESAMIENTO DE EXPORTS
+# ============================================================================
+
+def _analyze_chunk(chunk):
+    """Tarea del modo paralelo: analiza una lista de (chat_id, mensajes) en un worker."""
+    return [analyze_conversation(chat_id, messages) for chat_id, messages in chunk]
+
+
+def _iter_analyses(chats, workers=None, chunk_size=PARALLEL_CHUNK_SIZE, rules=None):
+    """
+    Genera ((chat_id, mensajes), análisis) en el mismo orden de `chats`.
+
+    Con workers > 1 los chats se reparten en bloques de `chunk_size` sobre un
+    ProcessPoolExecutor. Se mantienen a lo sumo 2 bloques por worker en vuelo,
+    así una entrada en streaming no se carga completa en memoria. Los workers
+    reciben la configuración de `rules` al iniciar (ver set_ruleset).
+    """
+    rules = rules or RULES
+    if not workers or workers <= 1:
+        for chat in chats:
+            yield chat, analyze_conversation(*chat, rules)
+        return
+
+    chats = iter(chats)
+    with ProcessPoolExecutor(max_workers=workers, initializer=set_ruleset, initargs=(rules.config,)) as pool:
+        pending = deque()
+        while True:
+            chunk = list(islice(chats, chunk_size))
+            if chunk:
+                pending.append((chunk, pool.submit(_analyze_chunk, chunk)))
+            if pending and (not chunk or len(pending) >= workers * 2):
+                done_chunk, future = pending.popleft()
+                yield from zip(done_chunk, future.result())
+            if not chunk and not pending:
+                break
+
+
+def score_chats(chats, neotel_df=None, workers=None, chunk_size=PARALLEL_CHUNK_SIZE, state=None, cache=None, rules=None):
+    """
+    Clasifica y enriquece con Neotel cada (chat_id, mensajes) de `chats`.
+    Es un generador: las filas se producen a medida que se consume la entrada.
+
+    `workers` (opcional) activa el modo paralelo: el análisis de las
+    conversaciones se reparte en procesos (ver _iter_analyses) y el
+    enriquecimiento con Neotel sigue en el proceso principal. El orden de las
+    filas es el mismo que en modo secuencial.
+
+    `state` (opcional, ChatStateStore) activa la reclasificación incremental:
+    solo se analizan los chats nuevos o modificados desde la corrida anterior.
+    `cache` (opcional, AnalysisCache) evita analizar conversaciones idénticas
+    a otras ya analizadas. Con ambos, la caché se consulta para los chats
+    que el estado no resuelve.
+
+    `rules` (por defecto, las reglas en uso al llamar) se fija para toda la
+    corrida: una recarga del ruleset a mitad de camino no mezcla reglas.
+    """
+    # Pre-process Neotel DF if provided: se indexa una sola vez (sin modificar el DataFrame)
+    neotel = as_neotel_index(neotel_df)
+    has_neotel = neotel is not None and not neotel.empty
+    
+    # Clasificar leads
+    rules = rules or RULES
+
+    def analyze(chats):
+        return _iter_analyses(chats, workers, chunk_size, rules)
+
+    if cache is not None:
+        analyze = partial(cache.iter_analyses, analyze=analyze, rules=rules)
+    if state is not None:
+        analyze = partial(state.iter_analyses, analyze=analyze, rules=rules)
+    analyses = analyze(chats)
+    if not has_neotel:
+        for _, analysis in analyses:
+            yield analysis
+        return
+
+    # Enriquecer con UTM por lotes (join vectorizado contra la base Neotel)
+    batch, phones, dates = [], [], []
+    for (chat_id, messages), analysis in analyses:
+        batch.append(analysis)
+        phones.append(analysis['telefono'])
+        dates.append(messages[0].get('creationTime', '') if messages else '')
+        if len(batch) >= NEOTEL_BATCH_SIZE:
+            for analysis, utm_data in zip(batch, neotel.match_bulk(phones, dates)):
+                # Combinar datos
+                yield {**analysis, **utm_data}
+            batch, phones, dates = [], [], []
+
+    for analysis, utm_data in zip(batch, neotel.match_bulk(phones, dates)):
+        yield {**analysis, **utm_data}
+
+
+def process_data(json_data, neotel_df=None, workers=None, chunk_size=PARALLEL_CHUNK_SIZE, targets=None, state=None, cache=None):
     """
     Función principal de procesamiento.
+
+    `workers` > 1 activa el modo paralelo (p. ej. workers=os.cpu_count()).
+    En Windows el llamador debe estar protegido por `if __name__ == "__main__":`.
+
+    `targets` (opcional) activa la consulta puntual: solo se clasifican y
+    enriquecen los chats con esos chat IDs o teléfonos (ver target_filter).
+
+    `state` (opcional, ChatStateStore) reutiliza los resultados guardados de
+    los chats que no cambiaron desde la corrida anterior y `cache` (opcional,
+    AnalysisCache) los de conversaciones idénticas ya analizadas.
     """
     items = json_data.get('items', [])
-    grouped_chats = group_and_sort(items)
-    
-    # Pre-process Neotel DF if provided
-    if neotel_df is not None and not neotel_df.empty:
-        phone_col = None
-        possible_cols = ['TELWHATSAPP', 'teltelefono', 'TELTELEFONO', 'num_telefono']
-        
-        for col in possible_cols:
-            if col in neotel_df.columns:
-                phone_col = col
-                break
-                
-        if not phone_col:
-            for col in neotel_df.columns:
-                if 'telefono' in col.lower():
-                    phone_col = col
-                    break
-        
-        if phone_col:
-            if 'normalized_phone' not in neotel_df.columns:
-                neotel_df['normalized_phone'] = neotel_df[phone_col].apply(normalize_phone)
-    
-    results = []
-    for chat_id, messages in grouped_chats.items():
-        # Clasificar lead
-        analysis = analyze_conversation(chat_id, messages)
-        
-        # Enriquecer con UTM si hay Neotel
-        utm_data = {}
-        if neotel_df is not None and not neotel_df.empty:
-            first_msg_date = messages[0].get('creationTime', '') if messages else ''
-            utm_data = match_neotel_data(analysis['telefono'], first_msg_date, neotel_df)
-        
-        # Combinar datos
-        final_row = {**analysis, **utm_data}
-        results.append(final_row)
-        
-    return results
+    grouped_chats = group_and_sort(items, targets)
+    return list(score_chats(grouped_chats.items(), neotel_df, workers, chunk_size, state, cache))
+
+
+def process_stream(fp, neotel_df=None, workers=None, chunk_size=PARALLEL_CHUNK_SIZE, targets=None, state=None, cache=None):
+    """
+    Modo streaming de process_data: lee el export desde el archivo `fp` de forma
+    incremental y retorna un generador de filas, sin cargar todos los items.
+    Requiere que el export liste cada chat de forma contigua (ver iter_chats).
+    """
+    return score_chats(iter_chats(iter_items(fp), targets), neotel_df, workers, chunk_size, state, cache)
+
+
+def process_file(path, neotel_df=None, workers=None, chunk_size=PARALLEL_CHUNK_SIZE, targets=None, state=None, cache=None):
+    """
+    Clasifica un export JSON desde disco y retorna la lista de filas. Lo lee
+    en streaming y, si los chats vienen intercalados, lo carga completo.
+    """
+    with open(path, 'rb') as f:
+        try:
+            return list(process_stream(f, neotel_df, workers, chunk_size, targets, state, cache))
+        except ChatOrderError:
+            f.seek(0)
+            return process_data(json.load(f), neotel_df, workers, chunk_size, targets, state, cache)
+
+
+class ScoringJob:
+    """
+    Procesa un export en un hilo de fondo para que la interfaz no se bloquee.
+
+    `source` es el export ya parseado (dict con 'items') o un archivo binario
+    con el JSON, que se lee en modo streaming (si los chats vienen
+    intercalados se vuelve a leer completo con process_data). Las filas se
+    acumulan en `rows` a medida que se clasifican y `progress` (0 a 1) indica
+    el avance: bytes leídos en streaming, chats procesados en el otro caso.
+    """
+
+    def __init__(self, source, neotel_df=None, workers=None, chunk_size=PARALLEL_CHUNK_SIZE):
+        self.source = source
+        self.neotel = as_neotel_index(neotel_df)
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.rows = []
+        self.progress = 0.0
+        self.error = None
+        self.done = False
+        self._cancelled = False
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def cancel(self):
+        """Pide detener el proceso; el hilo termina después de la fila en curso."""
+        self._cancelled = True
+
+    def wait(self, timeout=None):
+        self._thread.join(timeout)
+        return self.done
+
+    def snapshot(self):
+        """Copia de las filas procesadas hasta ahora."""
+        with self._lock:
+            return list(self.rows)
+
+    def _collect(self, rows, progress):
+        for row in rows:
+            if self._cancelled:
+                return
+            with self._lock:
+                self.rows.append(row)
+            self.progress = progress()
+
+    def _score_data(self, json_data):
+        grouped_chats = group_and_sort(json_data.get('items', []))
+        total = max(len(grouped_chats), 1)
+        rows = score_chats(grouped_chats.items(), self.neotel, self.workers, self.chunk_size)
+        self._collect(rows, lambda: len(self.rows) / total)
+
+    def _run(self):
+        try:
+            if isinstance(self.source, dict):
+                self._score_data(self.source)
+            else:
+                fp = self.source
+                size = max(fp.seek(0, io.SEEK_END), 1)
+                fp.seek(0)
+                try:
+                    rows = process_stream(fp, self.neotel, self.workers, self.chunk_size)
+                    self._collect(rows, lambda: min(fp.tell() / size, 1.0))
+                except ChatOrderError:
+                    # Export con chats intercalados: se procesa cargándolo completo
+                    with self._lock:
+                        self.rows = []
+                    self.progress = 0.0
+                    fp.seek(0)
+                    self._score_data(json.load(fp))
+            if not self._cancelled:
+                self.progress = 1.0
+        except Exception as e:
+            self.error = e
+        finally:
+            self.done = True
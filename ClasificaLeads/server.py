@@ -0,0 +1,345 @@
+"""
+Servicio HTTP local para clasificar leads en tiempo real (solo biblioteca estándar).
+
+Mantiene en memoria la base Neotel indexada y las reglas de scoring ya
+compiladas, y agrupa las peticiones concurrentes en micro-lotes que se
+clasifican juntos (un solo cruce vectorizado con Neotel por lote). Si se
+edita ruleset.json, las reglas se recargan sin reiniciar el servicio.
+
+Ejemplo:
+    python server.py --neotel base.xlsx --port 8765
+    curl -X POST localhost:8765/score -d @conversacion.json
+
+POST /score   cuerpo con el formato del bulk export ({"items": [...]});
+              responde {"leads": [...]} con una fila por chat.
+GET  /health  estado del servicio, versión de las reglas y latencias (ms) de
+              las últimas peticiones.
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import logic
+from logic import as_neotel_index, group_and_sort, score_chats, load_neotel_base, reload_ruleset, NEOTEL_CACHE_DIR
+
+# Máximo de chats por micro-lote
+BATCH_MAX_CHATS = 256
+
+# Espera máxima (segundos) para completar un micro-lote. Con 0 el lote son
+# las peticiones que llegaron mientras se clasificaba el anterior.
+BATCH_MAX_WAIT = 0.0
+
+# Peticiones sobre las que se calculan las latencias de /health
+LATENCY_WINDOW = 10_000
+
+# Cada cuánto (segundos) se revisa si cambió el archivo de reglas
+RULESET_CHECK_SECONDS = 1.0
+
+# Tamaño máximo del cuerpo de una petición
+MAX_BODY_BYTES = 32 * 1024 * 1024
+
+HTTP_REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed', 413: 'Payload Too Large',
+                500: 'Internal Server Error'}
+
+
+class RequestError(ValueError):
+    """Petición inválida: se responde con `status` y el mensaje como error."""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def validate_message(pos, item):
+    """
+    Revisa la forma de un mensaje del bulk export antes de clasificarlo: los
+    campos que existen deben tener el tipo que espera el pipeline. Lanza
+    RequestError(400) indicando la posición del mensaje en 'items'.
+    """
+    if not isinstance(item, dict):
+        raise RequestError(400, f"items[{pos}]: cada mensaje debe ser un objeto JSON.")
+    for key, kind, name in [('chat', dict, "un objeto"), ('content', dict, "un objeto"), ('creationTime', str, "un texto")]:
+        if key in item and not isinstance(item[key], kind):
+            raise RequestError(400, f"items[{pos}].{key} debe ser {name}.")
+    for key in ('chatId', 'contactId'):
+        if key in item.get('chat', {}) and not isinstance(item['chat'][key], (str, int)):
+            raise RequestError(400, f"items[{pos}].chat.{key} debe ser un texto o un número entero.")
+    if 'content' in item and 'text' in item['content'] and not isinstance(item['content']['text'], str):
+        raise RequestError(400, f"items[{pos}].content.text debe ser un texto.")
+
+
+def _resolve(future, rows=None, error=None):
+    # El cliente pudo haberse desconectado (future cancelado) mientras se clasificaba
+    if future.done():
+        return
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(rows)
+
+
+class ScoringService:
+    """
+    Motor de clasificación compartido por todas las conexiones.
+
+    `score(chats)` encola los chats de una petición y espera sus filas. Una
+    única tarea toma de la cola todo lo pendiente (hasta `max_batch` chats),
+    lo clasifica con score_chats en un hilo aparte, para no bloquear el
+    event loop, y reparte las filas a cada petición. Si el lote falla, se
+    reintenta petición por petición: el error llega solo a la que lo causó.
+    Antes de cada lote se recarga el ruleset si cambió (a lo sumo cada
+    RULESET_CHECK_SECONDS).
+    """
+
+    def __init__(self, neotel=None, max_batch=BATCH_MAX_CHATS, max_wait=BATCH_MAX_WAIT):
+        self.neotel = as_neotel_index(neotel)
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.requests = 0
+        self.batches = 0
+        self._queue = None
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._ruleset_checked = time.monotonic()
+        self._ruleset_error = None
+
+    def start(self):
+        self._queue = asyncio.Queue()
+        return asyncio.get_running_loop().create_task(self._run_batches())
+
+    async def score(self, chats):
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((chats, future))
+        return await future
+
+    def _check_ruleset(self):
+        now = time.monotonic()
+        if now - self._ruleset_checked < RULESET_CHECK_SECONDS:
+            return
+        self._ruleset_checked = now
+        try:
+            if reload_ruleset():
+                print(f"Reglas recargadas: versión {logic.RULES.version} ({logic.RULES.digest}).", file=sys.stderr)
+            self._ruleset_error = None
+        except ValueError as e:
+            # Se avisa una vez por error; mientras tanto siguen las reglas anteriores
+            if str(e) != self._ruleset_error:
+                print(f"No se pudo recargar el ruleset: {e}", file=sys.stderr)
+            self._ruleset_error = str(e)
+
+    def _score_batch(self, chats):
+        self._check_ruleset()
+        return list(score_chats(chats, self.neotel))
+
+    async def _next_batch(self):
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        size = len(batch[0][0])
+        deadline = loop.time() + self.max_wait
+        while size < self.max_batch:
+            try:
+                if self._queue.empty() and self.max_wait > 0:
+                    item = await asyncio.wait_for(self._queue.get(), max(deadline - loop.time(), 0))
+                else:
+                    item = self._queue.get_nowait()
+            except (asyncio.QueueEmpty, asyncio.TimeoutError):
+                break
+            batch.append(item)
+            size += len(item[0])
+        return batch
+
+    async def _run_batches(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._next_batch()
+            chats = [chat for request_chats, _ in batch for chat in request_chats]
+            try:
+                rows = await loop.run_in_executor(self._executor, self._score_batch, chats)
+            except Exception as e:
+                if len(batch) == 1:
+                    _resolve(batch[0][1], error=e)
+                else:
+                    await self._score_separately(batch)
+                continue
+            self.batches += 1
+            start = 0
+            for request_chats, future in batch:
+                _resolve(future, rows[start:start + len(request_chats)])
+                start += len(request_chats)
+
+    async def _score_separately(self, batch):
+        loop = asyncio.get_running_loop()
+        for request_chats, future in batch:
+            try:
+                rows = await loop.run_in_executor(self._executor, self._score_batch, request_chats)
+            except Exception as e:
+                _resolve(future, error=e)
+            else:
+                self.batches += 1
+                _resolve(future, rows)
+
+    def warm_up(self):
+        """Clasifica un chat de prueba para que la primera petición no pague la inicialización."""
+        message = {"chat": {"chatId": "warmup", "contactId": "0"}, "from": "user",
+                   "creationTime": "2025-01-01T00:00:00Z", "content": {"type": "text", "text": "hola"}}
+        self._score_batch(list(group_and_sort([message]).items()))
+
+    def health(self):
+        latencies = np.array(self.latencies) if self.latencies else np.zeros(1)
+        return {
+            'status': 'ok',
+            'neotel_rows': len(self.neotel) if self.neotel is not None else 0,
+            'requests': self.requests,
+            'batches': self.batches,
+            'ruleset': {'version': logic.RULES.version, 'digest': logic.RULES.digest, 'error': self._ruleset_error},
+            'latency_ms': {
+                'p50': round(float(np.percentile(latencies, 50)), 3),
+                'p99': round(float(np.percentile(latencies, 99)), 3),
+                'max': round(float(latencies.max()), 3),
+            },
+        }
+
+    async def handle_score(self, body):
+        try:
+            data = json.loads(body)
+        except (UnicodeDecodeError, ValueError) as e:
+            raise RequestError(400, f"JSON inválido: {e}")
+        if not isinstance(data, dict) or not isinstance(data.get('items'), list):
+            raise RequestError(400, "El cuerpo debe tener el formato del bulk export ({\"items\": [...]}).")
+        for pos, item in enumerate(data['items']):
+            validate_message(pos, item)
+        chats = list(group_and_sort(data['items']).items())
+        return {'leads': await self.score(chats) if chats else []}
+
+
+async def read_request(reader):
+    """Lee una petición HTTP/1.1. Retorna (método, ruta, headers, cuerpo) o None si se cerró la conexión."""
+    request_line = await reader.readline()
+    if not request_line.strip():
+        return None
+    try:
+        method, path, _ = request_line.decode('latin-1').split(' ', 2)
+    except ValueError:
+        raise RequestError(400, "Línea de petición inválida.")
+
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+
+    try:
+        length = int(headers.get('content-length', 0))
+    except ValueError:
+        raise RequestError(400, "Content-Length inválido.")
+    if length > MAX_BODY_BYTES:
+        raise RequestError(413, f"El cuerpo supera {MAX_BODY_BYTES} bytes.")
+    body = await reader.readexactly(length) if length else b''
+    return method, path.split('?', 1)[0], headers, body
+
+
+def write_response(writer, status, payload, keep_alive=True):
+    body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+    head = (
+        f"HTTP/1.1 {status} {HTTP_REASONS.get(status, '')}\r\n"
+        "Content-Type: application/json; charset=utf-8\r\n"
+        f"Content-Length: {len(body)}\r\n"
+        f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+    )
+    writer.write(head.encode('latin-1') + body)
+
+
+async def handle_connection(service, reader, writer):
+    """Atiende las peticiones de una conexión (keep-alive) hasta que el cliente la cierre."""
+    try:
+        while True:
+            try:
+                request = await read_request(reader)
+            except RequestError as e:
+                write_response(writer, e.status, {'error': str(e)}, keep_alive=False)
+                break
+            if request is None:
+                break
+            method, path, headers, body = request
+            keep_alive = headers.get('connection', '').lower() != 'close'
+            start = time.perf_counter()
+
+            try:
+                if path == '/score':
+                    if method != 'POST':
+                        raise RequestError(405, "Usar POST en /score.")
+                    status, payload = 200, await service.handle_score(body)
+                    service.requests += 1
+                    service.latencies.append((time.perf_counter() - start) * 1000)
+                elif path == '/health':
+                    status, payload = 200, service.health()
+                else:
+                    raise RequestError(404, f"Ruta desconocida: {path}")
+            except RequestError as e:
+                status, payload = e.status, {'error': str(e)}
+            except Exception as e:
+                # Un fallo inesperado responde 500 en lugar de cortar la conexión sin respuesta
+                print(f"Error interno en {method} {path}: {e!r}", file=sys.stderr)
+                status, payload = 500, {'error': f"Error interno: {e}"}
+
+            write_response(writer, status, payload, keep_alive)
+            await writer.drain()
+            if not keep_alive:
+                break
+    except (asyncio.IncompleteReadError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+async def serve(service, host, port):
+    batches = service.start()
+    server = await asyncio.start_server(lambda r, w: handle_connection(service, r, w), host, port)
+    print(f"Escuchando en http://{host}:{port}", file=sys.stderr)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        batches.cancel()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Servicio HTTP local de clasificación de leads.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--neotel', help="Base Neotel (.xls / .xlsx) para enriquecer con UTM.")
+    parser.add_argument('--neotel-on-disk', action='store_true',
+                        help="Importa la base Neotel a SQLite en lugar de cargarla en memoria.")
+    parser.add_argument('--cache-dir', default=NEOTEL_CACHE_DIR, help="Directorio de caché de la base Neotel.")
+    parser.add_argument('--batch-max-chats', type=int, default=BATCH_MAX_CHATS, help="Máximo de chats por micro-lote.")
+    parser.add_argument('--batch-wait-ms', type=float, default=BATCH_MAX_WAIT * 1000,
+                        help="Espera máxima para completar un micro-lote (por defecto no se espera).")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    neotel = None
+    if args.neotel:
+        neotel = load_neotel_base(args.neotel, args.neotel_on_disk, args.cache_dir)
+        print(f"Base Neotel: {neotel.source_rows} registros.", file=sys.stderr)
+
+    service = ScoringService(neotel, args.batch_max_chats, args.batch_wait_ms / 1000)
+    service.warm_up()
+    try:
+        asyncio.run(serve(service, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,328 @@
+"""
+Generador reproducible (con semilla) de exports de chats y bases Neotel sintéticas.
+
+Sirve para benchmarks y pruebas de carga sin datos reales: los exports
+tienen el formato del bulk export ({"items": [...]}) y los textos del
+usuario se arman con las keywords del ruleset, así que se ejercitan todas
+las reglas de scoring (spam, motivación, pago, comportamiento, sesiones).
+
+Ejemplos:
+    python synthetic.py --chats 10000 -o export_10k.json --neotel-out neotel_10k.xlsx
+    python synthetic.py --chats 1000 --seed 7 --session-gap-rate 0.3 --interleave -o export.json
+"""
+import argparse
+import json
+import random
+import string
+import sys
+from datetime import datetime, timedelta, timezone
+
+import pandas as pd
+
+from logic import RULES
+
+# Primer creationTime posible de los chats generados
+SYNTHETIC_START = datetime(2025, 6, 1, tzinfo=timezone.utc)
+
+# Días sobre los que se reparten los inicios de chat
+SYNTHETIC_SPAN_DAYS = 180
+
+# Perfiles de lead: (nombre, peso, categorías de keywords que usa el usuario)
+LEAD_PROFILES = [
+    ('ghost', 15, []),
+    ('spam', 4, ['no_data']),
+    ('hostile', 3, ['hostile']),
+    ('incoherent', 3, []),
+    ('curious', 25, ['price_inquiry', 'vague_motivation']),
+    ('motivated', 20, ['strong_motivation', 'moderate_motivation', 'labor_impact', 'payment_forms']),
+    ('buyer', 12, ['strong_motivation', 'payment_intent', 'payment_forms']),
+    ('objector', 10, ['soft_objection', 'early_objection', 'price_objection', 'no_pay']),
+    ('negated', 8, ['strong_motivation', 'moderate_motivation']),
+]
+
+# Textos de relleno (sin keywords) para los mensajes
+USER_FILLER = [
+    "hola", "buenas tardes", "ok", "sí", "claro", "perfecto", "cuándo empiezan las clases",
+    "es online", "me pueden enviar más información", "qué días son", "cuánto dura el programa",
+    "ya vi el documento", "de acuerdo", "muchas gracias", "sigo esperando", "👍",
+]
+INCOHERENT_REPLIES = ["k", "?", "...", "ok", "12", "!!"]
+BOT_TEXTS = [
+    "¡Hola! Gracias por tu interés en nuestros programas. ¿En qué te puedo ayudar?",
+    "Para poder ayudarte mejor, selecciona una de las siguientes opciones:",
+    "Un asesor se comunicará contigo en breve.",
+    "Hola, sigues ahí? Elige una opción para continuar.",
+]
+AGENT_TEXTS = [
+    "¿Está usted disponible para avanzar con la asesoría?",
+    "Te comparto el brochure del programa.",
+    "Las clases son 100% online y puedes organizar tus horarios.",
+    "¿Qué programa te interesa más?",
+]
+PAYMENT_TEXTS = [
+    "Aquí tienes el link de pago para reservar tu cupo.",
+    "Te envío los datos de la cuenta para la transferencia bancaria.",
+    "Estos son los pasos para completar la inscripción.",
+]
+USER_MEDIA_TYPES = ['image', 'document', 'file', 'audio', 'video', 'ptt']
+
+# Columnas de la base Neotel sintética (las mismas que el reporte real)
+PROGRAMS = [
+    "GMP - Derecho 4.0: Derecho digital, Protección de Datos y Ciberseguridad",
+    "GMP - Gestión de Riesgos, Compliance y Auditoría",
+    "GMP - Neurociencia aplicada",
+    "GMP - Inteligencia Artificial y Negocios",
+]
+UTM_MEDIUMS = ["cpc", "social", "email", "organic", None]
+CANALES = ["Facebook", "Google", "Instagram", "TikTok", None]
+
+
+def _random_id(rng, size=20):
+    return ''.join(rng.choices(string.ascii_uppercase + string.digits, k=size))
+
+
+def _iso(moment):
+    return moment.strftime('%Y-%m-%dT%H:%M:%S.') + f"{moment.microsecond // 1000:03d}Z"
+
+
+def _random_phone(rng):
+    return f"5939{rng.randrange(10**8):08d}"
+
+
+def _user_text(rng, profile, keywords):
+    """Texto de un mensaje del usuario según su perfil (a veces solo relleno)."""
+    name, _, categories = profile
+    if name == 'incoherent':
+        return rng.choice(INCOHERENT_REPLIES)
+    if not categories or rng.random() < 0.4:
+        return rng.choice(USER_FILLER)
+    kw = rng.choice(keywords[rng.choice(categories)])
+    if name == 'negated':
+        return f"{rng.choice(RULES.negation_phrases)} {kw}"
+    if rng.random() < 0.1:
+        # Email o cédula: dato personal que suma en el puntaje de pago
+        return rng.choice([f"mi correo es lead{rng.randrange(10**6)}@mail.com", f"{rng.randrange(10**9, 10**10)}"])
+    return f"{rng.choice(USER_FILLER)}, {kw}"
+
+
+def generate_chat(rng, chat_id, phone, start, messages_per_chat, session_gap_rate, media_rate, keywords,
+                  media_types=USER_MEDIA_TYPES):
+    """Mensajes de un chat, en orden cronológico (ver generate_export)."""
+    profile = rng.choices(LEAD_PROFILES, weights=[p[1] for p in LEAD_PROFILES])[0]
+    size = rng.randint(*messages_per_chat)
+    channel = f"synthetic-whatsapp-{phone[-9:]}"
+    moment = start
+    session_start = start
+    items = []
+    role = 'user' if rng.random() < 0.2 else 'bot'
+    for i in range(size):
+        if i:
+            if rng.random() < session_gap_rate / max(size - 1, 1):
+                # Reactivación: pausa más larga que session_gap_days
+                moment += timedelta(days=RULES.session_gap_days + rng.randrange(90))
+                session_start = moment
+            elif role == 'user':
+                # Tiempo de respuesta: rápido, moderado o lento (reglas de comportamiento)
+                moment += timedelta(hours=rng.choice([0.05, 0.5, 3, 12, 30, 72]))
+            else:
+                moment += timedelta(minutes=rng.randrange(1, 240))
+
+        if role == 'user' and profile[0] == 'ghost':
+            role = 'bot'
+        if role == 'user':
+            if rng.random() < media_rate:
+                content = {"type": rng.choice(media_types), "media": {"url": f"https://example.com/{_random_id(rng)}"}}
+            elif rng.random() < 0.05:
+                content = {"type": "button-click", "selectedButton": "Hablar con un Asesor"}
+            else:
+                content = {"type": "text", "text": _user_text(rng, profile, keywords)}
+        elif role == 'agent' and rng.random() < 0.15:
+            content = {"type": "file", "media": {"url": f"https://example.com/{_random_id(rng)}.pdf"}}
+        elif rng.random() < 0.1 and profile[0] in ('motivated', 'buyer'):
+            content = {"type": "text", "text": rng.choice(PAYMENT_TEXTS)}
+        elif role == 'bot' and rng.random() < 0.3:
+            content = {"type": "buttons", "text": rng.choice(BOT_TEXTS), "buttons": ["Hablar con un Asesor"]}
+        else:
+            content = {"type": "text", "text": rng.choice(AGENT_TEXTS if role == 'agent' else BOT_TEXTS)}
+
+        item = {
+            "id": _random_id(rng),
+            "creationTime": _iso(moment),
+            "from": role,
+            "queueId": "synthetic-admisiones",
+            "content": content,
+            "sessionCreationTime": _iso(session_start),
+            "chat": {"chatId": chat_id, "channelId": channel, "contactId": phone},
+            "sessionId": f"{chat_id}_{_iso(session_start)}",
+        }
+        if role == 'agent':
+            item["agentId"] = "synthetic-agent"
+        items.append(item)
+
+        if role == 'user':
+            role = rng.choice(['bot', 'agent', 'user'])
+        else:
+            role = rng.choice(['user', 'user', 'agent', 'bot'])
+    return items
+
+
+def generate_export(n_chats, messages_per_chat=(4, 20), session_gap_rate=0.1, media_rate=0.05,
+                    phone_collision_rate=0.05, local_phone_rate=0.05, media_types=USER_MEDIA_TYPES,
+                    interleave=False, seed=0):
+    """
+    Genera un export sintético con `n_chats` chats.
+
+    - messages_per_chat: (mínimo, máximo) de mensajes por chat.
+    - session_gap_rate: fracción aproximada de chats con una pausa de más de
+      session_gap_days (conversación reactivada).
+    - media_rate: probabilidad de que un mensaje del usuario sea imagen,
+      archivo, audio o video.
+    - phone_collision_rate: fracción de chats que reutilizan el teléfono de
+      un chat anterior (varios chats del mismo contacto).
+    - local_phone_rate: fracción de teléfonos en formato local ('09...').
+    - media_types: tipos de content entre los que se elige cada media del
+      usuario (por defecto USER_MEDIA_TYPES).
+    - interleave: mezcla los mensajes de todos los chats (el streaming cae
+      al modo de carga completa); si no, cada chat va contiguo.
+
+    La misma semilla produce siempre el mismo export.
+    """
+    if media_rate > 0 and not media_types:
+        raise ValueError("media_types no puede estar vacío si media_rate > 0.")
+    rng = random.Random(seed)
+    keywords = RULES.config['keywords']
+    items = []
+    phones = []
+    for _ in range(n_chats):
+        if phones and rng.random() < phone_collision_rate:
+            phone = rng.choice(phones)
+        else:
+            phone = _random_phone(rng)
+            if rng.random() < local_phone_rate:
+                phone = '0' + phone[-9:]
+            phones.append(phone)
+        start = SYNTHETIC_START + timedelta(seconds=rng.randrange(SYNTHETIC_SPAN_DAYS * 86_400))
+        items.extend(generate_chat(
+            rng, _random_id(rng), phone, start, messages_per_chat, session_gap_rate, media_rate, keywords,
+            media_types,
+        ))
+    if interleave:
+        rng.shuffle(items)
+    return {
+        "items": items,
+        "totalItems": len(items),
+        "exportedAt": _iso(SYNTHETIC_START + timedelta(days=SYNTHETIC_SPAN_DAYS + 120)),
+        "contacts": phones,
+        "totalContacts": len(phones),
+    }
+
+
+def _neotel_date(rng, moment):
+    # El reporte real mezcla los dos formatos
+    if rng.random() < 0.5:
+        return moment.strftime('%b %d %Y %I:%M%p')
+    return moment.strftime('%Y-%m-%d %H:%M:%S.') + f"{moment.microsecond // 1000:03d}"
+
+
+def generate_neotel(export, match_rate=0.8, duplicate_rate=0.1, extra_rows=0.2, seed=0):
+    """
+    Base Neotel sintética (DataFrame con las columnas del reporte real) para
+    los teléfonos de `export`.
+
+    - match_rate: fracción de teléfonos del export que aparecen en la base.
+    - duplicate_rate: fracción de esos teléfonos con más de una fila (se
+      desempata por la fecha más cercana al chat).
+    - extra_rows: filas de teléfonos que no están en el export, como
+      fracción de los teléfonos del export.
+    """
+    rng = random.Random(seed)
+    first_seen = {}
+    for item in export['items']:
+        phone = item['chat']['contactId']
+        if phone not in first_seen or item['creationTime'] < first_seen[phone]:
+            first_seen[phone] = item['creationTime']
+
+    rows = []
+
+    def add_row(phone, moment):
+        rows.append({
+            'Id contacto': 80_000 + len(rows),
+            'Nombre y Apellido': f"Lead {len(rows)}",
+            # Sin el prefijo de país en algunas filas (cruce por sufijo)
+            'teltelefono': float(phone[-9:] if rng.random() < 0.1 else phone),
+            'emlMail': f"lead{len(rows)}@mail.com",
+            'Program aInteres': rng.choice(PROGRAMS),
+            'Fecha Insert Lead': _neotel_date(rng, moment),
+            'Canal': rng.choice(CANALES),
+            'UTM Medium': rng.choice(UTM_MEDIUMS),
+            'Medio': rng.choice(["Pauta", "Orgánico", None]),
+        })
+
+    for phone, creation_time in first_seen.items():
+        if rng.random() >= match_rate:
+            continue
+        chat_start = datetime.strptime(creation_time[:19], '%Y-%m-%dT%H:%M:%S')
+        for _ in range(1 + (rng.random() < duplicate_rate) * rng.randint(1, 3)):
+            add_row(phone, chat_start - timedelta(hours=rng.randrange(1, 24 * 60)))
+    for _ in range(int(len(first_seen) * extra_rows)):
+        add_row(_random_phone(rng), SYNTHETIC_START + timedelta(seconds=rng.randrange(SYNTHETIC_SPAN_DAYS * 86_400)))
+
+    rng.shuffle(rows)
+    return pd.DataFrame(rows)
+
+
+def _media_types(value):
+    types = [t.strip() for t in value.split(',') if t.strip()]
+    if not types:
+        raise argparse.ArgumentTypeError("se necesita al menos un tipo de media.")
+    return types
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Genera exports de chats y bases Neotel sintéticas.")
+    parser.add_argument('--chats', type=int, default=1000, help="Cantidad de chats.")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--min-messages', type=int, default=4, help="Mínimo de mensajes por chat.")
+    parser.add_argument('--max-messages', type=int, default=20, help="Máximo de mensajes por chat.")
+    parser.add_argument('--session-gap-rate', type=float, default=0.1, help="Fracción de chats reactivados.")
+    parser.add_argument('--media-rate', type=float, default=0.05, help="Probabilidad de media en mensajes del usuario.")
+    parser.add_argument('--media-types', type=_media_types, default=USER_MEDIA_TYPES,
+                        help=f"Tipos de media del usuario, separados por comas (por defecto {','.join(USER_MEDIA_TYPES)}).")
+    parser.add_argument('--phone-collision-rate', type=float, default=0.05,
+                        help="Fracción de chats que repiten el teléfono de otro chat.")
+    parser.add_argument('--local-phone-rate', type=float, default=0.05,
+                        help="Fracción de teléfonos en formato local ('09...').")
+    parser.add_argument('--interleave', action='store_true', help="Mezcla los mensajes de todos los chats.")
+    parser.add_argument('-o', '--output', default='-', help="Archivo JSON del export ('-' = stdout).")
+    parser.add_argument('--neotel-out', help="Genera también la base Neotel (.xlsx o .csv).")
+    parser.add_argument('--neotel-match-rate', type=float, default=0.8,
+                        help="Fracción de teléfonos del export presentes en la base Neotel.")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    export = generate_export(
+        args.chats, (args.min_messages, args.max_messages), args.session_gap_rate, args.media_rate,
+        args.phone_collision_rate, args.local_phone_rate, args.media_types,
+        interleave=args.interleave, seed=args.seed,
+    )
+    if args.output == '-':
+        json.dump(export, sys.stdout, ensure_ascii=False)
+    else:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(export, f, ensure_ascii=False)
+    print(f"Export: {args.chats} chats, {export['totalItems']} mensajes.", file=sys.stderr)
+
+    if args.neotel_out:
+        neotel_df = generate_neotel(export, args.neotel_match_rate, seed=args.seed)
+        if args.neotel_out.lower().endswith('.csv'):
+            neotel_df.to_csv(args.neotel_out, index=False)
+        else:
+            neotel_df.to_excel(args.neotel_out, index=False)
+        print(f"Base Neotel: {len(neotel_df)} registros -> {args.neotel_out}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
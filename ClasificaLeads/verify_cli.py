@@ -0,0 +1,72 @@
+import json
+import os
+import shutil
+import tempfile
+import openpyxl
+import pandas as pd
+import cli
+from logic import process_file
+
+def read_ndjson(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f]
+
+def test_cli():
+    print("Testing cli.main...")
+
+    expected = process_file('GMP uees.json')
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        inputs = os.path.join(tmp_dir, 'exports')
+        os.makedirs(inputs)
+        for name in ['a.json', 'b.json']:
+            shutil.copy('GMP uees.json', os.path.join(inputs, name))
+
+        # Salida combinada, en un proceso y en dos
+        for jobs in ['1', '2']:
+            output = os.path.join(tmp_dir, f'leads_{jobs}.ndjson')
+            assert cli.main([inputs, '-o', output, '--jobs', jobs]) == 0
+            assert read_ndjson(output) == expected + expected, f"--jobs {jobs}"
+
+        # Un archivo de salida por export
+        per_file = os.path.join(tmp_dir, 'por_archivo')
+        assert cli.main([inputs, '--per-file', '-o', per_file, '-f', 'csv', '--jobs', '1']) == 0
+        assert sorted(os.listdir(per_file)) == ['a_clasificado.csv', 'b_clasificado.csv']
+        csv_df = pd.read_csv(os.path.join(per_file, 'a_clasificado.csv'))
+        assert list(csv_df['chat_id']) == [r['chat_id'] for r in expected]
+
+        # --only sin coincidencias: export vacío y sin error, también en Excel
+        only_dir = os.path.join(tmp_dir, 'sin_match')
+        assert cli.main([inputs, '--per-file', '-o', only_dir, '-f', 'xlsx', '--only', '000', '--jobs', '1']) == 0
+        wb = openpyxl.load_workbook(os.path.join(only_dir, 'a_clasificado.xlsx'))
+        assert wb['Leads'].max_row == 1
+        only_output = os.path.join(tmp_dir, 'sin_match.xlsx')
+        assert cli.main([inputs, '-o', only_output, '--only', '000', '--jobs', '1']) == 0
+        assert openpyxl.load_workbook(only_output)['Leads'].max_row == 1
+
+        # --only con un chat existente
+        chat_id = expected[0]['chat_id']
+        only_output = os.path.join(tmp_dir, 'un_chat.ndjson')
+        assert cli.main([os.path.join(inputs, 'a.json'), '-o', only_output, '--only', chat_id]) == 0
+        assert [r['chat_id'] for r in read_ndjson(only_output)] == [chat_id]
+
+        # Un archivo malformado: exit 1, pero el resto se procesa igual
+        with open(os.path.join(inputs, 'c.json'), 'w', encoding='utf-8') as f:
+            f.write('{"items": [{"chat": ')
+        output = os.path.join(tmp_dir, 'con_error.ndjson')
+        assert cli.main([inputs, '-o', output, '--jobs', '1']) == 1
+        assert read_ndjson(output) == expected + expected
+        per_file = os.path.join(tmp_dir, 'con_error')
+        assert cli.main([inputs, '--per-file', '-o', per_file, '-f', 'json', '--jobs', '2']) == 1
+        assert {'a_clasificado.json', 'b_clasificado.json'} <= set(os.listdir(per_file))
+
+        # Sin archivos que procesar
+        assert cli.main([os.path.join(tmp_dir, 'vacio', '*.json')]) == 2
+    finally:
+        shutil.rmtree(tmp_dir)
+    print(f"  {len(expected)} leads por archivo")
+
+    print("\nSUCCESS: All tests passed!")
+
+if __name__ == "__main__":
+    test_cli()
@@ -0,0 +1,106 @@
+import io
+import json
+import openpyxl
+import pandas as pd
+from logic import process_data
+from export import (
+    leads_excel_bytes, summary_metrics, CLASSIFICATION_FILLS, export_to_tempfile, export_rows, PARQUET_AVAILABLE,
+    EXPORT_FORMATS, EXPORT_COLUMNS,
+)
+
+def test_excel_export():
+    print("Testing Excel export...")
+
+    with open('GMP uees.json', 'r', encoding='utf-8') as f:
+        results = process_data(json.load(f))
+    df = pd.DataFrame(results)
+
+    wb = openpyxl.load_workbook(io.BytesIO(leads_excel_bytes(df)))
+    assert wb.sheetnames == ['Leads', 'Resumen']
+    ws = wb['Leads']
+    assert ws.max_row == len(df) + 1
+    assert ws.freeze_panes == 'A2'
+
+    header = [c.value for c in ws[1]]
+    assert header == list(df.columns)
+    assert ws['A1'].font.b, "El encabezado debería ir en negrita"
+
+    # Cada fila lleva el color de su clasificación
+    clasif_col = header.index('clasificacion') + 1
+    for row in ws.iter_rows(min_row=2):
+        expected = CLASSIFICATION_FILLS[row[clasif_col - 1].value].fgColor.rgb
+        assert all(c.fill.fgColor.rgb == expected for c in row), f"Fila {row[0].row} con color incorrecto"
+
+    # Listas como texto y ancho con tope
+    signals = ws.cell(row=2, column=header.index('señales_clave') + 1).value
+    assert signals == str(results[0]['señales_clave'])
+    assert max(d.width for d in ws.column_dimensions.values()) <= 50
+
+    metrics = summary_metrics(df)
+    summary = {row[0].value: row[1].value for row in wb['Resumen'].iter_rows(min_row=2)}
+    print(f"  Resumen: {summary}")
+    assert summary['Total Leads'] == metrics['total_leads']
+    assert summary['SQL'] == metrics['sql_leads']
+
+    print("\nSUCCESS: All tests passed!")
+
+def test_streaming_exports():
+    print("Testing streaming exports...")
+
+    with open('GMP uees.json', 'r', encoding='utf-8') as f:
+        results = process_data(json.load(f))
+
+    # Se exporta desde un generador, como en los jobs batch
+    data = export_to_tempfile(iter(results), 'json').read().decode('utf-8')
+    assert data == json.dumps(results, indent=2, ensure_ascii=False), "El JSON debería ser idéntico al de json.dumps"
+
+    lines = export_to_tempfile(iter(results), 'ndjson').read().decode('utf-8').splitlines()
+    assert [json.loads(line) for line in lines] == results
+
+    csv_df = pd.read_csv(export_to_tempfile(iter(results), 'csv'))
+    assert len(csv_df) == len(results)
+    assert list(csv_df['chat_id']) == [r['chat_id'] for r in results]
+
+    if PARQUET_AVAILABLE:
+        parquet_df = pd.read_parquet(export_to_tempfile(iter(results), 'parquet'))
+        assert list(parquet_df['score_total']) == [r['score_total'] for r in results]
+        assert list(parquet_df['señales_clave'].iloc[0]) == results[0]['señales_clave']
+    print(f"  {len(results)} leads exportados (parquet: {'sí' if PARQUET_AVAILABLE else 'no disponible'})")
+
+    print("\nSUCCESS: All tests passed!")
+
+def test_empty_exports():
+    print("Testing exports sin leads...")
+
+    assert summary_metrics(pd.DataFrame()) == {
+        'total_leads': 0, 'spam_leads': 0, 'sql_leads': 0, 'mql_leads': 0, 'avg_score': 0,
+    }
+
+    for fmt in EXPORT_FORMATS:
+        if fmt == 'parquet' and not PARQUET_AVAILABLE:
+            continue
+        output = io.BytesIO()
+        assert export_rows([], output, fmt) == 0, fmt
+        output.seek(0)
+        if fmt == 'xlsx':
+            wb = openpyxl.load_workbook(output)
+            assert [c.value for c in wb['Leads'][1]] == EXPORT_COLUMNS
+            assert wb['Leads'].max_row == 1
+            summary = {row[0].value: row[1].value for row in wb['Resumen'].iter_rows(min_row=2)}
+            assert summary['Total Leads'] == 0 and summary['Score Promedio'] == '0.0'
+        elif fmt == 'csv':
+            assert list(pd.read_csv(output).columns) == EXPORT_COLUMNS
+        elif fmt == 'parquet':
+            assert list(pd.read_parquet(output).columns) == EXPORT_COLUMNS
+        elif fmt == 'json':
+            assert json.load(output) == []
+        else:
+            assert output.getvalue() == b''
+    print(f"  Formatos: {', '.join(EXPORT_FORMATS)}")
+
+    print("\nSUCCESS: All tests passed!")
+
+if __name__ == "__main__":
+    test_excel_export()
+    test_streaming_exports()
+    test_empty_exports()
@@ -0,0 +1,42 @@
+import copy
+import json
+from logic import IncrementalScorer, analyze_conversation, group_and_sort
+
+def test_incremental_scorer():
+    print("Testing IncrementalScorer...")
+
+    with open('GMP uees.json', 'r', encoding='utf-8') as f:
+        chats = group_and_sort(json.load(f)['items'])
+
+    checked = 0
+    for chat_id, messages in chats.items():
+        scorer = IncrementalScorer(chat_id)
+        for i, msg in enumerate(messages):
+            scorer.add(copy.deepcopy(msg))
+            expected = analyze_conversation(chat_id, messages[:i + 1])
+            assert scorer.result() == expected, f"{chat_id}: difiere tras el mensaje {i}"
+            checked += 1
+
+        # Mensajes fuera de orden: se insertan en su lugar
+        reversed_scorer = IncrementalScorer(chat_id)
+        for msg in reversed(messages):
+            reversed_scorer.add(copy.deepcopy(msg))
+        assert reversed_scorer.result() == analyze_conversation(chat_id, messages)
+    print(f"  {checked} mensajes en {len(chats)} chats")
+
+    # Keyword partida entre dos mensajes y reactivación tras 30 días
+    base = {"chat": {"chatId": "c1", "contactId": "593991234567"}}
+    scorer = IncrementalScorer("c1", [
+        {**base, "from": "bot", "creationTime": "2025-01-01T10:00:00Z", "content": {"type": "text", "text": "Hola"}},
+        {**base, "from": "user", "creationTime": "2025-03-01T10:00:00Z", "content": {"type": "text", "text": "lo voy a"}},
+    ])
+    scorer.add({**base, "from": "user", "creationTime": "2025-03-01T10:01:00Z", "content": {"type": "text", "text": "pensar"}})
+    result = scorer.result()
+    assert "Objeción suave: 'lo voy a pensar'" in result['señales_clave']
+    assert result['sesiones_detectadas'] == 2
+    assert result == analyze_conversation("c1", scorer.messages)
+
+    print("\nSUCCESS: All tests passed!")
+
+if __name__ == "__main__":
+    test_incremental_scorer()
@@ -0,0 +1,87 @@
+import random
+import re
+from logic import scan_user_text, check_spam, RULES, SPAM_CATEGORIES, USER_TEXT_CATEGORIES, MOTIVATION_CATEGORIES
+
+def user_messages(texts):
+    return [{"from": "user", "content": {"type": "text", "text": text}} for text in texts]
+
+def reference_hits(texts):
+    """Las búsquedas originales: una keyword a la vez, en el orden de la lista."""
+    keywords = RULES.config['keywords']
+    texts = [text.lower() for text in texts]
+    hits = {}
+
+    # Spam: mensaje por mensaje (substring); vale el primer mensaje con algún hit
+    for name in SPAM_CATEGORIES:
+        hits[name] = None
+    for text in texts:
+        found = {name: next((kw for kw in keywords[name] if kw in text), None) for name in SPAM_CATEGORIES}
+        if any(found.values()):
+            hits.update(found)
+            break
+
+    # Resto: palabras completas; la motivación sobre el texto sin negaciones
+    all_user_text = " ".join(texts)
+    clean_text = all_user_text
+    for neg in RULES.negation_phrases:
+        clean_text = clean_text.replace(neg, "")
+    for name in USER_TEXT_CATEGORIES:
+        text = clean_text if name in MOTIVATION_CATEGORIES else all_user_text
+        hits[name] = next((kw for kw in keywords[name] if re.search(r'\b' + re.escape(kw) + r'\b', text)), None)
+    return hits
+
+# (mensajes del usuario, hits esperados de algunas categorías)
+EXPECTED = [
+    # Gana la primera keyword de la lista, no la primera que aparece en el texto
+    (["me interesa mucho el trabajo"], {'strong_motivation': "trabajo", 'moderate_motivation': "me interesa"}),
+    (["quiero un ascenso, es para mi trabajo"], {'strong_motivation': "trabajo"}),
+    # Palabras completas: presupuesto no es puesto
+    (["no tengo presupuesto"], {'labor_impact': None, 'soft_objection': "presupuesto"}),
+    (["busco un mejor puesto"], {'labor_impact': "puesto"}),
+    # Keywords solapadas dentro de la misma categoría
+    (["voy a denunciar esto"], {'hostile': "denunciar"}),
+    (["esto es spam, voy a denunciar"], {'hostile': "spam"}),
+    # Negaciones: la motivación se busca sin ellas, las objeciones no
+    (["no me interesa"], {'moderate_motivation': None}),
+    (["no me interesa el trabajo"], {'strong_motivation': "trabajo", 'moderate_motivation': None}),
+    (["no necesito", "capacitarme para mi empresa"], {'strong_motivation': None, 'labor_impact': "empresa"}),
+    # Spam: substring, y solo el primer mensaje que tenga algún hit
+    (["hola", "no pedí esto", "idiota"], {'no_data': "no pedí", 'hostile': None}),
+    (["idiota", "no pedí esto"], {'no_data': None, 'hostile': "idiota"}),
+    (["no es spameo"], {'hostile': "spam"}),
+    # No calza entre mensajes
+    (["yo no", "pedí nada"], {'no_data': None}),
+]
+
+def test_keyword_scan():
+    print("Testing keyword scan...")
+
+    for texts, expected in EXPECTED:
+        hits = scan_user_text(user_messages(texts))
+        assert hits == reference_hits(texts), texts
+        for name, kw in expected.items():
+            assert hits[name] == kw, f"{texts}: {name} = {hits[name]!r}, se esperaba {kw!r}"
+
+    # check_spam: no_data antes que hostile dentro del mismo mensaje
+    assert check_spam(None, user_messages(["no pedí nada, idiota"])) == (
+        True, "Lead declara no haber dejado sus datos: 'no pedí'")
+    assert check_spam(None, user_messages(["idiota", "no pedí nada"])) == (True, "Respuesta hostil detectada: 'idiota'")
+    assert check_spam(None, user_messages(["ok"])) == (True, "Respuesta incoherente o sin sentido")
+    assert check_spam(None, user_messages(["ok", "ok"])) == (False, None)
+
+    # Textos al azar armados con keywords, negaciones y relleno
+    rng = random.Random(0)
+    vocabulary = [kw for keywords in RULES.config['keywords'].values() for kw in keywords]
+    vocabulary += RULES.negation_phrases + ["hola", "el", "presupuesto", "sí", "y", ",", "pre", "mente"]
+    for _ in range(3000):
+        texts = [
+            rng.choice(["", " ", ""]).join(rng.choice(vocabulary) for _ in range(rng.randint(1, 5)))
+            for _ in range(rng.randint(1, 4))
+        ]
+        assert scan_user_text(user_messages(texts)) == reference_hits(texts), texts
+    print(f"  {len(EXPECTED)} casos fijos y 3000 al azar")
+
+    print("\nSUCCESS: All tests passed!")
+
+if __name__ == "__main__":
+    test_keyword_scan()
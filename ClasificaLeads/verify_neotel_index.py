@@ -0,0 +1,225 @@
+import io
+import os
+import random
+import tempfile
+from decimal import Decimal
+import numpy as np
+import openpyxl
+import pandas as pd
+from logic import (
+    normalize_phone, normalize_phone_column, NeotelIndex, match_neotel_data, process_data, group_and_sort, load_neotel_excel, import_neotel_sqlite,
+    NEOTEL_BULK_MIN_CHATS,
+)
+from synthetic import generate_export, generate_neotel
+
+def test_neotel_index():
+    print("Testing NeotelIndex...")
+
+    # Mismo teléfono en dos filas: debe ganar la fecha más cercana al chat
+    neotel_df = pd.DataFrame({
+        'teltelefono': [593991234567.0, 593991234567.0, '998765432'],
+        'Fecha Insert Lead': ['2025-12-01 10:00:00', 'Dec 20 2025  9:58AM', pd.Timestamp('2025-12-02 11:30:00')],
+        'UTM Medium': ['social', 'email', None],
+        'Canal': ['facebook', 'newsletter', 'google'],
+        'Program aInteres': ['Derecho Digital', 'MBA', 'Marketing'],
+        'Llamados Discador': [1, 2, 3],
+    })
+    columns_before = list(neotel_df.columns)
+
+    index = NeotelIndex(neotel_df)
+    assert list(neotel_df.columns) == columns_before, "NeotelIndex no debe modificar el DataFrame"
+
+    # Round-trip por disco
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'neotel.idx')
+        index.save(path)
+        index = NeotelIndex.load(path)
+
+    early = index.match('593991234567', '2025-12-01T10:05:00Z')
+    late = index.match('593991234567', '2025-12-19T08:00:00Z')
+    print(f"  Early chat: {early}")
+    print(f"  Late chat:  {late}")
+    assert early['utm_medium'] == 'social', "Early chat debería tomar la primera fila"
+    assert late['utm_medium'] == 'email', "Late chat debería tomar la segunda fila"
+    assert index.match('998765432', '')['utm_medium'] == '', "UTM vacío debería quedar como ''"
+    assert index.match('111111111', '2025-12-01T10:05:00Z') == {}, "Teléfono sin match"
+
+    # Sin código de país (o con 0 local) se cruza por los últimos 9 dígitos
+    assert index.match('0991234567', '2025-12-19T08:00:00Z') == late, "Debería cruzar por sufijo"
+    assert index.match_bulk(['991234567'], ['2025-12-01T10:05:00Z']) == [early]
+    assert index.match('593998765432', '')['programa_interes'] == 'Marketing'
+    assert NeotelIndex(neotel_df, suffixes=()).match('0991234567', '') == {}
+
+    # El índice da lo mismo que el DataFrame original
+    assert match_neotel_data('593991234567', '2025-12-19T08:00:00Z', neotel_df) == late
+
+    chat_data = {"items": [{
+        "chat": {"chatId": "chat1", "contactId": "593991234567"},
+        "from": "user",
+        "creationTime": "2025-12-19T08:00:00Z",
+        "content": {"type": "text", "text": "Hola, info precio"}
+    }]}
+    assert process_data(chat_data, index) == process_data(chat_data, neotel_df)
+
+    print("\nSUCCESS: All tests passed!")
+
+def test_load_neotel_excel():
+    print("Testing load_neotel_excel...")
+    path = 'DatabaseQuery_34_30122025_10135276.xls'
+    full_df = pd.read_excel(path)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cold = load_neotel_excel(path, tmp)
+        assert len(os.listdir(tmp)) == 1, "Debería haberse escrito la caché"
+        with open(path, 'rb') as f:
+            warm = load_neotel_excel(f, tmp)
+    print(f"  Columnas: {list(warm.columns)}")
+    assert cold.equals(warm), "La caché debería devolver la misma base"
+    assert len(warm) == len(full_df)
+    assert 'Llamados Discador' not in warm.columns, "Solo deberían quedar las columnas del cruce"
+
+    full_index, pruned_index = NeotelIndex(full_df), NeotelIndex(warm)
+    for phone in full_df['teltelefono'].head(20):
+        assert full_index.match(phone, '2025-12-10T00:00:00Z') == pruned_index.match(phone, '2025-12-10T00:00:00Z')
+
+    print("\nSUCCESS: All tests passed!")
+
+def utm_workbook():
+    """
+    .xlsx con UTM de distintos tipos: read_excel infiere cada columna completa
+    (incluidas las filas sin teléfono), y ese tipo define el texto exportado.
+    """
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.append(['teltelefono', 'Fecha Insert Lead', 'UTM Source', 'UTM Medium', 'UTM Origen', 'Program aInteres'])
+    ws.append([593990000001, '2025-12-01 10:00:00', 1, 10, '7', 'MBA'])
+    ws.append([593990000002, '2025-12-01 10:00:00', 2, 20, '8', 5])
+    ws.append([593990000003, '2025-12-01 10:00:00', 3, 30, None, 6.5])
+    ws.append([None, '2025-12-01 10:00:00', None, 40, '9', 'Derecho'])
+    output = io.BytesIO()
+    wb.save(output)
+    return output.getvalue()
+
+# Match esperado por teléfono, igual al de read_excel sin tipos fijos:
+# numérica con vacíos -> float; entera sin vacíos -> int; texto numérico -> número; mezclada -> tal cual
+UTM_EXPECTED = {
+    '593990000001': {'utm_source': '1.0', 'utm_medium': '10', 'utm_origen': '7.0', 'programa_interes': 'MBA'},
+    '593990000002': {'utm_source': '2.0', 'utm_medium': '20', 'utm_origen': '8.0', 'programa_interes': '5'},
+    '593990000003': {'utm_source': '3.0', 'utm_medium': '30', 'utm_origen': '', 'programa_interes': '6.5'},
+}
+
+def utm_matches(index):
+    return {phone: {k: v for k, v in index.match(phone, '2025-12-02T00:00:00Z').items() if k in UTM_EXPECTED[phone]}
+            for phone in UTM_EXPECTED}
+
+def test_neotel_utm_types():
+    print("Testing tipos de los UTM...")
+    data = utm_workbook()
+    assert utm_matches(NeotelIndex(pd.read_excel(io.BytesIO(data)))) == UTM_EXPECTED
+    assert utm_matches(NeotelIndex(load_neotel_excel(io.BytesIO(data)))) == UTM_EXPECTED
+    with tempfile.TemporaryDirectory() as tmp:
+        store = import_neotel_sqlite(io.BytesIO(data), os.path.join(tmp, 'neotel.sqlite'))
+        assert utm_matches(store) == UTM_EXPECTED
+        store.close()
+    print("\nSUCCESS: All tests passed!")
+
+def test_neotel_sqlite():
+    print("Testing import_neotel_sqlite...")
+    path = 'DatabaseQuery_34_30122025_10135276.xls'
+    full_index = NeotelIndex(pd.read_excel(path))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = import_neotel_sqlite(path, os.path.join(tmp, 'neotel.sqlite'))
+        print(f"  Filas con teléfono: {len(store)} de {store.source_rows}")
+        assert len(store) == len(full_index)
+
+        phones = list(pd.read_excel(path)['teltelefono'])
+        dates = ['2025-12-10T00:00:00Z'] * len(phones)
+        assert store.match_bulk(phones, dates) == full_index.match_bulk(phones, dates)
+        assert store.match('123', dates[0]) == {}
+        store.close()
+
+    print("\nSUCCESS: All tests passed!")
+
+def test_match_bulk_join():
+    print("Testing NeotelIndex.match_bulk (as-of join)...")
+
+    export = generate_export(NEOTEL_BULK_MIN_CHATS + 500, phone_collision_rate=0.1, seed=3)
+    chats = list(group_and_sort(export['items']).values())
+    phones = [messages[0]['chat']['contactId'] for messages in chats]
+    dates = [messages[0]['creationTime'] for messages in chats]
+    neotel_df = generate_neotel(export, duplicate_rate=0.4, seed=3)
+
+    # Casos de desempate: fechas iguales (gana la primera fila de la base),
+    # equidistantes hacia atrás y adelante, sin fecha y a más de MAX_DATE_DIFF
+    rng = random.Random(3)
+    extra = []
+    for i, (phone, date) in enumerate(zip(phones, dates)):
+        if i % 7:
+            continue
+        chat_dt = pd.Timestamp(date).tz_localize(None)
+        case = rng.choice(['same', 'equidistant', 'nat', 'far'])
+        if case == 'same':
+            offsets = [pd.Timedelta(days=3)] * 2
+        elif case == 'equidistant':
+            offsets = [pd.Timedelta(hours=-5), pd.Timedelta(hours=5)]
+        elif case == 'nat':
+            offsets = [None, pd.Timedelta(days=-1)]
+        else:
+            offsets = [pd.Timedelta(days=365 * 11), pd.Timedelta(days=-365 * 12)]
+        rng.shuffle(offsets)
+        for offset in offsets:
+            extra.append({
+                'teltelefono': phone,
+                'Fecha Insert Lead': '' if offset is None else str(chat_dt + offset),
+                'UTM Medium': f"{case}-{len(extra)}",
+                'Program aInteres': 'Caso',
+            })
+    neotel_df = pd.concat([neotel_df, pd.DataFrame(extra)], ignore_index=True).sample(frac=1, random_state=3)
+
+    index = NeotelIndex(neotel_df)
+    expected = [index.match(phone, date) for phone, date in zip(phones, dates)]
+    assert sum(1 for m in expected if m) > NEOTEL_BULK_MIN_CHATS // 2
+    assert index.match_bulk(phones, dates) == expected, "El join vectorizado difiere de match"
+    # Forzando el join con pocos chats
+    assert index.match_bulk(phones[:300], dates[:300], min_chats=0) == expected[:300]
+    print(f"  {len(phones)} chats, {sum(1 for m in expected if m)} con match")
+
+    print("\nSUCCESS: All tests passed!")
+
+def test_normalize_phone_column():
+    print("Testing normalize_phone_column...")
+
+    # Cada dtype con que puede llegar la columna de teléfonos de Neotel
+    columns = {
+        'float': pd.Series([593993575726.0, np.nan, 0.0, -0.0, np.inf, -np.inf, 2.0**63, 1e20, -593993575726.0, 12.7]),
+        'int64': pd.Series([593993575726, 0, -42, 2**63 - 1, -2**63]),
+        'uint64': pd.Series([0, 2**63, 2**64 - 1, 593993575726], dtype='uint64'),
+        'Int64': pd.Series([593993575726, None, 0, -7], dtype='Int64'),
+        'bool': pd.Series([True, False]),
+        'string': pd.Series(['+593 99 357 5726', None, '', '(099) 123-4567', 'abc'], dtype='string'),
+        'str': pd.Series(['+593 99 357 5726', None, ''], dtype='str'),
+        'object': pd.Series([
+            '593-99', 593993575726.0, 593993575726, None, np.nan, pd.NA, pd.NaT, 0, 0.0, '', True, False,
+            Decimal('593.5'), 2**70, float('inf'), 1e19, np.int64(12), np.float64(3.0),
+        ], dtype=object),
+        'empty': pd.Series([], dtype=object),
+    }
+    for name, column in columns.items():
+        column.index = column.index * 2 + 1
+        result = normalize_phone_column(column)
+        expected = column.apply(normalize_phone)
+        assert result.index.equals(column.index), name
+        assert result.tolist() == expected.tolist(), f"{name}: {result.tolist()} != {expected.tolist()}"
+    assert normalize_phone_column([593993575726.0]).tolist() == ["593993575726"]
+    print(f"  {len(columns)} dtypes")
+
+    print("\nSUCCESS: All tests passed!")
+
+if __name__ == "__main__":
+    test_neotel_index()
+    test_normalize_phone_column()
+    test_match_bulk_join()
+    test_load_neotel_excel()
+    test_neotel_utm_types()
+    test_neotel_sqlite()
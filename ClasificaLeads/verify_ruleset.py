@@ -0,0 +1,76 @@
+import copy
+import json
+import os
+import shutil
+import tempfile
+import logic
+from logic import (
+    Ruleset, load_ruleset, reload_ruleset, analyze_conversation, group_and_sort,
+    process_data, ChatStateStore, RULESET_PATH,
+)
+
+def test_ruleset():
+    print("Testing ruleset...")
+
+    with open('GMP uees.json', 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    with open(RULESET_PATH, 'r', encoding='utf-8') as f:
+        config = json.load(f)
+
+    # Reglas pasadas explícitamente: una keyword nueva y otro umbral de SQL
+    custom = copy.deepcopy(config)
+    custom['keywords']['strong_motivation'].append('diplomado')
+    custom['points']['total']['sql'] = 101
+    rules = Ruleset(custom)
+    chats = group_and_sort(json.loads(json.dumps(data))['items'])
+    for chat_id, messages in chats.items():
+        result = analyze_conversation(chat_id, messages, rules)
+        if result['clasificacion'] == 'SQL':
+            assert result['razon_principal'].startswith("Regla prioritaria"), chat_id
+
+    for broken in [{'points': {}}, {'keywords': {'no_data': 'spam'}}, {'incoherent_patterns': ['[']}]:
+        try:
+            Ruleset({**config, **broken})
+            assert False, f"Debería rechazar {broken}"
+        except ValueError:
+            pass
+
+    # Recarga en caliente sobre una copia del archivo
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmp_dir, 'ruleset.json')
+        shutil.copy(RULESET_PATH, path)
+        load_ruleset(path)
+        expected = process_data(json.loads(json.dumps(data)))
+        state = ChatStateStore(os.path.join(tmp_dir, 'estado.sqlite'))
+        assert process_data(json.loads(json.dumps(data)), state=state) == expected
+        assert not reload_ruleset(), "Sin cambios no se recarga"
+
+        changed = copy.deepcopy(config)
+        changed['version'] = 2
+        changed['points']['behavior']['agent_last'] = -10
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(changed, f)
+        assert reload_ruleset() and logic.RULES.version == 2
+        reloaded = process_data(json.loads(json.dumps(data)), state=state)
+        assert reloaded != expected
+        assert state.rescored == 2 * len(expected), "La recarga debería invalidar el estado guardado"
+
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write('{"version": 3,')
+        try:
+            reload_ruleset()
+            assert False, "Un archivo inválido debería dar ValueError"
+        except ValueError:
+            pass
+        assert logic.RULES.version == 2, "Con un archivo inválido siguen las reglas anteriores"
+        state.close()
+    finally:
+        load_ruleset()
+        shutil.rmtree(tmp_dir)
+    print(f"  {len(expected)} leads reclasificados tras la recarga")
+
+    print("\nSUCCESS: All tests passed!")
+
+if __name__ == "__main__":
+    test_ruleset()
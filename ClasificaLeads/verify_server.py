@@ -0,0 +1,83 @@
+import asyncio
+import json
+from logic import process_data, group_and_sort, EPOCH_KEY
+from server import ScoringService, handle_connection
+
+# Mensajes con JSON válido pero con la forma equivocada
+MALFORMED_ITEMS = [
+    {"chat": {"chatId": "x"}, "content": "hola", "from": "user"},
+    {"chat": "abc"},
+    {"chat": None, "content": {"type": "text", "text": "hola"}},
+    {"chat": {"chatId": ["x"]}, "content": {"type": "text", "text": "hola"}},
+    {"chat": {"chatId": "x", "contactId": {"numero": 593}}},
+    {"chat": {"chatId": "x"}, "content": {"type": "text", "text": 5}},
+    {"chat": {"chatId": "x"}, "creationTime": 1735689600},
+    ["no", "es", "un", "mensaje"],
+]
+
+async def post(port, path, body):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(f"POST {path} HTTP/1.1\r\nContent-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body)
+    response = await reader.read()
+    writer.close()
+    head, _, payload = response.partition(b'\r\n\r\n')
+    return int(head.split()[1]), json.loads(payload)
+
+async def run_checks(chats):
+    service = ScoringService()
+    batches = service.start()
+    server = await asyncio.start_server(lambda r, w: handle_connection(service, r, w), '127.0.0.1', 0)
+    port = server.sockets[0].getsockname()[1]
+
+    # Un chat por petición, todas a la vez: se clasifican en micro-lotes
+    bodies = [json.dumps({'items': messages}).encode() for messages in chats]
+    responses = await asyncio.gather(*(post(port, '/score', body) for body in bodies))
+    status, payload = await post(port, '/score', b'{"items": 1}')
+    assert status == 400, "Un cuerpo sin lista de items debería dar 400"
+
+    # JSON válido con mensajes malformados: 400, y el servicio sigue atendiendo
+    for item in MALFORMED_ITEMS:
+        status, payload = await post(port, '/score', json.dumps({'items': [item]}).encode())
+        assert status == 400 and 'items[0]' in payload['error'], (item, status, payload)
+
+    # Una petición que falla al clasificarse no arrastra a las de su mismo lote
+    good = chats[:5]
+    results = await asyncio.gather(
+        service.score([('roto', [{'chat': {'chatId': 'roto'}, 'content': 'hola', 'from': 'user'}])]),
+        *(service.score(list(group_and_sort(json.loads(json.dumps(messages))).items())) for messages in good),
+        return_exceptions=True,
+    )
+    assert isinstance(results[0], AttributeError)
+    assert results[1:] == [payload['leads'] for _, payload in responses[:5]]
+
+    # Un error inesperado responde 500 en lugar de cortar la conexión
+    service.health = lambda: 1 / 0
+    status, payload = await post(port, '/health', b'')
+    assert status == 500, status
+    status, payload = await post(port, '/score', bodies[0])
+    assert status == 200
+
+    server.close()
+    batches.cancel()
+    return responses, service
+
+def test_scoring_service():
+    print("Testing scoring service...")
+
+    with open('GMP uees.json', 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    expected = process_data(json.loads(json.dumps(data)))
+    chats = list(group_and_sort(data['items']).values())
+    for messages in chats:
+        for msg in messages:
+            msg.pop(EPOCH_KEY, None)
+
+    responses, service = asyncio.run(run_checks(chats))
+    assert all(status == 200 for status, _ in responses)
+    assert [lead for _, payload in responses for lead in payload['leads']] == expected
+    print(f"  {service.requests} peticiones en {service.batches} lotes")
+
+    print("\nSUCCESS: All tests passed!")
+
+if __name__ == "__main__":
+    test_scoring_service()
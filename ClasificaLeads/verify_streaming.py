@@ -0,0 +1,187 @@
+import copy
+import io
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+from logic import (
+    process_data, process_stream, iter_items, ScoringJob, ChatStateStore, AnalysisCache, group_and_sort,
+    analyze_conversation,
+)
+from synthetic import generate_export
+
+def test_streaming_matches_full_load():
+    print("Testing streaming ingestion...")
+
+    for path in ['GMP uees.json', 'test_user_data.json']:
+        with open(path, 'r', encoding='utf-8') as f:
+            expected = process_data(json.load(f))
+
+        # Binario (como el UploadedFile de Streamlit) y texto
+        for mode in ['rb', 'r']:
+            kwargs = {} if mode == 'rb' else {'encoding': 'utf-8'}
+            with open(path, mode, **kwargs) as f:
+                streamed = list(process_stream(f))
+
+            assert streamed == expected, f"{path} ({mode}): streaming difiere de process_data"
+            print(f"  {path} ({mode}): {len(streamed)} leads OK")
+
+    # Mismo resultado con otra semilla de hash (el orden de las señales no depende de un set)
+    script = "import json, sys; from logic import process_file; json.dump(process_file('GMP uees.json'), sys.stdout)"
+    outputs = {
+        subprocess.run([sys.executable, '-c', script], capture_output=True, check=True,
+                       env={**os.environ, 'PYTHONHASHSEED': seed}).stdout
+        for seed in ['1', '2']
+    }
+    assert len(outputs) == 1, "Los resultados dependen de PYTHONHASHSEED"
+
+    # Bloques chicos con BOM y caracteres multibyte: una lectura que solo trae
+    # parte de un carácter no es el fin del archivo
+    data = {"items": [{"content": {"text": "niño ✓ 😀"}}, {"content": {"text": "adiós"}}]}
+    raw = '\ufeff'.encode('utf-8') + json.dumps(data, ensure_ascii=False).encode('utf-8')
+    for chunk_size in [1, 2, 3, 4]:
+        assert list(iter_items(io.BytesIO(raw), chunk_size)) == data['items'], f"bytes, chunk_size={chunk_size}"
+        text = io.StringIO(raw.decode('utf-8'))
+        assert list(iter_items(text, chunk_size)) == data['items'], f"texto, chunk_size={chunk_size}"
+
+    print("\nSUCCESS: All tests passed!")
+
+def test_targeted_lookup():
+    print("Testing targeted lookup...")
+
+    with open('GMP uees.json', 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    full = process_data(data)
+    phone, chat_id = full[3]['telefono'], full[10]['chat_id']
+    expected = [r for r in full if r['telefono'] == phone or r['chat_id'] == chat_id]
+
+    # Teléfono con formato libre: se normaliza igual que el contactId
+    targets = {'+' + phone, chat_id}
+    assert process_data(data, targets=targets) == expected
+    with open('GMP uees.json', 'rb') as f:
+        assert list(process_stream(f, targets=targets)) == expected
+    assert process_data(data, targets=[]) == []
+    print(f"  {len(expected)} de {len(full)} leads clasificados")
+
+    print("\nSUCCESS: All tests passed!")
+
+def test_incremental_state():
+    print("Testing incremental reclassification...")
+
+    with open('GMP uees.json', 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    expected = process_data(copy.deepcopy(data))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        state = ChatStateStore(os.path.join(tmp, 'estado.sqlite'))
+        assert process_data(copy.deepcopy(data), state=state) == expected
+        assert (state.reused, state.rescored) == (0, len(expected))
+
+        # Segunda corrida: todo sale del estado guardado
+        assert process_data(copy.deepcopy(data), state=state) == expected
+        assert state.reused == len(expected)
+
+        # Un mensaje nuevo en un chat: solo ese chat se vuelve a clasificar
+        new_msg = {**data['items'][0], 'creationTime': '2030-01-01T00:00:00Z',
+                   'content': {'type': 'text', 'text': 'Quiero pagar la matrícula'}}
+        data['items'].append(new_msg)
+        rescored = state.rescored
+        assert process_data(copy.deepcopy(data), state=state) == process_data(copy.deepcopy(data))
+        assert state.rescored == rescored + 1
+        print(f"  {len(state)} chats guardados, {state.reused} reutilizados, {state.rescored} clasificados")
+        state.close()
+
+    print("\nSUCCESS: All tests passed!")
+
+def test_analysis_cache():
+    print("Testing analysis cache...")
+
+    with open('GMP uees.json', 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    expected = process_data(copy.deepcopy(data))
+
+    # La misma conversación con otro chatId sale de la caché
+    renamed = copy.deepcopy(data)
+    for item in renamed['items']:
+        item['chat']['chatId'] = 'copia-' + item['chat']['chatId']
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = AnalysisCache(os.path.join(tmp, 'cache.sqlite'))
+        assert process_data(copy.deepcopy(data), cache=cache) == expected
+        assert process_data(renamed, cache=cache) == [{**r, 'chat_id': 'copia-' + r['chat_id']} for r in expected]
+        assert (cache.reused, cache.rescored) == (len(expected), len(expected))
+        cache.close()
+
+        # Tamaño acotado: se descartan los menos usados
+        small = AnalysisCache(os.path.join(tmp, 'small.sqlite'), max_entries=10)
+        assert process_data(copy.deepcopy(data), cache=small) == expected
+        assert len(small) == 10
+        small.close()
+
+        # Mientras se analizan los chats que faltan, la caché no retiene el lock de
+        # escritura: otro proceso que la comparte puede escribir sin esperar
+        path = os.path.join(tmp, 'shared.sqlite')
+        chats = list(group_and_sort(copy.deepcopy(data)['items']).items())
+        shared = AnalysisCache(path)
+        list(shared.iter_analyses(chats[::2]))
+        before = dict(shared._conn.execute("SELECT key, last_used FROM analysis_cache"))
+
+        def analyze(batch):
+            other = sqlite3.connect(path, timeout=0)
+            other.execute("BEGIN IMMEDIATE")
+            other.rollback()
+            other.close()
+            return [(chat, analyze_conversation(*chat)) for chat in batch]
+
+        assert [a for _, a in shared.iter_analyses(chats, analyze=analyze)] == expected
+        after = dict(shared._conn.execute("SELECT key, last_used FROM analysis_cache"))
+        assert all(after[key] > last_used for key, last_used in before.items()), "Los aciertos deberían marcarse como usados"
+        shared.close()
+    print(f"  {len(expected)} leads desde la caché")
+
+    print("\nSUCCESS: All tests passed!")
+
+def test_parallel_and_background_job():
+    print("Testing parallel scoring and ScoringJob...")
+
+    export = generate_export(400, seed=11)
+    expected = process_data(json.loads(json.dumps(export)))
+
+    # Modo paralelo: mismas filas y en el mismo orden que el secuencial
+    parallel = process_data(json.loads(json.dumps(export)), workers=2, chunk_size=7)
+    assert parallel == expected, "El modo paralelo cambió las filas o su orden"
+    with open('GMP uees.json', 'rb') as f:
+        streamed = list(process_stream(f, workers=2, chunk_size=3))
+    with open('GMP uees.json', 'r', encoding='utf-8') as f:
+        assert streamed == process_data(json.load(f))
+
+    # ScoringJob en streaming sobre un BytesIO
+    job = ScoringJob(io.BytesIO(json.dumps(export).encode('utf-8'))).start()
+    assert job.wait(60) and job.error is None
+    assert job.rows == expected and job.progress == 1.0
+
+    # Chats intercalados: se vuelve a leer completo, sin filas repetidas
+    interleaved = generate_export(400, seed=11, interleave=True)
+    job = ScoringJob(io.BytesIO(json.dumps(interleaved).encode('utf-8'))).start()
+    assert job.wait(60) and job.error is None
+    by_chat = lambda rows: sorted(rows, key=lambda r: r['chat_id'])
+    assert by_chat(job.rows) == by_chat(expected) and job.progress == 1.0
+
+    # Cancelar: el hilo termina sin procesar todo
+    big = generate_export(3000, seed=12)
+    job = ScoringJob(big).start()
+    job.cancel()
+    assert job.wait(60) and job.error is None
+    assert len(job.rows) < 3000 and job.progress < 1.0
+    print(f"  {len(expected)} leads; cancelado tras {len(job.rows)} de 3000")
+
+    print("\nSUCCESS: All tests passed!")
+
+if __name__ == "__main__":
+    test_streaming_matches_full_load()
+    test_targeted_lookup()
+    test_incremental_state()
+    test_analysis_cache()
+    test_parallel_and_background_job()
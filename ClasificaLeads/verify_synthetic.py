@@ -0,0 +1,52 @@
+import io
+import json
+import os
+import tempfile
+from logic import process_data, process_stream, group_and_sort
+from synthetic import generate_export, generate_neotel, main as synthetic_main
+from benchmark import run_benchmarks, benchmark_cases
+
+def test_synthetic():
+    print("Testing synthetic workload...")
+
+    export = generate_export(300, session_gap_rate=0.5, phone_collision_rate=0.2, seed=5)
+    assert json.dumps(export) == json.dumps(generate_export(300, session_gap_rate=0.5, phone_collision_rate=0.2, seed=5))
+    assert json.dumps(export) != json.dumps(generate_export(300, seed=6))
+
+    chats = group_and_sort(json.loads(json.dumps(export))['items'])
+    phones = [messages[0]['chat']['contactId'] for messages in chats.values()]
+    assert len(chats) == 300 and len(set(phones)) < 300, "Debería haber teléfonos repetidos"
+
+    neotel_df = generate_neotel(export, seed=5)
+    results = process_data(json.loads(json.dumps(export)), neotel_df)
+    classes = {r['clasificacion'] for r in results}
+    assert classes == {'No Contactado', 'MQL', 'SQL'}, classes
+    assert any(r['sesiones_detectadas'] > 1 for r in results)
+    assert any(r.get('programa_interes') for r in results)
+
+    # Mensajes intercalados: mismos leads (las filas salen en orden de primera aparición)
+    interleaved = generate_export(300, session_gap_rate=0.5, phone_collision_rate=0.2, interleave=True, seed=5)
+    by_chat = lambda rows: sorted(rows, key=lambda r: r['chat_id'])
+    assert by_chat(process_data(interleaved, neotel_df)) == by_chat(results)
+    stream = io.BytesIO(json.dumps(export).encode('utf-8'))
+    assert list(process_stream(stream, neotel_df)) == results
+
+    # CLI: teléfonos locales y tipos de media configurables
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'export.json')
+        assert synthetic_main(['--chats', '50', '--local-phone-rate', '1', '--media-rate', '1',
+                               '--media-types', 'audio,video', '--phone-collision-rate', '0', '-o', path]) == 0
+        with open(path, 'r', encoding='utf-8') as f:
+            cli_export = json.load(f)
+    assert all(phone.startswith('09') and len(phone) == 10 for phone in cli_export['contacts'])
+    user_types = {item['content']['type'] for item in cli_export['items'] if item['from'] == 'user'}
+    assert user_types == {'audio', 'video'}, user_types
+
+    timings = run_benchmarks(100)
+    assert [t['name'] for t in timings] == [name for name, _, _ in benchmark_cases(export, neotel_df)]
+    print(f"  {len(results)} leads, {len(timings)} casos de benchmark")
+
+    print("\nSUCCESS: All tests passed!")
+
+if __name__ == "__main__":
+    test_synthetic()